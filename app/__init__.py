@@ -1,17 +1,26 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_caching import Cache
+from sqlalchemy import event
+import logging
 import os
 
 db = SQLAlchemy()
 cache = Cache()
 
-def create_app():
+def create_app(background_services=True):
+    """
+    Build the Flask app. background_services starts the thumbnail service,
+    the thumbnail GC and the optional dataset watcher; scripts and the
+    reloader's parent process pass False so only the serving process runs them.
+    """
     app = Flask(__name__)
 
     # Configuration
     basedir = os.path.abspath(os.path.dirname(__file__))
-    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(basedir, "..", "gallery.db")}'
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv(
+        'SQLALCHEMY_DATABASE_URI', f'sqlite:///{os.path.join(basedir, "..", "gallery.db")}'
+    )
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['JSON_SORT_KEYS'] = False
     app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024  # 500MB max file size
@@ -21,15 +30,26 @@ def create_app():
     app.config['CACHE_REDIS_URL'] = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
     app.config['CACHE_DEFAULT_TIMEOUT'] = 3600  # 1 hour
 
+    # Background services log through app.logger and its children (app.thumbnail_store)
+    app.logger.setLevel(logging.INFO)
+
     # Initialize extensions
     db.init_app(app)
     cache.init_app(app)
 
     # Import models first
-    from .models import Favorite, FileMetadata, ImageMetadata
+    from .models import Favorite, FileMetadata, FolderLayout, FolderSummary, ImageMetadata
 
     # Create tables
     with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            # WAL lets page requests read the index while the scanner/watcher writes
+            @event.listens_for(db.engine, 'connect')
+            def _enable_sqlite_wal(dbapi_connection, connection_record):
+                cursor = dbapi_connection.cursor()
+                cursor.execute('PRAGMA journal_mode=WAL')
+                cursor.close()
+
         db.create_all()
 
     # Register blueprints
@@ -37,4 +57,33 @@ def create_app():
     app.register_blueprint(main_bp)
     app.register_blueprint(api_bp)
 
+    # Responsive thumbnail URLs for the grid templates
+    from .utils import thumbnail_srcset, THUMBNAIL_SIZES
+    app.add_template_global(thumbnail_srcset)
+    app.add_template_global(THUMBNAIL_SIZES, 'thumbnail_sizes')
+    from .sprites import SPRITE_PLACEHOLDER, sprite_style
+    app.add_template_global(sprite_style)
+    app.add_template_global(SPRITE_PLACEHOLDER, 'sprite_placeholder')
+
+    if background_services:
+        from .routes import DATASET_PATH
+        start_background_services(app, DATASET_PATH)
+
     return app
+
+def start_background_services(app, dataset_path):
+    """Start the serving process's background threads"""
+    # Thumbnail worker processes (started on first use) for on-demand requests and backfill
+    from .thumbnails import start_thumbnail_service
+    start_thumbnail_service(app, dataset_path)
+
+    # Periodic removal of thumbnails whose source was deleted or changed
+    gc_interval = float(os.getenv('THUMBNAIL_GC_INTERVAL', 6 * 3600))
+    if gc_interval > 0:
+        from .thumbnail_store import start_garbage_collector
+        start_garbage_collector(dataset_path, gc_interval, legacy=os.getenv('THUMBNAIL_GC_LEGACY') == '1')
+
+    # Optional filesystem watcher that keeps the index up to date
+    if os.getenv('WATCH_DATASET') == '1':
+        from .watcher import start_watcher
+        start_watcher(app, dataset_path)
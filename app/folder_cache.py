@@ -0,0 +1,116 @@
+import os
+import threading
+from collections import OrderedDict
+
+class FolderTreeCache:
+    """
+    Process-wide LRU cache of folder listings, validated by directory mtimes.
+
+    Each entry remembers the mtime of the listed directory and of every
+    visible subfolder at load time. A lookup re-stats only those directories,
+    so a cache hit costs one stat per visible directory instead of a full
+    re-listing. Changes deeper down (e.g. a grandchild used as cover) are
+    picked up through explicit invalidation by the scanner/watcher.
+    """
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(dataset_path, parent_path):
+        return os.path.abspath(os.path.join(dataset_path, parent_path) if parent_path else dataset_path)
+
+    @staticmethod
+    def _stamp(dir_path):
+        """Snapshot mtimes of a directory and its visible subfolders"""
+        stamps = {dir_path: os.stat(dir_path).st_mtime_ns}
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                try:
+                    if not entry.name.startswith('.') and entry.is_dir():
+                        stamps[entry.path] = entry.stat().st_mtime_ns
+                except OSError:
+                    continue
+        return stamps
+
+    @staticmethod
+    def _is_fresh(stamps):
+        try:
+            return all(os.stat(path).st_mtime_ns == mtime for path, mtime in stamps.items())
+        except OSError:
+            return False
+
+    def get(self, dataset_path, parent_path, loader):
+        """Return the cached listing for parent_path, calling loader() on a miss or stale entry"""
+        key = self._key(dataset_path, parent_path)
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+        if entry is not None and self._is_fresh(entry[0]):
+            with self._lock:
+                self.hits += 1
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+            return list(entry[1])
+
+        with self._lock:
+            self.misses += 1
+
+        # Stamp before loading so a change during the load invalidates the entry
+        try:
+            stamps = self._stamp(key)
+        except OSError:
+            stamps = None
+
+        folders = loader(dataset_path, parent_path)
+
+        if stamps is not None:
+            with self._lock:
+                self._entries[key] = (stamps, folders)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+
+        return list(folders)
+
+    def invalidate(self, dataset_path, folder_path='', subtree=False):
+        """
+        Drop the entries listing folder_path and all of its ancestors (recursive
+        totals include it). With subtree, entries below folder_path go as well.
+        """
+        top = self._key(dataset_path, folder_path)
+        keys = {self._key(dataset_path, '')}
+        while folder_path:
+            keys.add(self._key(dataset_path, folder_path))
+            folder_path = os.path.dirname(folder_path)
+        with self._lock:
+            if subtree:
+                keys.update(key for key in self._entries if key.startswith(top + os.sep))
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+# Shared by all routes in this process
+folder_tree_cache = FolderTreeCache(int(os.getenv('FOLDER_CACHE_SIZE', 512)))
@@ -0,0 +1,293 @@
+"""
+Array-based justified layout engines.
+
+These work on a NumPy array of aspect ratios instead of lists of image
+dicts, so large folders can be laid out without copying every dict.
+Degenerate entries (images with zero height) are marked with NaN.
+"""
+
+import numpy as np
+
+# Container widths are snapped to this grid so nearby window sizes share cached layouts
+LAYOUT_WIDTH_STEP = 40
+MIN_CONTAINER_WIDTH = 320
+MAX_CONTAINER_WIDTH = 3840
+
+# Container widths laid out ahead of time; the client picks the widest that fits
+LAYOUT_BREAKPOINTS = (360, 768, 1200, 1920)
+
+def width_bucket(width):
+    """Clamp a container width and round it down to the layout width grid"""
+    width = min(max(int(width), MIN_CONTAINER_WIDTH), MAX_CONTAINER_WIDTH)
+    return width - width % LAYOUT_WIDTH_STEP
+
+def aspect_ratio_array(images):
+    """Aspect ratios of image dicts as a float array, NaN where the height is zero"""
+    widths = np.fromiter((img['width'] for img in images), dtype=np.float64, count=len(images))
+    heights = np.fromiter((img['height'] for img in images), dtype=np.float64, count=len(images))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(heights > 0, widths / heights, np.nan)
+
+def greedy_row_starts(aspect_ratios, container_width=1200, row_height=200, gap=8):
+    """
+    Row breaks of the greedy justified layout.
+
+    A row is closed before the image whose target width (at row_height)
+    would overflow the container.
+
+    Returns:
+        Int array with the index of the first image of every row
+    """
+    n = len(aspect_ratios)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    offsets = _greedy_offsets(aspect_ratios, row_height, gap)
+    return _follow_rows(_greedy_next_starts(offsets, container_width, gap))
+
+def _greedy_offsets(aspect_ratios, row_height, gap):
+    """offsets[k] = sum of (target width + gap) of the first k images"""
+    ratios = np.where(np.isnan(aspect_ratios), 1.0, aspect_ratios)
+    target_widths = np.trunc(row_height * ratios).astype(np.int64)
+    offsets = np.zeros(len(aspect_ratios) + 1, dtype=np.int64)
+    np.cumsum(target_widths + gap, out=offsets[1:])
+    return offsets
+
+def _greedy_next_starts(offsets, container_width, gap):
+    """
+    Start of the row after a row starting at each image. A row starting at s
+    overflows at the first j > s with offsets[j + 1] > offsets[s] + container_width + gap.
+    container_width may be an array of shape (k, 1) to get k rows of results at once.
+    """
+    n = len(offsets) - 1
+    next_start = np.searchsorted(offsets, offsets[:-1] + container_width + gap, side='right') - 1
+    return np.maximum(next_start, np.arange(1, n + 1))
+
+def _follow_rows(next_start):
+    """Chain next-row pointers from image 0 into an array of row starts"""
+    next_start = next_start.tolist()
+    n = len(next_start)
+    starts = []
+    start = 0
+    while start < n:
+        starts.append(start)
+        start = next_start[start]
+    return np.array(starts, dtype=np.int64)
+
+def justify_rows(aspect_ratios, row_starts, container_width=1200, row_height=200, gap=8, last_row_final=True):
+    """
+    Scale every row to fill the container width.
+
+    Reproduces utils._justify_row: widths are truncated to ints, the last
+    image of a multi-image row absorbs the rounding remainder, and the last
+    row is never taller than row_height (a lone last image is capped at 400px).
+    With last_row_final=False the last row is justified like any other row,
+    for pages cut out of a longer listing.
+
+    Returns:
+        Tuple of (widths, heights) int arrays
+    """
+    n = len(aspect_ratios)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    degenerate = np.isnan(aspect_ratios)
+    ratios = np.where(degenerate, 1.0, aspect_ratios)
+    row_ends = np.append(row_starts[1:], n)
+    row_lengths = row_ends - row_starts
+
+    # Row totals use Python's sum so the float rounding matches the list engine
+    summable = np.where(degenerate, 0.0, aspect_ratios).tolist()
+    totals = np.array([sum(summable[s:e]) for s, e in zip(row_starts.tolist(), row_ends.tolist())])
+
+    available = container_width - (row_lengths - 1) * gap
+    with np.errstate(divide='ignore', invalid='ignore'):
+        row_heights = np.where(totals > 0, available / totals, float(row_height))
+    if last_row_final:
+        row_heights[-1] = min(row_heights[-1], row_height)
+
+    row_ids = np.repeat(np.arange(len(row_starts)), row_lengths)
+    item_heights = row_heights[row_ids]
+    widths = np.trunc(item_heights * ratios).astype(np.int64)
+    heights = np.trunc(item_heights).astype(np.int64)
+
+    # Last image of each multi-image row takes up the remaining width
+    multi = row_lengths > 1
+    last_items = row_ends[multi] - 1
+    used = np.add.reduceat(widths, row_starts)[multi] - widths[last_items] + (row_lengths[multi] - 1) * gap
+    widths[last_items] = container_width - used
+
+    # A lone image on the last row keeps its natural size, capped at 400px wide
+    if last_row_final and row_lengths[-1] == 1:
+        ratio = ratios[-1]
+        widths[-1] = min(400, int(row_height * ratio))
+        heights[-1] = int(widths[-1] / ratio)
+
+    return widths, heights
+
+def optimal_row_starts(aspect_ratios, container_width=1200, row_height=200, gap=8,
+                       window=None, min_scale=0.5, max_scale=2.0):
+    """
+    Row breaks minimising the total squared deviation from row_height
+    (Knuth-Plass style dynamic programming for images).
+
+    Only rows whose justified height lies within [min_scale, max_scale] *
+    row_height are considered (a single image is always allowed), and at most
+    `window` images per row, so the cost is O(n * k). The last row may be
+    shorter than the container; it is only penalised when it would be squashed.
+
+    Args:
+        window: Max images per row; defaults to twice the longest greedy row
+
+    Returns:
+        Int array with the index of the first image of every row
+    """
+    n = len(aspect_ratios)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    if window is None:
+        greedy = greedy_row_starts(aspect_ratios, container_width, row_height, gap)
+        window = max(8, 2 * int(np.diff(np.append(greedy, n)).max()))
+
+    summable = np.where(np.isnan(aspect_ratios), 0.0, aspect_ratios)
+    cumulative = np.zeros(n + 1)
+    np.cumsum(summable, out=cumulative[1:])
+    positions = np.arange(n + 1)
+
+    # Row i..j-1 is at least h tall when h * (cum[j] - cum[i]) + (j - i - 1) * gap <= width,
+    # so candidate ends for every start come from two searchsorted calls
+    def last_end_at_height(height):
+        prefix = height * cumulative + positions * gap
+        return np.searchsorted(prefix, prefix[:-1] + container_width + gap, side='right') - 1
+
+    starts = np.arange(n)
+    first_end = np.maximum(last_end_at_height(row_height * max_scale) + 1, starts + 1)
+    last_end = np.minimum(last_end_at_height(row_height * min_scale), starts + window)
+    first_end = np.minimum(first_end, n).tolist()
+    last_end = np.clip(np.maximum(last_end, first_end), None, n).tolist()
+
+    cumulative = cumulative.tolist()
+    cost = [0.0] + [float('inf')] * n
+    previous = [0] * (n + 1)
+
+    for i in range(n):
+        base = cost[i]
+        if base == float('inf'):
+            continue
+        row_start_total = cumulative[i]
+        for j in range(first_end[i], last_end[i] + 1):
+            total = cumulative[j] - row_start_total
+            height = (container_width - (j - i - 1) * gap) / total if total > 0 else row_height
+            if height <= 0:
+                break
+            if j == n and height > row_height:
+                # Last row is left short rather than stretched
+                height = row_height
+            candidate = base + (height - row_height) ** 2
+            if candidate < cost[j]:
+                cost[j] = candidate
+                previous[j] = i
+
+    row_starts = []
+    end = n
+    while end > 0:
+        end = previous[end]
+        row_starts.append(end)
+    return np.array(row_starts[::-1], dtype=np.int64)
+
+# Row breaking strategies selectable per request
+LAYOUT_MODES = {
+    'greedy': greedy_row_starts,
+    'optimal': optimal_row_starts,
+}
+
+def justified_layout(aspect_ratios, container_width=1200, row_height=200, gap=8, mode='greedy'):
+    """
+    Justified layout on an aspect-ratio array.
+
+    Args:
+        mode: 'greedy' (same rows as the list engine) or 'optimal' (minimum raggedness)
+
+    Returns:
+        Tuple of (row_starts, widths, heights) int arrays
+    """
+    aspect_ratios = np.asarray(aspect_ratios, dtype=np.float64)
+    row_starts = LAYOUT_MODES[mode](aspect_ratios, container_width, row_height, gap)
+    widths, heights = justify_rows(aspect_ratios, row_starts, container_width, row_height, gap)
+    return row_starts, widths, heights
+
+def paged_layout(aspect_ratios, per_page, final, container_width=1200, row_height=200, gap=8, mode='greedy'):
+    """
+    Lay out the next page of complete rows from a chunk of upcoming images.
+
+    Pages always start at a row start, so greedy rows come out exactly as in
+    a whole-listing layout; the optimal mode looks ahead only as far as the chunk.
+
+    Args:
+        aspect_ratios: Aspect ratios from the current row start on, ideally
+                       well beyond per_page so the last row can be closed
+        per_page: Minimum number of images wanted (fewer at the end of the listing)
+        final: True when the chunk reaches the end of the listing
+
+    Returns:
+        Tuple of (count, row_starts, widths, heights) for the first `count`
+        images, which form whole rows; count is 0 when the chunk holds no complete row
+    """
+    aspect_ratios = np.asarray(aspect_ratios, dtype=np.float64)
+    n = len(aspect_ratios)
+    row_starts = LAYOUT_MODES[mode](aspect_ratios, container_width, row_height, gap)
+    row_ends = np.append(row_starts[1:], n)
+    if not final:
+        # The last row might continue past the chunk
+        row_starts, row_ends = row_starts[:-1], row_ends[:-1]
+    if len(row_starts) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return 0, empty, empty, empty
+
+    rows = min(int(np.searchsorted(row_ends, per_page)) + 1, len(row_starts))
+    count = int(row_ends[rows - 1])
+    widths, heights = justify_rows(aspect_ratios[:count], row_starts[:rows], container_width, row_height, gap,
+                                   last_row_final=final and count == n)
+    return count, row_starts[:rows], widths, heights
+
+def breakpoint_layouts(aspect_ratios, breakpoints=LAYOUT_BREAKPOINTS, row_height=200, gap=8, mode='greedy'):
+    """
+    Whole-listing layouts for several container widths in one pass.
+
+    The greedy mode shares the prefix sums and resolves the row breaks of
+    every breakpoint with a single searchsorted call; other modes run once
+    per breakpoint.
+
+    Returns:
+        Tuple of (widths, heights) int32 arrays shaped (len(breakpoints), n)
+    """
+    aspect_ratios = np.asarray(aspect_ratios, dtype=np.float64)
+    n = len(aspect_ratios)
+    widths = np.zeros((len(breakpoints), n), dtype=np.int32)
+    heights = np.zeros((len(breakpoints), n), dtype=np.int32)
+    if n == 0:
+        return widths, heights
+
+    if mode == 'greedy':
+        offsets = _greedy_offsets(aspect_ratios, row_height, gap)
+        next_starts = _greedy_next_starts(offsets, np.asarray(breakpoints)[:, None], gap)
+        all_row_starts = [_follow_rows(next_start) for next_start in next_starts]
+    else:
+        all_row_starts = [LAYOUT_MODES[mode](aspect_ratios, width, row_height, gap) for width in breakpoints]
+
+    for i, (width, row_starts) in enumerate(zip(breakpoints, all_row_starts)):
+        widths[i], heights[i] = justify_rows(aspect_ratios, row_starts, width, row_height, gap)
+    return widths, heights
+
+def pack_layouts(widths, heights):
+    """Serialize breakpoint_layouts output for storage"""
+    return np.stack((widths, heights)).astype(np.int32).tobytes()
+
+def unpack_layouts(data, breakpoint_count, item_count):
+    """Inverse of pack_layouts"""
+    layouts = np.frombuffer(data, dtype=np.int32).reshape(2, breakpoint_count, item_count)
+    return layouts[0], layouts[1]
+
+def row_numbers(row_starts, start, end):
+    """Row of every image in [start, end), counted from the row holding start"""
+    rows = np.searchsorted(row_starts, np.arange(start, end), side='right') - 1
+    return rows - rows[0] if len(rows) else rows
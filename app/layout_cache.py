@@ -0,0 +1,71 @@
+import os
+import threading
+from collections import OrderedDict
+
+class LayoutCache:
+    """
+    Process-wide LRU cache of computed folder layouts with a byte budget.
+
+    Values are tuples of NumPy arrays (one entry per image in listing order),
+    so their size is known exactly. Keys carry everything the layout depends
+    on - folder version, sort order, mode, width bucket, row height and gap -
+    so entries never need explicit invalidation; outdated versions simply
+    age out of the LRU.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the cached arrays for key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, arrays):
+        """Store a tuple of arrays, evicting least recently used layouts to stay within budget"""
+        size = sum(array.nbytes for array in arrays)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous[0]
+            self._entries[key] = (size, arrays)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (evicted_size, _) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
+# Shared by all routes in this process
+layout_cache = LayoutCache(int(os.getenv('LAYOUT_CACHE_BYTES', 64 * 1024 * 1024)))
@@ -58,6 +58,54 @@ class FileMetadata(db.Model):
             'modified_at': self.modified_at.isoformat()
         }
 
+class FolderSummary(db.Model):
+    """Precomputed per-folder counts and cover, maintained by the background scanner"""
+    id = db.Column(db.Integer, primary_key=True)
+    folder_path = db.Column(db.String(500), nullable=False, unique=True)  # '' for the dataset root
+    parent_path = db.Column(db.String(500), nullable=True)  # None for the dataset root
+    name = db.Column(db.String(500), nullable=False)
+    media_count = db.Column(db.Integer, nullable=False, default=0)  # direct children only
+    subfolder_count = db.Column(db.Integer, nullable=False, default=0)
+    recursive_media_count = db.Column(db.Integer, nullable=False, default=0)
+    total_bytes = db.Column(db.BigInteger, nullable=False, default=0)  # recursive
+    cover_file = db.Column(db.String(1000), nullable=True)  # path relative to dataset root
+    version = db.Column(db.Integer, nullable=False, default=1)  # bumped on every change
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('idx_summary_parent_name', 'parent_path', 'name'),
+    )
+
+    def to_dict(self):
+        """Same shape as utils.summarize_folder, plus the recursive totals"""
+        return {
+            'name': self.name,
+            'path': self.folder_path,
+            'count': self.media_count,
+            'has_subfolders': self.subfolder_count > 0,
+            'subfolder_count': self.subfolder_count,
+            'thumbnail': self.cover_file,
+            'total_count': self.recursive_media_count,
+            'total_bytes': self.total_bytes,
+            'version': self.version
+        }
+
+class FolderLayout(db.Model):
+    """Justified layouts of an indexed folder listing at every configured breakpoint"""
+    id = db.Column(db.Integer, primary_key=True)
+    folder_path = db.Column(db.String(500), nullable=False)
+    sort = db.Column(db.String(20), nullable=False)
+    mode = db.Column(db.String(20), nullable=False)
+    version = db.Column(db.Integer, nullable=False)  # FolderSummary.version it was computed from
+    breakpoints = db.Column(db.String(100), nullable=False)  # comma separated container widths
+    row_height = db.Column(db.Integer, nullable=False)
+    gap = db.Column(db.Integer, nullable=False)
+    item_count = db.Column(db.Integer, nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False)  # int32 widths then heights, one block per breakpoint
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('folder_path', 'sort', 'mode', name='unique_folder_layout'),)
+
 # Keep ImageMetadata for backward compatibility but mark as deprecated
 class ImageMetadata(db.Model):
     """Legacy model - use FileMetadata instead"""
@@ -0,0 +1,497 @@
+"""
+Header-only media probes.
+
+Reads just enough of a file to find its dimensions, without going through
+PIL's plugin machinery or decoding any pixel data. Every probe returns None
+when the header cannot be parsed so callers can fall back to PIL.
+"""
+
+import functools
+import os
+import struct
+
+# EXIF orientations (and HEIC irot angles) that display the image rotated by 90/270 degrees
+_TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+# JPEG SOFn markers that carry frame dimensions (C4/C8/CC are DHT/JPG/DAC)
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+# Largest metadata block read for EXIF/HEIC parsing
+_MAX_METADATA_BYTES = 256 * 1024
+
+def probe_image_size(path):
+    """
+    Get display width and height of an image from its header.
+
+    Applies EXIF orientation (JPEG) and irot (HEIC) so portrait photos
+    report portrait dimensions.
+
+    Returns:
+        Tuple of (width, height), or None if the format is not recognised
+    """
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(32)
+            if head.startswith(b'\xff\xd8'):
+                return _probe_jpeg(f)
+            if head.startswith(b'\x89PNG\r\n\x1a\n') and head[12:16] == b'IHDR':
+                return struct.unpack('>II', head[16:24])
+            if head[:6] in (b'GIF87a', b'GIF89a'):
+                return struct.unpack('<HH', head[6:10])
+            if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+                return _probe_webp(head)
+            if head[:2] == b'BM':
+                return _probe_bmp(head)
+            if head[4:8] == b'ftyp':
+                return _probe_heic(f)
+    except (OSError, struct.error, ValueError):
+        pass
+    return None
+
+def _probe_jpeg(f):
+    """Walk JPEG segments up to the first SOF marker, reading EXIF orientation on the way"""
+    orientation = 1
+    f.seek(2)
+    while True:
+        byte = f.read(1)
+        if not byte:
+            return None
+        if byte != b'\xff':
+            continue
+        marker = f.read(1)
+        # Skip fill bytes
+        while marker == b'\xff':
+            marker = f.read(1)
+        if not marker:
+            return None
+        marker = marker[0]
+        if marker == 0xD8 or 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            # Standalone markers have no length
+            continue
+        if marker == 0xD9 or marker == 0xDA:
+            # End of image / start of scan before any frame header
+            return None
+
+        length = struct.unpack('>H', f.read(2))[0]
+        if length < 2:
+            return None
+
+        if marker in _JPEG_SOF_MARKERS:
+            _, height, width = struct.unpack('>BHH', f.read(5))
+            if width == 0 or height == 0:
+                return None
+            if orientation in _TRANSPOSED_ORIENTATIONS:
+                return height, width
+            return width, height
+
+        if marker == 0xE1 and orientation == 1:
+            segment = f.read(min(length - 2, _MAX_METADATA_BYTES))
+            if segment.startswith(b'Exif\x00\x00'):
+                orientation = exif_orientation(segment[6:])
+            f.seek(length - 2 - len(segment), 1)
+        else:
+            f.seek(length - 2, 1)
+
+def exif_orientation(tiff):
+    """Read the Orientation tag (0x0112) from IFD0 of a TIFF/EXIF block, defaulting to 1"""
+    try:
+        if tiff[:2] == b'II':
+            endian = '<'
+        elif tiff[:2] == b'MM':
+            endian = '>'
+        else:
+            return 1
+        ifd_offset = struct.unpack(endian + 'I', tiff[4:8])[0]
+        entries = struct.unpack(endian + 'H', tiff[ifd_offset:ifd_offset + 2])[0]
+        for i in range(entries):
+            entry = ifd_offset + 2 + i * 12
+            tag, field_type, _ = struct.unpack(endian + 'HHI', tiff[entry:entry + 8])
+            if tag == 0x0112 and field_type == 3:  # SHORT
+                value = struct.unpack(endian + 'H', tiff[entry + 8:entry + 10])[0]
+                return value if 1 <= value <= 8 else 1
+    except struct.error:
+        pass
+    return 1
+
+def _probe_webp(head):
+    chunk = head[12:16]
+    if chunk == b'VP8 ':
+        # Lossy: frame tag (3 bytes) + start code 9d 01 2a, then 14-bit dimensions
+        if head[23:26] != b'\x9d\x01\x2a':
+            return None
+        width, height = struct.unpack('<HH', head[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L':
+        # Lossless: signature 0x2f, then 14-bit width-1 and height-1
+        if head[20] != 0x2F:
+            return None
+        bits = int.from_bytes(head[21:25], 'little')
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b'VP8X':
+        # Extended: 24-bit canvas width-1 and height-1
+        width = int.from_bytes(head[24:27], 'little') + 1
+        height = int.from_bytes(head[27:30], 'little') + 1
+        return width, height
+    return None
+
+def _probe_bmp(head):
+    header_size = struct.unpack('<I', head[14:18])[0]
+    if header_size == 12:
+        # OS/2 BITMAPCOREHEADER
+        return struct.unpack('<HH', head[18:22])
+    width, height = struct.unpack('<ii', head[18:26])
+    # Negative height means a top-down bitmap
+    return abs(width), abs(height)
+
+def _iter_boxes(data, start=0, end=None):
+    """Yield (type, payload start, payload end) for ISO BMFF boxes in data[start:end]"""
+    end = len(data) if end is None else end
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack('>I4s', data[offset:offset + 8])
+        header = 8
+        if size == 1:
+            size = struct.unpack('>Q', data[offset + 8:offset + 16])[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header:
+            return
+        yield box_type, offset + header, min(offset + size, end)
+        offset += size
+
+def read_bmff_box(f, wanted, limit=_MAX_METADATA_BYTES):
+    """Seek through top-level ISO BMFF boxes and return the payload of the first `wanted` box"""
+    f.seek(0)
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return None
+        size, box_type = struct.unpack('>I4s', header)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack('>Q', f.read(8))[0]
+            header_size = 16
+        if box_type == wanted:
+            payload_size = size - header_size if size else limit
+            if payload_size > limit:
+                return None
+            return f.read(payload_size)
+        if size == 0 or size < header_size:
+            return None
+        f.seek(size - header_size, 1)
+
+def _probe_heic(f):
+    """Read the primary item's ispe (and irot) properties from the HEIF meta box"""
+    meta = read_bmff_box(f, b'meta')
+    if not meta:
+        return None
+
+    # meta is a FullBox: 4 bytes of version/flags before its children
+    extents = []
+    rotation = 0
+    for box_type, start, end in _iter_boxes(meta, 4):
+        if box_type != b'iprp':
+            continue
+        for prop_type, prop_start, prop_end in _iter_boxes(meta, start, end):
+            if prop_type != b'ipco':
+                continue
+            for item_type, item_start, item_end in _iter_boxes(meta, prop_start, prop_end):
+                if item_type == b'ispe':
+                    width, height = struct.unpack('>II', meta[item_start + 4:item_start + 12])
+                    extents.append((width * height, width, height))
+                elif item_type == b'irot' and not rotation:
+                    rotation = meta[item_start] & 0x03
+
+    if not extents:
+        return None
+    # The primary image is the largest extent (others are thumbnails/tiles grid cells)
+    _, width, height = max(extents)
+    if rotation in (1, 3):
+        return height, width
+    return width, height
+
+# ==================== VIDEO ====================
+
+# EBML element IDs (Matroska/WebM)
+_EBML_SEGMENT = 0x18538067
+_EBML_INFO = 0x1549A966
+_EBML_TIMECODE_SCALE = 0x2AD7B1
+_EBML_DURATION = 0x4489
+_EBML_TRACKS = 0x1654AE6B
+_EBML_TRACK_ENTRY = 0xAE
+_EBML_TRACK_TYPE = 0x83
+_EBML_DEFAULT_DURATION = 0x23E383
+_EBML_VIDEO = 0xE0
+_EBML_PIXEL_WIDTH = 0xB0
+_EBML_PIXEL_HEIGHT = 0xBA
+_EBML_CLUSTER = 0x1F43B675
+
+def probe_video(path):
+    """
+    Get video metadata from the container header, cached per (path, mtime, size).
+
+    Understands MP4/MOV (moov/trak boxes), WebM/MKV (EBML Info/Tracks) and AVI
+    (avih) without starting a decoder. Width and height are display
+    dimensions, i.e. already swapped for 90/270 degree rotation.
+
+    Returns:
+        Dict with width, height, duration, fps and rotation, or None if the
+        container could not be parsed
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return _probe_video_cached(path, stat.st_mtime_ns, stat.st_size)
+
+@functools.lru_cache(maxsize=4096)
+def _probe_video_cached(path, mtime_ns, size):
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(16)
+            if head[4:8] in (b'ftyp', b'moov', b'mdat', b'wide', b'free', b'skip'):
+                info = _probe_mp4(f, size)
+            elif head[:4] == b'\x1a\x45\xdf\xa3':
+                info = _probe_ebml(f, size)
+            elif head[:4] == b'RIFF' and head[8:12] == b'AVI ':
+                info = _probe_avi(f)
+            else:
+                info = None
+    except (OSError, struct.error, ValueError, IndexError):
+        info = None
+
+    if not info or not info.get('width') or not info.get('height'):
+        return None
+    if info['rotation'] in (90, 270):
+        info['width'], info['height'] = info['height'], info['width']
+    return info
+
+def _iter_file_boxes(f, start, end):
+    """Yield (type, payload start, payload end) for ISO BMFF boxes in a file range, seeking over payloads"""
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        size, box_type = struct.unpack('>I4s', f.read(8))
+        header = 8
+        if size == 1:
+            size = struct.unpack('>Q', f.read(8))[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header:
+            return
+        yield box_type, offset + header, min(offset + size, end)
+        offset += size
+
+def _read_range(f, start, end, limit=_MAX_METADATA_BYTES):
+    f.seek(start)
+    return f.read(min(end - start, limit))
+
+def _find_box(f, start, end, box_type):
+    for found, payload_start, payload_end in _iter_file_boxes(f, start, end):
+        if found == box_type:
+            return payload_start, payload_end
+    return None
+
+def _matrix_rotation(matrix):
+    """Rotation in degrees from a tkhd transformation matrix (16.16 fixed point a, b, c, d)"""
+    a, b, _, c, d = matrix[0], matrix[1], matrix[2], matrix[3], matrix[4]
+    if (a, b, c, d) == (0, 0x10000, -0x10000, 0):
+        return 90
+    if (a, b, c, d) == (-0x10000, 0, 0, -0x10000):
+        return 180
+    if (a, b, c, d) == (0, -0x10000, 0x10000, 0):
+        return 270
+    return 0
+
+def _probe_mp4(f, file_size):
+    moov = _find_box(f, 0, file_size, b'moov')
+    if not moov:
+        return None
+
+    movie_duration = None
+    for box_type, start, end in _iter_file_boxes(f, *moov):
+        if box_type == b'mvhd':
+            data = _read_range(f, start, end, 32)
+            if data[0] == 1:
+                timescale, duration = struct.unpack('>IQ', data[20:32])
+            else:
+                timescale, duration = struct.unpack('>II', data[12:20])
+            movie_duration = duration / timescale if timescale else None
+            continue
+        if box_type != b'trak':
+            continue
+
+        track = _probe_mp4_track(f, start, end)
+        if track:
+            track['duration'] = track['duration'] or movie_duration
+            return track
+    return None
+
+def _probe_mp4_track(f, start, end):
+    """Parse one trak box; returns None unless it is a video track"""
+    width = height = rotation = 0
+    timescale = media_duration = None
+    handler = None
+    stbl = None
+
+    for box_type, box_start, box_end in _iter_file_boxes(f, start, end):
+        if box_type == b'tkhd':
+            data = _read_range(f, box_start, box_end, 96)
+            # Matrix and size sit after version-dependent time fields
+            base = 52 if data[0] == 1 else 40
+            matrix = struct.unpack('>9i', data[base:base + 36])
+            rotation = _matrix_rotation(matrix)
+            width, height = (v >> 16 for v in struct.unpack('>II', data[base + 36:base + 44]))
+        elif box_type == b'mdia':
+            for media_type, media_start, media_end in _iter_file_boxes(f, box_start, box_end):
+                if media_type == b'mdhd':
+                    data = _read_range(f, media_start, media_end, 32)
+                    if data[0] == 1:
+                        timescale, media_duration = struct.unpack('>IQ', data[20:32])
+                    else:
+                        timescale, media_duration = struct.unpack('>II', data[12:20])
+                elif media_type == b'hdlr':
+                    handler = _read_range(f, media_start, media_end, 12)[8:12]
+                elif media_type == b'minf':
+                    stbl = _find_box(f, media_start, media_end, b'stbl')
+
+    if handler != b'vide':
+        return None
+
+    fps = None
+    if stbl:
+        for table_type, table_start, table_end in _iter_file_boxes(f, *stbl):
+            if table_type == b'stsd' and not (width and height):
+                # First visual sample entry: coded width/height at offset 32 of the entry
+                data = _read_range(f, table_start, table_end, 48)
+                width, height = struct.unpack('>HH', data[8 + 32:8 + 36])
+            elif table_type == b'stts' and timescale:
+                data = _read_range(f, table_start, table_end)
+                entries = struct.unpack('>I', data[4:8])[0]
+                entries = min(entries, (len(data) - 8) // 8)
+                samples = total_delta = 0
+                for i in range(entries):
+                    count, delta = struct.unpack('>II', data[8 + i * 8:16 + i * 8])
+                    samples += count
+                    total_delta += count * delta
+                if total_delta:
+                    fps = samples * timescale / total_delta
+
+    duration = media_duration / timescale if timescale and media_duration else None
+    return {'width': width, 'height': height, 'duration': duration, 'fps': fps, 'rotation': rotation}
+
+def _read_ebml_vint(f, keep_marker=False):
+    """Read an EBML variable-length integer; returns (value, length) or (None, 0) at EOF"""
+    first = f.read(1)
+    if not first:
+        return None, 0
+    first = first[0]
+    length = 1
+    mask = 0x80
+    while length <= 8 and not first & mask:
+        mask >>= 1
+        length += 1
+    if length > 8:
+        raise ValueError("Invalid EBML vint")
+    value = first if keep_marker else first & (mask - 1)
+    rest = f.read(length - 1)
+    for byte in rest:
+        value = (value << 8) | byte
+    # All ones means unknown size
+    if not keep_marker and value == (1 << (7 * length)) - 1:
+        value = -1
+    return value, length
+
+def _iter_ebml(f, start, end):
+    """Yield (element id, data start, data end) for EBML elements in a file range"""
+    offset = start
+    while offset < end:
+        f.seek(offset)
+        element_id, id_length = _read_ebml_vint(f, keep_marker=True)
+        if element_id is None:
+            return
+        size, size_length = _read_ebml_vint(f)
+        data_start = offset + id_length + size_length
+        data_end = end if size < 0 else min(data_start + size, end)
+        yield element_id, data_start, data_end
+        offset = data_end
+
+def _read_ebml_uint(f, start, end):
+    f.seek(start)
+    return int.from_bytes(f.read(end - start), 'big')
+
+def _read_ebml_float(f, start, end):
+    f.seek(start)
+    data = f.read(end - start)
+    if len(data) == 4:
+        return struct.unpack('>f', data)[0]
+    if len(data) == 8:
+        return struct.unpack('>d', data)[0]
+    return None
+
+def _probe_ebml(f, file_size):
+    segment = None
+    for element_id, start, end in _iter_ebml(f, 0, file_size):
+        if element_id == _EBML_SEGMENT:
+            segment = (start, end)
+            break
+    if not segment:
+        return None
+
+    timecode_scale = 1000000
+    duration = None
+    info = None
+    for element_id, start, end in _iter_ebml(f, *segment):
+        if element_id == _EBML_INFO:
+            for child_id, child_start, child_end in _iter_ebml(f, start, end):
+                if child_id == _EBML_TIMECODE_SCALE:
+                    timecode_scale = _read_ebml_uint(f, child_start, child_end)
+                elif child_id == _EBML_DURATION:
+                    duration = _read_ebml_float(f, child_start, child_end)
+        elif element_id == _EBML_TRACKS:
+            for entry_id, entry_start, entry_end in _iter_ebml(f, start, end):
+                if entry_id == _EBML_TRACK_ENTRY:
+                    info = info or _probe_ebml_track(f, entry_start, entry_end)
+        elif element_id == _EBML_CLUSTER:
+            # Media data starts here; headers are done
+            break
+        if info and duration is not None:
+            break
+
+    if not info:
+        return None
+    info['duration'] = duration * timecode_scale / 1e9 if duration else None
+    return info
+
+def _probe_ebml_track(f, start, end):
+    track_type = None
+    frame_ns = None
+    width = height = None
+    for element_id, child_start, child_end in _iter_ebml(f, start, end):
+        if element_id == _EBML_TRACK_TYPE:
+            track_type = _read_ebml_uint(f, child_start, child_end)
+        elif element_id == _EBML_DEFAULT_DURATION:
+            frame_ns = _read_ebml_uint(f, child_start, child_end)
+        elif element_id == _EBML_VIDEO:
+            for video_id, video_start, video_end in _iter_ebml(f, child_start, child_end):
+                if video_id == _EBML_PIXEL_WIDTH:
+                    width = _read_ebml_uint(f, video_start, video_end)
+                elif video_id == _EBML_PIXEL_HEIGHT:
+                    height = _read_ebml_uint(f, video_start, video_end)
+    if track_type != 1:
+        return None
+    return {'width': width, 'height': height, 'fps': 1e9 / frame_ns if frame_ns else None, 'rotation': 0}
+
+def _probe_avi(f):
+    f.seek(0)
+    head = f.read(512)
+    offset = head.find(b'avih')
+    if offset < 0:
+        return None
+    micro_sec_per_frame, _, _, _, total_frames, _, _, _, width, height = struct.unpack(
+        '<10I', head[offset + 8:offset + 48])
+    fps = 1e6 / micro_sec_per_frame if micro_sec_per_frame else None
+    duration = total_frames * micro_sec_per_frame / 1e6 if micro_sec_per_frame else None
+    return {'width': width, 'height': height, 'duration': duration, 'fps': fps, 'rotation': 0}
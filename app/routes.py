@@ -1,9 +1,20 @@
-from flask import Blueprint, render_template, request, jsonify, send_file, current_app
+from flask import Blueprint, render_template, request, jsonify, send_file
 import os
+import re
 from pathlib import Path
-from .utils import get_all_folders, get_folder_images, get_folder_files_cached, delete_image, is_supported_image, get_subfolders, get_breadcrumb_path
-from .models import Favorite, FileMetadata, Tag, ImageTag
-from . import db, cache
+from .utils import get_all_folders, get_folder_files_cached, get_image_dimensions, compact_listing, delete_image, is_supported_image, get_subfolders, get_breadcrumb_path, generate_thumbnail, THUMBNAIL_SIZES, \
+    DEFAULT_THUMBNAIL_SIZE, THUMBNAIL_ENCODINGS, VIDEO_EXTENSIONS, negotiate_thumbnail_format, thumbnail_ready
+from .models import Favorite, Tag, ImageTag
+from .folder_cache import folder_tree_cache
+from .layout_cache import layout_cache
+from .layout import LAYOUT_BREAKPOINTS, LAYOUT_MODES
+from .thumbnails import PRIORITY_INTERACTIVE, get_thumbnail_service
+from .sprites import get_page_sprite
+from .scrub import get_video_scrub
+from .thumbnail_store import thumbnail_store, garbage_collection_running, run_garbage_collection
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from . import db
 
 main_bp = Blueprint('main', __name__)
 api_bp = Blueprint('api', __name__, url_prefix='/api')
@@ -11,6 +22,15 @@ api_bp = Blueprint('api', __name__, url_prefix='/api')
 # Get dataset path from environment or use default
 DATASET_PATH = os.getenv('DATASET_PATH', os.path.join(os.path.dirname(__file__), '..', 'dataset'))
 
+# Largest page a client may request
+MAX_PER_PAGE = 500
+
+def page_args(default_per_page):
+    """page (None when not given) and per_page query arguments, clamped to valid ranges"""
+    page = request.args.get('page', type=int)
+    per_page = request.args.get('per_page', default_per_page, type=int)
+    return (max(1, page) if page is not None else None), min(max(1, per_page), MAX_PER_PAGE)
+
 @main_bp.route('/')
 def index():
     """Main gallery page with favorite images"""
@@ -22,15 +42,9 @@ def index():
         favorite_images = []
         for fav in favorites:
             # Get image dimensions
-            try:
-                from PIL import Image as PILImage
-                img_path = os.path.join(DATASET_PATH, fav.folder_path, fav.filename)
-                if os.path.exists(img_path):
-                    pil_img = PILImage.open(img_path)
-                    width, height = pil_img.size
-                else:
-                    width, height = 300, 300
-            except:
+            img_path = os.path.join(DATASET_PATH, fav.folder_path, fav.filename)
+            width, height = get_image_dimensions(img_path) if os.path.exists(img_path) else (None, None)
+            if not width or not height:
                 width, height = 300, 300
                 
             favorite_images.append({
@@ -66,9 +80,15 @@ def folder(folder_name):
     # Get breadcrumb navigation
     breadcrumbs = get_breadcrumb_path(folder_name)
     
-    # Load images using simple file-based approach (no database locking issues)
+    # Load the first page from the index (falls back to the filesystem for unscanned folders)
     per_page = 30
-    images, total = get_folder_images(DATASET_PATH, folder_name, 1, per_page, use_layout=True)
+    layout = request.args.get('layout', 'greedy')
+    if layout not in LAYOUT_MODES:
+        layout = 'greedy'
+    images, total, next_cursor = get_folder_files_cached(DATASET_PATH, folder_name, None, per_page, layout=layout,
+                                                         breakpoints=True)
+    sprite_mode = request.args.get('sprite') == '1'
+    sprite = get_page_sprite(DATASET_PATH, folder_name, [img['filename'] for img in images]) if sprite_mode else None
     
     # Get all tags as dictionaries for JSON serialization
     try:
@@ -87,7 +107,12 @@ def folder(folder_name):
         total_subfolders=total_subfolders,
         has_more_subfolders=has_more_subfolders,
         breadcrumbs=breadcrumbs,
-        tags=tags
+        tags=tags,
+        next_cursor=next_cursor,
+        layout_mode=layout,
+        layout_breakpoints=LAYOUT_BREAKPOINTS,
+        sprite_mode=sprite_mode,
+        sprite=sprite
     )
 
 @main_bp.route('/tags')
@@ -116,15 +141,9 @@ def tag_detail(tag_id):
         images = []
         for img_tag in image_tags:
             # Calculate dimensions using justified layout
-            try:
-                from PIL import Image as PILImage
-                img_path = os.path.join(DATASET_PATH, img_tag.folder_path, img_tag.filename)
-                if os.path.exists(img_path):
-                    pil_img = PILImage.open(img_path)
-                    width, height = pil_img.size
-                else:
-                    width, height = 400, 300
-            except:
+            img_path = os.path.join(DATASET_PATH, img_tag.folder_path, img_tag.filename)
+            width, height = get_image_dimensions(img_path) if os.path.exists(img_path) else (None, None)
+            if not width or not height:
                 width, height = 400, 300
             
             images.append({
@@ -153,13 +172,33 @@ def get_folders():
     folders = get_all_folders(DATASET_PATH)
     return jsonify(folders)
 
+@api_bp.route('/cache/stats')
+def get_cache_stats():
+    """API endpoint to get folder tree and layout cache and thumbnail service counters"""
+    thumbnails = get_thumbnail_service()
+    return jsonify({
+        'folder_tree': folder_tree_cache.stats(),
+        'layout': layout_cache.stats(),
+        'thumbnails': thumbnails.stats() if thumbnails else None,
+        'thumbnail_store': thumbnail_store.stats()
+    })
+
 @api_bp.route('/folder/<folder_name>/images')
 def get_folder_data(folder_name):
     """API endpoint to get folder images with pagination"""
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 30, type=int)
+    # Without a page number the first page is extended to whole rows, for cursor walks
+    page, per_page = page_args(30)
+    cursor = request.args.get('cursor')
+    sort = request.args.get('sort', 'name')
+    layout = request.args.get('layout', 'greedy')
+    width = request.args.get('width', 1200, type=int)
+    breakpoints = request.args.get('breakpoints') == '1'
     
-    images, total = get_folder_files_cached(DATASET_PATH, folder_name, page, per_page)
+    try:
+        images, total, next_cursor = get_folder_files_cached(DATASET_PATH, folder_name, page, per_page, cursor, sort,
+                                                             layout, width, breakpoints)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     # Add favorite status for each image
     for img in images:
@@ -178,13 +217,22 @@ def get_folder_data(folder_name):
     
     total_pages = (total + per_page - 1) // per_page
     
-    return jsonify({
+    response = {
         'images': images,
-        'current_page': page,
+        'current_page': page or 1,
         'total_pages': total_pages,
         'total_images': total,
-        'per_page': per_page
-    })
+        'per_page': per_page,
+        'next_cursor': next_cursor,
+        'thumbnail_sizes': THUMBNAIL_SIZES
+    }
+    if breakpoints:
+        response['breakpoints'] = LAYOUT_BREAKPOINTS
+    if request.args.get('sprite') == '1':
+        response['sprite'] = get_page_sprite(DATASET_PATH, folder_name, [img['filename'] for img in images])
+    if request.args.get('format') == 'compact':
+        response.update(compact_listing(response.pop('images')))
+    return jsonify(response)
 
 @api_bp.route('/image/<path:folder_name>/<filename>')
 def get_image(folder_name, filename):
@@ -223,6 +271,109 @@ def get_image(folder_name, filename):
     except Exception as e:
         return f"Error serving image: {str(e)}", 500
 
+@api_bp.route('/thumb/<path:file_path>')
+def get_thumb(file_path):
+    """
+    Serve a thumbnail of an image/video (?size= on the long edge), generating
+    it on a cache miss. The format (AVIF/WebP/JPEG) follows the Accept header.
+    """
+    try:
+        image_path = os.path.join(DATASET_PATH, file_path)
+        
+        # Security check - prevent path traversal
+        real_path = os.path.realpath(image_path)
+        real_base = os.path.realpath(DATASET_PATH)
+        
+        if not real_path.startswith(real_base + os.sep):
+            return "Access denied", 403
+        
+        if not (os.path.isfile(image_path) and is_supported_image(image_path)):
+            return "Image not found", 404
+        
+        size = request.args.get('size', DEFAULT_THUMBNAIL_SIZE, type=int)
+        fmt = negotiate_thumbnail_format(request.accept_mimetypes)
+        thumbnails = get_thumbnail_service()
+        if thumbnails and not thumbnail_ready(image_path, DATASET_PATH):
+            # Generated in a worker process, ahead of any queued backfill
+            try:
+                if thumbnails.submit(image_path, PRIORITY_INTERACTIVE).result(timeout=thumbnails.timeout) is None:
+                    return "Thumbnail not available", 404
+            except FutureTimeoutError:
+                return "Thumbnail is being generated", 503, {'Retry-After': '2'}
+        thumb_path = generate_thumbnail(image_path, DATASET_PATH, size, fmt)
+        thumb_path = thumb_path and os.path.join(thumbnail_store.root, thumb_path)
+        if thumb_path is None or not os.path.exists(thumb_path):
+            return "Thumbnail not available", 404
+        thumbnail_store.touch(thumb_path)
+        
+        # Thumbnails keep their URL when regenerated, so browsers revalidate via ETag;
+        # the same URL serves different formats, so shared caches must key on Accept
+        response = send_file(thumb_path, mimetype=THUMBNAIL_ENCODINGS[fmt][2],
+                             max_age=3600)
+        response.vary.add('Accept')
+        return response
+    except Exception as e:
+        return f"Error serving thumbnail: {str(e)}", 500
+
+@api_bp.route('/sprite/<key>')
+@api_bp.route('/sprite/<path:folder_name>/<key>')  # URL form stored in sheets built before the short one
+def get_sprite(key, folder_name=None):
+    """Serve a sprite sheet or scrub strip; they are content-keyed, so they never change"""
+    if not re.fullmatch(r'[0-9a-f]{20}', key):
+        return "Sprite not found", 404
+    sheet_path = thumbnail_store.path(key, 'jpg')
+    if not os.path.isfile(sheet_path):
+        return "Sprite not found", 404
+    thumbnail_store.touch(sheet_path)
+    
+    return send_file(sheet_path, mimetype='image/jpeg', max_age=365 * 24 * 3600)
+
+@api_bp.route('/scrub/<path:file_path>')
+def get_scrub(file_path):
+    """
+    Serve the WebVTT scrub-preview index of a video, building its frame strip
+    on first request. Cues point at cells of a strip under /api/sprite/.
+    """
+    video_path = os.path.join(DATASET_PATH, file_path)
+
+    # Security check - prevent path traversal
+    real_path = os.path.realpath(video_path)
+    real_base = os.path.realpath(DATASET_PATH)
+
+    if not real_path.startswith(real_base + os.sep):
+        return "Access denied", 403
+
+    if not (os.path.isfile(video_path) and Path(video_path).suffix.lower() in VIDEO_EXTENSIONS):
+        return "Video not found", 404
+
+    vtt_path = get_video_scrub(DATASET_PATH, file_path)
+    if vtt_path is None:
+        return "Scrub preview not available", 404
+
+    # The index keeps its URL when the video changes, so browsers revalidate via ETag
+    return send_file(vtt_path, mimetype='text/vtt', max_age=3600)
+
+_gc_request_lock = threading.Lock()
+
+@api_bp.route('/thumbnails/gc', methods=['POST'])
+def start_thumbnail_gc():
+    """
+    Start a thumbnail garbage collection pass in the background (report in
+    /api/cache/stats). Legacy .thumbnails cleanup follows THUMBNAIL_GC_LEGACY.
+    """
+    # The flock covers other processes; the thread lock covers requests racing in this one
+    if garbage_collection_running() or not _gc_request_lock.acquire(blocking=False):
+        return jsonify({'success': False, 'message': 'Thumbnail garbage collection already running'}), 409
+
+    def collect():
+        try:
+            run_garbage_collection(DATASET_PATH, legacy=os.getenv('THUMBNAIL_GC_LEGACY') == '1')
+        finally:
+            _gc_request_lock.release()
+
+    threading.Thread(target=collect, daemon=True).start()
+    return jsonify({'success': True, 'message': 'Thumbnail garbage collection started'}), 202
+
 @api_bp.route('/image/<path:folder_name>/<filename>', methods=['DELETE'])
 def delete_image_api(folder_name, filename):
     """Delete an image"""
@@ -392,8 +543,8 @@ def remove_image_tag(folder_name, filename, tag_id):
 @api_bp.route('/subfolders/<path:folder_name>')
 def get_subfolders_api(folder_name):
     """Get subfolders with pagination"""
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 20, type=int)
+    page, per_page = page_args(20)
+    page = page or 1
     
     subfolders = get_subfolders(DATASET_PATH, folder_name)
     
@@ -414,18 +565,34 @@ def get_subfolders_api(folder_name):
 def get_images_api(folder_name):
     """Get images with pagination for lazy loading"""
     try:
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 50, type=int)
+        page, per_page = page_args(50)
+        cursor = request.args.get('cursor')
+        sort = request.args.get('sort', 'name')
+        layout = request.args.get('layout', 'greedy')
+        width = request.args.get('width', 1200, type=int)
+        breakpoints = request.args.get('breakpoints') == '1'
         
-        images, total = get_folder_files_cached(DATASET_PATH, folder_name, page, per_page)
+        images, total, next_cursor = get_folder_files_cached(DATASET_PATH, folder_name, page, per_page, cursor, sort,
+                                                             layout, width, breakpoints)
         
-        return jsonify({
+        response = {
             'images': images,
             'total': total,
-            'page': page,
+            'page': page or 1,
             'per_page': per_page,
-            'has_more': page * per_page < total
-        })
+            'has_more': next_cursor is not None,
+            'next_cursor': next_cursor,
+            'thumbnail_sizes': THUMBNAIL_SIZES
+        }
+        if breakpoints:
+            response['breakpoints'] = LAYOUT_BREAKPOINTS
+        if request.args.get('sprite') == '1':
+            response['sprite'] = get_page_sprite(DATASET_PATH, folder_name, [img['filename'] for img in images])
+        if request.args.get('format') == 'compact':
+            response.update(compact_listing(response.pop('images')))
+        return jsonify(response)
+    except ValueError as e:
+        return jsonify({'error': str(e), 'images': [], 'has_more': False}), 400
     except Exception as e:
         print(f"Error in get_images_api: {str(e)}")
         import traceback
@@ -434,7 +601,7 @@ def get_images_api(folder_name):
             'error': str(e),
             'images': [],
             'total': 0,
-            'page': page,
+            'page': page or 1,
             'per_page': per_page,
             'has_more': False
         }), 500
@@ -0,0 +1,132 @@
+"""
+Scrub-preview strips for videos.
+
+A strip packs SCRUB_FRAMES frames, sampled evenly across a video, into one
+JPEG grid, with a WebVTT index whose cues point at each frame's cell
+(the `url#xywh=x,y,w,h` convention video players use for thumbnail
+tracks). Hovering a video can then show previews without streaming it.
+Strips are built on first request in a thumbnail worker slot, so a video
+that hangs or crashes the decoder is killed at the worker timeout instead of
+tying up the request thread. They are kept in the thumbnail store and keyed
+on the video's mtime.
+"""
+
+import hashlib
+import os
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from PIL import Image
+
+from .thumbnail_store import thumbnail_store
+from .thumbnails import get_thumbnail_service
+from .utils import get_video_info, read_video_frames
+
+SCRUB_FRAMES = 20
+SCRUB_COLUMNS = 5
+SCRUB_FRAME_HEIGHT = 120
+SCRUB_QUALITY = 70
+
+def scrub_key(rel_path, mtime_ns):
+    parts = [rel_path, str(mtime_ns), str(SCRUB_FRAMES), str(SCRUB_COLUMNS), str(SCRUB_FRAME_HEIGHT)]
+    return hashlib.sha1('\0'.join(parts).encode()).hexdigest()[:20]
+
+def get_video_scrub(dataset_path, rel_path, timeout=30.0):
+    """
+    WebVTT index of a video's scrub strip, built on first request. Concurrent
+    requests for the same video share one build.
+
+    Args:
+        timeout: Seconds to wait for the build; it keeps running in its worker
+            slot and later requests pick it up
+
+    Returns:
+        Path of the .vtt file in the thumbnail store, or None when the video
+        has no known duration, no frame could be read, the build is still
+        running or there is no thumbnail service to build it
+    """
+    filepath = os.path.join(dataset_path, rel_path)
+    try:
+        mtime_ns = os.stat(filepath).st_mtime_ns
+    except OSError:
+        return None
+    key = scrub_key(rel_path, mtime_ns)
+    image_path = thumbnail_store.path(key, 'jpg')
+    vtt_path = thumbnail_store.path(key, 'vtt')
+
+    if not _strip_ready(image_path, vtt_path):
+        with thumbnail_store.single_flight(key):
+            # Another request may have built it while we waited
+            if not _strip_ready(image_path, vtt_path):
+                _build_in_worker(filepath, rel_path, mtime_ns, key, timeout)
+        if not _strip_ready(image_path, vtt_path):
+            return None
+    thumbnail_store.touch(vtt_path)
+    return vtt_path
+
+def _strip_ready(image_path, vtt_path):
+    """The index is written last, so it marks a complete strip"""
+    return os.path.exists(vtt_path) and os.path.exists(image_path)
+
+def _build_in_worker(filepath, rel_path, mtime_ns, key, timeout):
+    thumbnails = get_thumbnail_service()
+    if thumbnails is None:
+        return
+    future = thumbnails.run(('scrub', key), _build_strip, filepath, rel_path, mtime_ns, key)
+    try:
+        future.result(timeout=timeout)
+    except FutureTimeoutError:
+        pass
+
+def _build_strip(filepath, rel_path, mtime_ns, key):
+    info = get_video_info(filepath)
+    duration = info and info.get('duration')
+    if not duration:
+        return
+
+    # Each frame is taken from the middle of its cue
+    span = duration / SCRUB_FRAMES
+    width = max(1, round(info['width'] * SCRUB_FRAME_HEIGHT / info['height']))
+    frames = dict(read_video_frames(filepath, [(i + 0.5) * span for i in range(SCRUB_FRAMES)],
+                                    max(width, SCRUB_FRAME_HEIGHT)))
+    if not frames:
+        return
+
+    columns = min(SCRUB_COLUMNS, len(frames))
+    rows = -(-len(frames) // columns)
+    strip = Image.new('RGB', (columns * width, rows * SCRUB_FRAME_HEIGHT))
+    cells = []
+    for index, frame in enumerate(frames.values()):
+        x, y = index % columns * width, index // columns * SCRUB_FRAME_HEIGHT
+        if frame.size != (width, SCRUB_FRAME_HEIGHT):
+            frame = frame.resize((width, SCRUB_FRAME_HEIGHT), Image.Resampling.LANCZOS)
+        strip.paste(frame, (x, y))
+        cells.append((x, y))
+
+    # Frames that could not be read keep showing the previous one
+    url = f"/api/sprite/{key}"
+    cues = ['WEBVTT', '']
+    cell = None
+    timestamps = list(frames)
+    for i in range(SCRUB_FRAMES):
+        timestamp = (i + 0.5) * span
+        if timestamp in frames:
+            cell = cells[timestamps.index(timestamp)]
+        x, y = cell or cells[0]
+        cues += [f"{_vtt_time(i * span)} --> {_vtt_time((i + 1) * span)}",
+                 f"{url}#xywh={x},{y},{width},{SCRUB_FRAME_HEIGHT}", '']
+
+    image_path = thumbnail_store.path(key, 'jpg')
+    vtt_path = thumbnail_store.path(key, 'vtt')
+    with thumbnail_store.atomic_write(image_path) as temp_path:
+        strip.save(temp_path, 'JPEG', quality=SCRUB_QUALITY)
+    thumbnail_store.add(image_path, rel_path, mtime_ns)
+    with thumbnail_store.atomic_write(vtt_path) as temp_path:
+        with open(temp_path, 'w') as f:
+            f.write('\n'.join(cues))
+    thumbnail_store.add(vtt_path, rel_path, mtime_ns)
+
+def _vtt_time(seconds):
+    milliseconds = round(seconds * 1000)
+    hours, milliseconds = divmod(milliseconds, 3_600_000)
+    minutes, milliseconds = divmod(milliseconds, 60_000)
+    return f"{hours:02d}:{minutes:02d}:{milliseconds / 1000:06.3f}"
@@ -0,0 +1,204 @@
+"""
+Per-page thumbnail sprite sheets.
+
+A sprite sheet packs the thumbnails of one listing page into a single JPEG
+atlas, so the grid can render a whole page from one request. Sheets are
+keyed on the folder version, the page's file names and which of them have a
+thumbnail, kept in the thumbnail store (and evicted with it) and rebuilt
+only when that key changes.
+"""
+
+import hashlib
+import json
+import os
+from concurrent.futures import wait
+
+from PIL import Image
+
+from .models import FolderSummary
+from .thumbnail_store import thumbnail_store
+from .thumbnails import PRIORITY_INTERACTIVE, get_thumbnail_service
+from .utils import THUMBNAIL_VERSION, generate_thumbnail, thumbnail_paths
+
+# Cell height covers the default 200px grid rows; cells are cut from the 640px thumbnails
+SPRITE_CELL_HEIGHT = 240
+SPRITE_SOURCE_SIZE = 640
+SPRITE_MAX_WIDTH = 2048
+SPRITE_QUALITY = 80
+
+# Transparent 1x1 GIF for <img> elements drawn from a sprite sheet background
+SPRITE_PLACEHOLDER = 'data:image/gif;base64,R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7'
+
+def folder_version(dataset_path, folder_name, filenames):
+    """
+    FolderSummary version of an indexed folder. Unscanned folders have none,
+    so the newest mtime of the page's files stands in.
+    """
+    summary = FolderSummary.query.filter_by(folder_path=folder_name).first()
+    if summary:
+        return summary.version
+    mtimes = []
+    for filename in filenames:
+        try:
+            mtimes.append(os.stat(os.path.join(dataset_path, folder_name, filename)).st_mtime_ns)
+        except OSError:
+            pass
+    return f"mtime-{max(mtimes, default=0)}"
+
+def sprite_key(folder_name, version, filenames, sources):
+    # The ready cells are part of the key, so a sheet built while thumbnails were
+    # missing is replaced once they exist
+    ready = ''.join('1' if source else '0' for source in sources)
+    parts = [folder_name, str(version), str(SPRITE_CELL_HEIGHT), str(THUMBNAIL_VERSION), ready, *filenames]
+    return hashlib.sha1('\0'.join(parts).encode()).hexdigest()[:20]
+
+def get_page_sprite(dataset_path, folder_name, filenames, timeout=2.0):
+    """
+    Sprite sheet for one listing page, built on first request. Missing
+    thumbnails are queued ahead of backfill and waited for up to timeout
+    seconds; files still without one get no cell, and a later request builds
+    a fuller sheet.
+
+    Args:
+        filenames: File names of the page in listing order
+
+    Returns:
+        Dict with the sheet 'url', its 'width' and 'height' and 'cells', a list
+        aligned with filenames of [x, y, width, height] (None for files
+        without a thumbnail), or None when no file has a thumbnail
+    """
+    filepaths = [os.path.join(dataset_path, folder_name, filename) for filename in filenames]
+    sources = _ensure_thumbnails(dataset_path, filepaths, timeout)
+    key = sprite_key(folder_name, folder_version(dataset_path, folder_name, filenames), filenames, sources)
+    image_path = thumbnail_store.path(key, 'jpg')
+    map_path = thumbnail_store.path(key, 'json')
+
+    sheet = _load_sheet(image_path, map_path)
+    if sheet:
+        return sheet
+
+    with thumbnail_store.single_flight(key):
+        # Another request may have built it while we waited
+        return _load_sheet(image_path, map_path) or _build_sheet(folder_name, sources, key)
+
+def _load_sheet(image_path, map_path):
+    """Stored sheet, or None if it hasn't been built (the map is written last)"""
+    try:
+        with open(map_path) as f:
+            sheet = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not os.path.exists(image_path):
+        return None
+    thumbnail_store.touch(map_path)
+    return sheet
+
+def _build_sheet(folder_name, sources, key):
+    cells, placed = _pack(sources)
+    if not placed:
+        return None
+    width = max(x + w for x, y, w, h in placed.values())
+    height = max(y + h for x, y, w, h in placed.values())
+
+    # A thumbnail evicted since sources was taken leaves a blank cell; such a
+    # sheet is served but not stored, since its key claims the cell is ready
+    complete = len(placed) == sum(1 for source in sources if source)
+    atlas = Image.new('RGB', (width, height))
+    for path, (x, y, w, h) in placed.items():
+        try:
+            with Image.open(path) as thumb:
+                atlas.paste(thumb.convert('RGB').resize((w, h), Image.Resampling.LANCZOS), (x, y))
+        except OSError:
+            complete = False
+
+    sheet = {
+        'url': f"/api/sprite/{key}",
+        'width': width,
+        'height': height,
+        'cells': cells
+    }
+    image_path = thumbnail_store.path(key, 'jpg')
+    map_path = thumbnail_store.path(key, 'json')
+    with thumbnail_store.atomic_write(image_path) as temp_path:
+        atlas.save(temp_path, 'JPEG', quality=SPRITE_QUALITY)
+    thumbnail_store.add(image_path, folder_name)
+    if complete:
+        with thumbnail_store.atomic_write(map_path) as temp_path:
+            with open(temp_path, 'w') as f:
+                json.dump(sheet, f)
+        thumbnail_store.add(map_path, folder_name)
+    return sheet
+
+def sprite_style(sheet, cell):
+    """
+    Inline CSS showing one cell of a sheet as an element's background.
+    Percentages keep it correct at any element size.
+    """
+    x, y, w, h = cell
+
+    def position(offset, size, total):
+        return offset / (total - size) * 100 if total > size else 0
+
+    return (f"background-image: url('{sheet['url']}'); "
+            f"background-size: {sheet['width'] / w * 100:.3f}% {sheet['height'] / h * 100:.3f}%; "
+            f"background-position: {position(x, w, sheet['width']):.3f}% {position(y, h, sheet['height']):.3f}%;")
+
+def _sprite_sources(dataset_path, filepaths):
+    """Stored thumbnail each cell is cut from, aligned with filepaths (None where there is none yet)"""
+    sources = []
+    for filepath in filepaths:
+        try:
+            path = thumbnail_paths(filepath, dataset_path)[SPRITE_SOURCE_SIZE]
+        except OSError:
+            # Source deleted since the listing was read
+            path = None
+        sources.append(path if path and os.path.exists(path) else None)
+    return sources
+
+def _ensure_thumbnails(dataset_path, filepaths, timeout):
+    """
+    Generate missing thumbnails through the thumbnail service (inline without
+    one) and return the sprite sources after waiting for them
+    """
+    sources = _sprite_sources(dataset_path, filepaths)
+    missing = [path for path, source in zip(filepaths, sources) if source is None and os.path.isfile(path)]
+    if not missing:
+        return sources
+    thumbnails = get_thumbnail_service()
+    if thumbnails:
+        wait([future for future in (thumbnails.submit(path, PRIORITY_INTERACTIVE) for path in missing) if future],
+             timeout=timeout)
+    else:
+        for path in missing:
+            generate_thumbnail(path, dataset_path)
+    return _sprite_sources(dataset_path, filepaths)
+
+def _pack(sources):
+    """
+    Shelf-pack one cell per ready thumbnail into rows of SPRITE_MAX_WIDTH.
+
+    Returns:
+        Tuple of (cells aligned with sources, {thumbnail path: cell})
+    """
+    cells = []
+    placed = {}
+    x = y = 0
+    for path in sources:
+        if path is None:
+            cells.append(None)
+            continue
+        try:
+            with Image.open(path) as thumb:
+                thumb_width, thumb_height = thumb.size
+        except OSError:
+            # Thumbnail evicted since sources was taken
+            cells.append(None)
+            continue
+        h = min(SPRITE_CELL_HEIGHT, thumb_height)
+        w = min(SPRITE_MAX_WIDTH, max(1, round(thumb_width * h / thumb_height)))
+        if x + w > SPRITE_MAX_WIDTH:
+            x, y = 0, y + SPRITE_CELL_HEIGHT
+        cells.append([x, y, w, h])
+        placed[path] = (x, y, w, h)
+        x += w
+    return cells, placed
@@ -344,7 +344,8 @@ function openLightbox(imgElement) {
     } else {
         lightboxVideo.style.display = 'none';
         lightboxImage.style.display = 'block';
-        lightboxImage.src = imgElement.src;
+        // Grid images are thumbnails; the lightbox shows the original
+        lightboxImage.src = imgElement.dataset.full || imgElement.src;
         lightboxImage.style.transform = 'scale(1) translate(0px, 0px)';
         lightboxImage.style.cursor = '';
     }
@@ -826,7 +827,7 @@ function loadImageToLightbox(gridItem) {
     } else {
         lightboxVideo.style.display = 'none';
         lightboxImage.style.display = 'block';
-        lightboxImage.src = img.src;
+        lightboxImage.src = img.dataset.full || img.src;
         lightboxImage.style.transform = 'scale(1) translate(0px, 0px)';
         lightboxImage.style.cursor = '';
     }
@@ -19,11 +19,48 @@ class SmartGalleryLayout {
         const items = Array.from(this.container.querySelectorAll('.grid-item'));
         if (items.length === 0) return;
 
+        // Server-computed layouts: just pick the breakpoint, no relayout
+        if (this.container.dataset.breakpoints) {
+            this.applyBreakpoints(items);
+            return;
+        }
+
         const containerWidth = this.container.clientWidth;
         const rows = this.arrangeIntoRows(items, containerWidth);
         this.applyLayout(rows, containerWidth);
     }
 
+    /**
+     * Index of the widest server breakpoint that fits the available width
+     */
+    currentBreakpoint() {
+        const breakpoints = JSON.parse(this.container.dataset.breakpoints);
+        const available = this.container.parentElement.clientWidth;
+        let index = 0;
+        breakpoints.forEach((width, i) => {
+            if (width <= available) index = i;
+        });
+        return { index, width: breakpoints[index] };
+    }
+
+    /**
+     * Size items from their per-breakpoint [width, height] pairs (data-breakpoints)
+     */
+    applyBreakpoints(items) {
+        const { index, width } = this.currentBreakpoint();
+        this.container.style.maxWidth = width + 'px';
+
+        for (let item of items) {
+            if (!item.dataset.breakpoints) continue;
+            const [itemWidth, itemHeight] = JSON.parse(item.dataset.breakpoints)[index];
+            item.style.width = itemWidth + 'px';
+            item.style.height = itemHeight + 'px';
+            item.style.flex = 'none';
+            item.style.minWidth = '0';
+            setThumbnailSizes(item, itemWidth);
+        }
+    }
+
     /**
      * Arrange items into rows
      */
@@ -92,6 +129,7 @@ class SmartGalleryLayout {
 
                 item.style.height = clampedHeight + 'px';
                 item.style.width = itemWidth + 'px';
+                setThumbnailSizes(item, itemWidth);
                 item.style.flex = 'none';
                 item.style.margin = '0';
 
@@ -111,6 +149,68 @@ class SmartGalleryLayout {
     }
 }
 
+/**
+ * Expand a compact listing (?format=compact) into image objects.
+ * `files` holds one array per key, aligned by index; `rows` is a list of
+ * [height, [widths]] whose items are consecutive entries of `files`.
+ */
+function expandCompactListing(data) {
+    const keys = Object.keys(data.files);
+    const images = [];
+    let index = 0;
+
+    data.rows.forEach(([height, widths], row) => {
+        for (let width of widths) {
+            const image = { calc_width: width, calc_height: height, row };
+            for (let key of keys) {
+                image[key] = data.files[key][index];
+            }
+            images.push(image);
+            index++;
+        }
+    });
+
+    return images;
+}
+
+/**
+ * srcset value for a thumbnail ladder, mirroring utils.thumbnail_srcset
+ */
+function thumbnailSrcset(path, width, height, sizes) {
+    const longEdge = Math.max(width || 0, height || 0);
+    const url = `/api/thumb/${encodeURI(path)}`;
+    const entries = [];
+    for (let size of sizes) {
+        const scale = longEdge ? Math.min(1, size / longEdge) : 1;
+        entries.push(`${url}?size=${size} ${width ? Math.max(1, Math.round(width * scale)) : size}w`);
+        // Thumbnails are never upscaled, so larger sizes are the same image
+        if (longEdge && scale === 1) break;
+    }
+    return entries.join(', ');
+}
+
+/**
+ * Tell the browser which thumbnail width an item is displayed at
+ */
+function setThumbnailSizes(item, width) {
+    const img = item.querySelector('img[srcset]');
+    if (img) img.sizes = Math.round(width) + 'px';
+}
+
+// Transparent 1x1 GIF for <img> elements drawn from a sprite sheet background
+const SPRITE_PLACEHOLDER = 'data:image/gif;base64,R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7';
+
+/**
+ * Inline CSS showing one [x, y, width, height] cell of a sprite sheet, mirroring sprites.sprite_style
+ */
+function spriteStyle(sheet, cell) {
+    const [x, y, w, h] = cell;
+    const position = (offset, size, total) => total > size ? offset / (total - size) * 100 : 0;
+    return `background-image: url('${sheet.url}'); ` +
+        `background-size: ${sheet.width / w * 100}% ${sheet.height / h * 100}%; ` +
+        `background-position: ${position(x, w, sheet.width)}% ${position(y, h, sheet.height)}%;`;
+}
+
 // Initialize layout
 let galleryLayout;
 
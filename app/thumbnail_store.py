@@ -0,0 +1,412 @@
+"""
+Content-addressed thumbnail store.
+
+Thumbnails and sprite sheets live under one cache root (THUMBNAIL_CACHE_DIR)
+instead of .thumbnails folders inside the dataset, so the dataset can be a
+read-only or slow mount while the cache sits on local SSD. Files are named by
+a hash of (source path, size, source mtime, variant), so a changed source
+simply maps to new names, and sharded as ab/cd/<hash>.<ext>.
+
+A small SQLite index next to the files records the size and last access of
+every file. When the total exceeds THUMBNAIL_CACHE_BYTES, the least recently
+used files are evicted. The index is shared by all processes (web workers
+and thumbnail workers) using the same cache root.
+
+The index also records the source file (and its mtime) of every derivative,
+so a background garbage collector can drop derivatives of deleted or
+changed files long before LRU eviction would.
+
+Writers hold a single-flight lock per derivative (flock on striped lock
+files, so it works across threads and processes) and write through a
+temporary file renamed into place, so readers never see partial files.
+"""
+
+import fcntl
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# A child of app.logger, so messages go to the app's handlers (no app context needed)
+logger = logging.getLogger(__name__)
+
+# Access times are only written when older than this, to keep reads cheap
+TOUCH_INTERVAL = 60.0
+
+# Eviction frees space down to this share of the budget, so it doesn't run on every write
+EVICT_TARGET = 0.9
+
+# Single-flight locks are striped over this many lock files, so none ever need cleaning up
+LOCK_STRIPES = 1024
+
+# Garbage collection: index rows per chunk and filesystem operations (stat/unlink) per second
+GC_CHUNK_SIZE = 500
+GC_OPS_PER_SEC = 200
+
+# Files missing from the index are only collected once this old, so in-progress writes are left alone
+GC_UNINDEXED_GRACE = 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    bytes INTEGER NOT NULL,
+    accessed REAL NOT NULL,
+    source TEXT,
+    mtime_ns INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_files_accessed ON files(accessed);
+CREATE TABLE IF NOT EXISTS totals (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO totals (id, bytes) VALUES (0, 0);
+CREATE TRIGGER IF NOT EXISTS files_insert AFTER INSERT ON files BEGIN
+    UPDATE totals SET bytes = bytes + NEW.bytes WHERE id = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS files_update AFTER UPDATE OF bytes ON files BEGIN
+    UPDATE totals SET bytes = bytes + NEW.bytes - OLD.bytes WHERE id = 0;
+END;
+CREATE TRIGGER IF NOT EXISTS files_delete AFTER DELETE ON files BEGIN
+    UPDATE totals SET bytes = bytes - OLD.bytes WHERE id = 0;
+END;
+"""
+
+class ThumbnailStore:
+    """Sharded, content-addressed file cache with an LRU byte budget"""
+
+    def __init__(self, root, max_bytes):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.last_gc = None
+        self.coalesced = 0
+        self._local = threading.local()
+
+    def _connection(self):
+        """Per-thread (and per-process) connection to the index"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            os.makedirs(self.root, exist_ok=True)
+            connection = sqlite3.connect(os.path.join(self.root, 'index.db'), timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            columns = {row[1] for row in connection.execute('PRAGMA table_info(files)')}
+            if columns and 'source' not in columns:
+                # Indexes created before sources were tracked
+                connection.execute('ALTER TABLE files ADD COLUMN source TEXT')
+                connection.execute('ALTER TABLE files ADD COLUMN mtime_ns INTEGER')
+            connection.executescript(SCHEMA)
+            connection.execute('CREATE INDEX IF NOT EXISTS idx_files_source ON files(source)')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def key(self, source, size, mtime_ns, variant):
+        """Content address of one rendition of a source file"""
+        return hashlib.sha1(f"{source}\0{size}\0{mtime_ns}\0{variant}".encode()).hexdigest()
+
+    def path(self, key, ext):
+        """Absolute path for a key, sharded into two directory levels"""
+        return os.path.join(self.root, key[:2], key[2:4], f"{key}.{ext}")
+
+    def relative(self, path):
+        return os.path.relpath(path, self.root)
+
+    @contextmanager
+    def single_flight(self, key):
+        """
+        Hold the generation lock for one derivative key, so only one thread or
+        process builds it; others block here and should re-check whether it
+        exists once they get the lock. Locks are flock()s on open file
+        descriptions, so they exclude threads as well as processes and are
+        released by the kernel if the holder dies.
+        """
+        lock_dir = os.path.join(self.root, 'locks')
+        os.makedirs(lock_dir, exist_ok=True)
+        stripe = int(key[:8], 16) % LOCK_STRIPES
+        with open(os.path.join(lock_dir, f"{stripe:04d}.lock"), 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self.coalesced += 1
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    @contextmanager
+    def atomic_write(self, path):
+        """Yield a temporary path next to path, renamed over it when the block succeeds"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            yield temp_path
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+    def add(self, path, source=None, mtime_ns=None):
+        """
+        Record a file just written into the store, then evict to stay within budget.
+
+        Args:
+            source: Dataset-relative path of the file (or folder) it was derived from
+            mtime_ns: Source mtime it was derived from; None if any version stays valid
+        """
+        nbytes = os.path.getsize(path)
+        self._connection().execute(
+            'INSERT INTO files (path, bytes, accessed, source, mtime_ns) VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT(path) DO UPDATE SET bytes = excluded.bytes, accessed = excluded.accessed, '
+            'source = excluded.source, mtime_ns = excluded.mtime_ns',
+            (self.relative(path), nbytes, time.time(), source, mtime_ns)
+        )
+        if self.total_bytes() > self.max_bytes:
+            self.evict()
+
+    def touch(self, path):
+        """Mark a file as used (throttled to one write per TOUCH_INTERVAL)"""
+        now = time.time()
+        self._connection().execute(
+            'UPDATE files SET accessed = ? WHERE path = ? AND accessed < ?',
+            (now, self.relative(path), now - TOUCH_INTERVAL)
+        )
+
+    def total_bytes(self):
+        return self._connection().execute('SELECT bytes FROM totals WHERE id = 0').fetchone()[0]
+
+    def evict(self, target=None):
+        """Delete least recently used files until the store holds at most target bytes"""
+        target = self.max_bytes * EVICT_TARGET if target is None else target
+        connection = self._connection()
+        evicted = 0
+        excess = self.total_bytes() - target
+        while excess > 0:
+            rows = connection.execute('SELECT path, bytes FROM files ORDER BY accessed LIMIT 256').fetchall()
+            if not rows:
+                break
+            # Stop at the file that brings the total under target, rather than dropping the whole batch
+            victims = []
+            for rel_path, nbytes in rows:
+                if excess <= 0:
+                    break
+                victims.append(rel_path)
+                excess -= nbytes
+            self._remove(victims)
+            evicted += len(victims)
+        return evicted
+
+    def remove_source(self, source):
+        """Delete every derivative of a source file; returns the bytes reclaimed"""
+        rows = self._connection().execute('SELECT path, bytes FROM files WHERE source = ?', (source,)).fetchall()
+        self._remove([rel_path for rel_path, _ in rows])
+        return sum(nbytes for _, nbytes in rows)
+
+    def _remove(self, rel_paths, limiter=None):
+        for rel_path in rel_paths:
+            if limiter:
+                limiter.wait()
+            try:
+                os.remove(os.path.join(self.root, rel_path))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning("Error removing %s: %s", rel_path, e)
+        self._connection().executemany('DELETE FROM files WHERE path = ?', [(rel_path,) for rel_path in rel_paths])
+
+    def collect_garbage(self, dataset_path, chunk_size=GC_CHUNK_SIZE, ops_per_sec=GC_OPS_PER_SEC, legacy=False):
+        """
+        Delete derivatives whose source is gone or has changed since.
+
+        Walks the index in chunks of chunk_size rows (each chunk is a short
+        read, so serving is never blocked), stats every distinct source once
+        and removes stale files. Sources are checked on disk rather than
+        against FileMetadata, which misses files deleted while the watcher
+        was off. Then walks the shard directories one at a time for files
+        that never made it into the index.
+
+        Stats and deletions together are limited to ops_per_sec, so a pass
+        over a large store on slow storage trickles along in the background.
+
+        Args:
+            legacy: Also remove the .thumbnails folders older versions wrote into the dataset
+
+        Returns:
+            Dict with entries scanned, files removed, bytes reclaimed and seconds taken
+        """
+        limiter = _RateLimiter(ops_per_sec)
+        connection = self._connection()
+        started = time.time()
+        scanned = removed = reclaimed = 0
+        last_path = ''
+        while True:
+            rows = connection.execute(
+                'SELECT path, bytes, source, mtime_ns FROM files WHERE path > ? ORDER BY path LIMIT ?',
+                (last_path, chunk_size)
+            ).fetchall()
+            if not rows:
+                break
+            last_path = rows[-1][0]
+            scanned += len(rows)
+
+            current = {}
+            for source in {row[2] for row in rows if row[2] is not None}:
+                limiter.wait()
+                try:
+                    current[source] = os.stat(os.path.join(dataset_path, source)).st_mtime_ns
+                except OSError:
+                    current[source] = None
+
+            stale = [(rel_path, nbytes) for rel_path, nbytes, source, mtime_ns in rows
+                     if source is not None and (current[source] is None
+                                                or mtime_ns is not None and current[source] != mtime_ns)]
+            self._remove([rel_path for rel_path, _ in stale], limiter)
+            removed += len(stale)
+            reclaimed += sum(nbytes for _, nbytes in stale)
+
+        for directory_scanned, directory_removed, directory_reclaimed in self._collect_unindexed(limiter):
+            scanned += directory_scanned
+            removed += directory_removed
+            reclaimed += directory_reclaimed
+
+        if legacy:
+            legacy_removed, legacy_reclaimed = _remove_legacy_thumbnails(dataset_path, limiter)
+            removed += legacy_removed
+            reclaimed += legacy_reclaimed
+
+        self.last_gc = {
+            'scanned': scanned,
+            'removed': removed,
+            'bytes_reclaimed': reclaimed,
+            'seconds': round(time.time() - started, 3),
+            'finished_at': time.time()
+        }
+        return self.last_gc
+
+    def _collect_unindexed(self, limiter):
+        """Remove old files without an index row, one shard directory at a time"""
+        connection = self._connection()
+        cutoff = time.time() - GC_UNINDEXED_GRACE
+        for shard in sorted(os.listdir(self.root)):
+            shard_path = os.path.join(self.root, shard)
+            if len(shard) != 2 or not os.path.isdir(shard_path):
+                continue
+            for subshard in sorted(os.listdir(shard_path)):
+                prefix = os.path.join(shard, subshard) + os.sep
+                known = {row[0] for row in connection.execute(
+                    'SELECT path FROM files WHERE path >= ? AND path < ?',
+                    (prefix, prefix[:-1] + chr(ord(os.sep) + 1))
+                )}
+                scanned = removed = reclaimed = 0
+                for entry in os.scandir(os.path.join(shard_path, subshard)):
+                    if prefix + entry.name in known:
+                        continue
+                    scanned += 1
+                    limiter.wait()
+                    try:
+                        stat = entry.stat()
+                        if stat.st_mtime > cutoff:
+                            continue
+                        os.remove(entry.path)
+                    except OSError:
+                        continue
+                    removed += 1
+                    reclaimed += stat.st_size
+                yield scanned, removed, reclaimed
+
+    def stats(self):
+        files, = self._connection().execute('SELECT COUNT(*) FROM files').fetchone()
+        return {
+            'root': self.root,
+            'files': files,
+            'bytes': self.total_bytes(),
+            'max_bytes': self.max_bytes,
+            'coalesced': self.coalesced,
+            'last_gc': self.last_gc
+        }
+
+class _RateLimiter:
+    """Spaces calls to wait() at least 1/rate seconds apart"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = time.monotonic()
+
+    def wait(self):
+        now = time.monotonic()
+        if now < self._next:
+            time.sleep(self._next - now)
+        self._next = max(now, self._next) + self.interval
+
+def _remove_legacy_thumbnails(dataset_path, limiter):
+    """Delete the .thumbnails folders written into the dataset before the store existed"""
+    removed = reclaimed = 0
+    for root, dirs, filenames in os.walk(dataset_path):
+        if os.path.basename(root) == '.thumbnails':
+            for dirpath, _, legacy_files in os.walk(root, topdown=False):
+                for filename in legacy_files:
+                    limiter.wait()
+                    path = os.path.join(dirpath, filename)
+                    try:
+                        size = os.path.getsize(path)
+                        os.remove(path)
+                    except OSError as e:
+                        logger.warning("Error removing %s: %s", path, e)
+                        continue
+                    removed += 1
+                    reclaimed += size
+                try:
+                    os.rmdir(dirpath)
+                except OSError:
+                    pass
+            dirs[:] = []
+        else:
+            dirs[:] = [d for d in dirs if d == '.thumbnails' or not d.startswith('.')]
+    return removed, reclaimed
+
+# Shared by all modules (and inherited by thumbnail worker processes through the environment)
+thumbnail_store = ThumbnailStore(
+    os.getenv('THUMBNAIL_CACHE_DIR', os.path.join(os.path.dirname(__file__), '..', 'thumbnail_cache')),
+    int(os.getenv('THUMBNAIL_CACHE_BYTES', 5 * 1024 ** 3))
+)
+
+def garbage_collection_running():
+    """True while any process holds the GC lock"""
+    os.makedirs(thumbnail_store.root, exist_ok=True)
+    with open(os.path.join(thumbnail_store.root, 'gc.lock'), 'w') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return True
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+    return False
+
+def run_garbage_collection(dataset_path, legacy=False):
+    """One GC pass over the shared store; skipped (returns None) while another process runs one"""
+    os.makedirs(thumbnail_store.root, exist_ok=True)
+    with open(os.path.join(thumbnail_store.root, 'gc.lock'), 'w') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return None
+        report = thumbnail_store.collect_garbage(dataset_path, legacy=legacy)
+    logger.info("Thumbnail GC: scanned %s, removed %s files, reclaimed %.1f MB in %ss", report['scanned'],
+                report['removed'], report['bytes_reclaimed'] / (1024 * 1024), report['seconds'])
+    return report
+
+def start_garbage_collector(dataset_path, interval, legacy=False):
+    """Run garbage collection every interval seconds in a daemon thread"""
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                run_garbage_collection(dataset_path, legacy)
+            except Exception as e:
+                logger.exception("Error during thumbnail garbage collection: %s", e)
+
+    thread = threading.Thread(target=loop, name='thumbnail-gc', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,262 @@
+"""
+Thumbnail worker service.
+
+Thumbnails are generated in worker processes so a large backfill uses every
+core instead of one GIL-bound thread. Jobs go through a bounded,
+de-duplicating priority queue: thumbnails the UI is waiting for
+(PRIORITY_INTERACTIVE) run before scan and watcher backfill (PRIORITY_BACKFILL).
+
+Each worker slot is a single-process ProcessPoolExecutor, so a job that runs
+past the timeout or kills its process (e.g. a decoder crash on a corrupt
+file) only takes down its own slot, which is restarted for the next job.
+Files that fail are not retried until they change. Other decode-heavy jobs
+(e.g. video scrub strips) can run in the same slots through run().
+
+Every web worker process runs its own service, so the CPU count is split
+between them: WEB_CONCURRENCY (the gunicorn worker count) sets the share,
+THUMBNAIL_WORKERS overrides the slots per process. THUMBNAIL_TIMEOUT sets
+the per-thumbnail timeout.
+"""
+
+import itertools
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from . import db
+from .models import FileMetadata
+from .utils import generate_thumbnail, get_relative_folder
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKFILL = 10
+
+class _Job:
+    __slots__ = ('priority', 'future', 'running', 'task')
+
+    def __init__(self, priority, task=None):
+        self.priority = priority
+        self.future = Future()
+        self.running = False
+        self.task = task  # (func, args) for jobs queued through run()
+
+class ThumbnailService:
+    """Generates thumbnails in a pool of worker processes, fed by a priority queue"""
+
+    def __init__(self, app, dataset_path, workers=None, maxsize=10000, timeout=30.0):
+        self.app = app
+        self.dataset_path = dataset_path
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._queue = queue.PriorityQueue()
+        self._order = itertools.count()
+        self._pending = {}  # filepath (or run() key) -> _Job, queued or running
+        self._failed = {}  # filepath -> mtime of the version that failed
+        self._lock = threading.Lock()
+        self._context = multiprocessing.get_context('spawn')
+        self._executors = [None] * self.workers
+        self._pids = [None] * self.workers  # worker process of each slot, killed on timeout
+        self.completed = 0
+        self.failures = 0
+        self.dropped = 0
+        self._threads = [
+            threading.Thread(target=self._run, args=(slot,), name=f'thumbnail-worker-{slot}', daemon=True)
+            for slot in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, filepath, priority=PRIORITY_BACKFILL):
+        """
+        Queue a thumbnail job. A file already queued keeps a single job, moved
+        ahead when requested again with a more urgent priority.
+
+        Returns:
+            Future resolving to the thumbnail path (None on failure), or None
+            when a backfill job was dropped because the queue is full
+        """
+        filepath = os.path.abspath(filepath)
+        with self._lock:
+            job = self._pending.get(filepath)
+            if job is None:
+                if self._failed_before(filepath):
+                    done = Future()
+                    done.set_result(None)
+                    return done
+                if priority >= PRIORITY_BACKFILL and len(self._pending) >= self.maxsize:
+                    # Dropped thumbnails are generated on the next scan or on demand
+                    self.dropped += 1
+                    return None
+                job = self._pending[filepath] = _Job(priority)
+            elif job.running or priority >= job.priority:
+                return job.future
+            else:
+                # The old queue entry becomes stale and is skipped
+                job.priority = priority
+            self._queue.put((priority, next(self._order), filepath))
+            return job.future
+
+    def run(self, key, func, *args, priority=PRIORITY_INTERACTIVE):
+        """
+        Queue func(*args) in a worker slot, under the same timeout as
+        thumbnails. func must be a module-level function the worker process can
+        import. Jobs queued under the same key (a tuple, so it never clashes
+        with a file path) share one run.
+
+        Returns:
+            Future resolving to func's result (None on failure or timeout)
+        """
+        with self._lock:
+            job = self._pending.get(key)
+            if job is None:
+                job = self._pending[key] = _Job(priority, (func, args))
+            elif job.running or priority >= job.priority:
+                return job.future
+            else:
+                job.priority = priority
+            self._queue.put((priority, next(self._order), key))
+            return job.future
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'pending': len(self._pending),
+                'completed': self.completed,
+                'failures': self.failures,
+                'dropped': self.dropped,
+                'failed_files': len(self._failed)
+            }
+
+    def _failed_before(self, filepath):
+        """True if this version of the file already failed (called with the lock held)"""
+        if filepath not in self._failed:
+            return False
+        try:
+            if os.path.getmtime(filepath) == self._failed[filepath]:
+                return True
+        except OSError:
+            return True
+        del self._failed[filepath]
+        return False
+
+    def _run(self, slot):
+        while True:
+            priority, _, key = self._queue.get()
+            with self._lock:
+                job = self._pending.get(key)
+                if job is None or job.running or job.priority != priority:
+                    continue
+                job.running = True
+
+            if job.task:
+                func, args = job.task
+                result = self._call(slot, key, func, *args)
+                with self._lock:
+                    del self._pending[key]
+                job.future.set_result(result)
+                continue
+
+            filepath = key
+            thumbnail_path = None
+            if os.path.isfile(filepath):
+                thumbnail_path = self._call(slot, filepath, generate_thumbnail, filepath, self.dataset_path)
+
+            with self._lock:
+                del self._pending[filepath]
+                if thumbnail_path:
+                    self.completed += 1
+                elif os.path.isfile(filepath):
+                    self.failures += 1
+                    try:
+                        self._failed[filepath] = os.path.getmtime(filepath)
+                    except OSError:
+                        pass
+            job.future.set_result(thumbnail_path)
+
+            if thumbnail_path:
+                self._save(filepath, thumbnail_path)
+
+    def _call(self, slot, key, func, *args):
+        """Run func(*args) in this slot's worker process; key names the job in messages"""
+        try:
+            if self._executors[slot] is None:
+                executor = ProcessPoolExecutor(max_workers=1, mp_context=self._context)
+                self._executors[slot] = executor
+                self._pids[slot] = executor.submit(os.getpid).result(timeout=self.timeout)
+            future = self._executors[slot].submit(func, *args)
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            self.app.logger.warning("Thumbnail job timed out after %ss, restarting worker: %s", self.timeout, key)
+            self._restart(slot, kill=True)
+        except BrokenProcessPool:
+            self.app.logger.warning("Thumbnail worker crashed, restarting: %s", key)
+            self._restart(slot)
+        except RuntimeError as e:
+            # Executor shut down underneath us (e.g. at interpreter exit)
+            self.app.logger.warning("Thumbnail worker unavailable, restarting: %s (%s)", key, e)
+            self._restart(slot)
+        except Exception as e:
+            self.app.logger.error("Error running thumbnail job %s: %s", key, e)
+        return None
+
+    def _restart(self, slot, kill=False):
+        """Drop the slot's executor; the next job starts a fresh one"""
+        executor, self._executors[slot] = self._executors[slot], None
+        pid, self._pids[slot] = self._pids[slot], None
+        if kill and pid:
+            # A running job cannot be cancelled, so its process is killed
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except OSError:
+                pass
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _save(self, filepath, thumbnail_path):
+        with self.app.app_context():
+            try:
+                FileMetadata.query.filter_by(
+                    folder_path=get_relative_folder(self.dataset_path, os.path.dirname(filepath)),
+                    filename=os.path.basename(filepath)
+                ).update({'thumbnail_path': thumbnail_path})
+                db.session.commit()
+            except Exception as e:
+                self.app.logger.error("Error saving thumbnail path for %s: %s", filepath, e)
+                db.session.rollback()
+
+_service = None
+_service_lock = threading.Lock()
+
+def thumbnail_workers():
+    """
+    Worker slots for this process: THUMBNAIL_WORKERS, or this process's share
+    of the CPUs when WEB_CONCURRENCY web workers each run a service
+    """
+    configured = int(os.getenv('THUMBNAIL_WORKERS', 0))
+    if configured > 0:
+        return configured
+    web_workers = max(1, int(os.getenv('WEB_CONCURRENCY', 1)))
+    return max(1, (os.cpu_count() or 1) // web_workers)
+
+def start_thumbnail_service(app, dataset_path):
+    """Start the process-wide thumbnail service (once) and return it"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = ThumbnailService(
+                app,
+                os.path.abspath(dataset_path),
+                workers=thumbnail_workers(),
+                timeout=float(os.getenv('THUMBNAIL_TIMEOUT', 30.0))
+            )
+        return _service
+
+def get_thumbnail_service():
+    """The running thumbnail service, or None"""
+    return _service
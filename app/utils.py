@@ -1,11 +1,24 @@
 import os
-from PIL import Image
+import base64
+import hashlib
+import io
+import json
+from PIL import ExifTags, Image, JpegImagePlugin, features
 from pathlib import Path
-from .models import FileMetadata, ImageMetadata
+from urllib.parse import quote
+from .models import FileMetadata, FolderLayout, FolderSummary, ImageMetadata
 from . import db
-import math
+from .folder_cache import folder_tree_cache
+from .probe import probe_image_size, probe_video
+from .layout_cache import layout_cache
+from .thumbnail_store import thumbnail_store
+from .layout import (LAYOUT_BREAKPOINTS, LAYOUT_MODES, aspect_ratio_array, breakpoint_layouts, justified_layout,
+                     pack_layouts, paged_layout, row_numbers, unpack_layouts, width_bucket)
+from flask import has_app_context
+from sqlalchemy import or_, tuple_
 import threading
 import cv2
+import numpy as np
 from datetime import datetime
 
 SUPPORTED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.heic', '.mp4', '.mov', '.avi', '.webm'}
@@ -15,15 +28,123 @@ IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.heic'}
 SUPPORTED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.heic', '.mp4', '.mov', '.avi', '.webm'}
 VIDEO_EXTENSIONS = {'.mp4', '.mov', '.avi', '.webm'}
 
+def get_video_info(video_path):
+    """
+    Get video width, height, duration, fps and rotation.
+
+    Parses the container header (cached), and only opens the video with
+    OpenCV when the container is not understood. Returns None on failure.
+    """
+    info = probe_video(video_path)
+    if info:
+        return info
+
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if not cap.isOpened():
+            return None
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if not width or not height:
+            return None
+        return {
+            'width': width,
+            'height': height,
+            'duration': frame_count / fps if fps and fps > 0 else None,
+            'fps': fps or None,
+            'rotation': 0
+        }
+    finally:
+        cap.release()
+
+# Candidate thumbnail frames of a video, as fractions of its duration
+VIDEO_THUMBNAIL_POSITIONS = (0.1, 0.25, 0.5, 0.75)
+
+# Frames with a lower mean luma are considered black (fades, leaders)
+VIDEO_BLACK_LEVEL = 24
+
+def read_video_frames(video_path, timestamps, size=None):
+    """
+    Decode the frames at the given timestamps (seconds), seeking to each one
+    instead of decoding the video from the start.
+
+    Args:
+        size: Shrink frames to fit within size x size as they are read
+
+    Returns:
+        List of (timestamp, RGB image) for the frames that could be read
+    """
+    frames = []
+    cap = cv2.VideoCapture(video_path)
+    try:
+        if not cap.isOpened():
+            return frames
+        for timestamp in timestamps:
+            cap.set(cv2.CAP_PROP_POS_MSEC, timestamp * 1000)
+            ret, frame = cap.read()
+            if not ret:
+                continue
+            height, width = frame.shape[:2]
+            scale = size / max(width, height) if size else 1.0
+            if scale < 1.0:
+                frame = cv2.resize(frame, (max(1, round(width * scale)), max(1, round(height * scale))),
+                                   interpolation=cv2.INTER_AREA)
+            frames.append((timestamp, Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))))
+    finally:
+        cap.release()
+    return frames
+
+def representative_video_frame(video_path, size=None):
+    """
+    Pick a video's thumbnail frame: the most detailed non-black frame among
+    VIDEO_THUMBNAIL_POSITIONS (the first frame when the duration is unknown).
+    Detail is the variance of the Laplacian, so fades and flat title cards
+    lose to real content; if every candidate is black the brightest wins.
+
+    Returns:
+        RGB image, or None if no frame could be read
+    """
+    info = get_video_info(video_path)
+    duration = info and info.get('duration')
+    timestamps = [duration * position for position in VIDEO_THUMBNAIL_POSITIONS] if duration else [0]
+    frames = read_video_frames(video_path, timestamps, size)
+    if not frames and duration:
+        # Containers with a wrong duration or no seek index: take the first frame
+        frames = read_video_frames(video_path, [0], size)
+
+    best, best_score = None, None
+    for _, img in frames:
+        gray = img.convert('L')
+        gray.thumbnail((320, 320))
+        pixels = np.asarray(gray)
+        brightness = pixels.mean()
+        if brightness >= VIDEO_BLACK_LEVEL:
+            score = (1, cv2.Laplacian(pixels, cv2.CV_64F).var())
+        else:
+            score = (0, brightness)
+        if best_score is None or score > best_score:
+            best, best_score = img, score
+    return best
+
 def get_image_dimensions(image_path):
-    """Get image width and height for images, or default dimensions for videos"""
+    """Get image width and height for images, or real (display) dimensions for videos"""
     file_ext = Path(image_path).suffix.lower()
     
-    # For videos, return default dimensions (will be handled by video player)
+    # For videos, fall back to default dimensions if the file cannot be probed
     if file_ext in VIDEO_EXTENSIONS:
+        info = get_video_info(image_path)
+        if info:
+            return info['width'], info['height']
         return 1920, 1080  # Default 16:9 aspect ratio
     
-    # For images, use PIL
+    # Fast path: parse the header only
+    size = probe_image_size(image_path)
+    if size:
+        return size
+    
+    # Fall back to PIL for anything the probe does not understand
     try:
         with Image.open(image_path) as img:
             return img.width, img.height
@@ -39,8 +160,62 @@ def is_video(filename):
     """Check if file is a video format"""
     return Path(filename).suffix.lower() in VIDEO_EXTENSIONS
 
-def get_all_folders(dataset_path, parent_path=''):
-    """Get all category folders from dataset (recursive for hierarchical structure)"""
+def _scan_directory(dir_path):
+    """List a directory once, returning (media filenames, visible subfolder names).
+
+    Uses the cached DirEntry type info so no extra stat calls are needed
+    for regular files and directories.
+    """
+    media = []
+    subdirs = []
+    with os.scandir(dir_path) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir():
+                    if not entry.name.startswith('.'):
+                        subdirs.append(entry.name)
+                elif is_supported_image(entry.name) and entry.is_file():
+                    media.append(entry.name)
+            except OSError:
+                continue
+    return media, subdirs
+
+def summarize_folder(dataset_path, rel_path):
+    """Build the folder summary dict for a single folder (None if it is empty)"""
+    item_path = os.path.join(dataset_path, rel_path)
+    media, subdirs = _scan_directory(item_path)
+
+    # Get first image as thumbnail
+    first_image = None
+    if media:
+        # Image is in the current folder
+        first_image = os.path.join(rel_path, min(media))
+    else:
+        # If no images in current folder, try to find first image in subfolders
+        for sub in sorted(subdirs):
+            try:
+                sub_media, _ = _scan_directory(os.path.join(item_path, sub))
+            except OSError:
+                continue
+            if sub_media:
+                first_image = os.path.join(rel_path, sub, min(sub_media))
+                break
+
+    # Include folder if it has images or subfolders
+    if not media and not subdirs:
+        return None
+
+    return {
+        'name': os.path.basename(rel_path),
+        'path': rel_path,
+        'count': len(media),
+        'has_subfolders': len(subdirs) > 0,
+        'subfolder_count': len(subdirs),
+        'thumbnail': first_image
+    }
+
+def scan_all_folders(dataset_path, parent_path=''):
+    """Get child folders of parent_path by reading the filesystem directly"""
     folders = []
     base_path = os.path.join(dataset_path, parent_path) if parent_path else dataset_path
     
@@ -48,147 +223,174 @@ def get_all_folders(dataset_path, parent_path=''):
         return folders
     
     try:
-        for item in os.listdir(base_path):
-            item_path = os.path.join(base_path, item)
-            if os.path.isdir(item_path) and not item.startswith('.'):
-                # Get relative path from dataset root
-                rel_path = os.path.join(parent_path, item) if parent_path else item
-                
-                # Count images in this directory (not recursive)
-                images = [f for f in os.listdir(item_path) 
-                         if is_supported_image(f) and os.path.isfile(os.path.join(item_path, f))]
-                image_count = len(images)
-                
-                # Get first image as thumbnail
-                first_image = None
-                if images:
-                    # Image is in the current folder
-                    first_image = os.path.join(rel_path, images[0])
-                else:
-                    # If no images in current folder, try to find first image in subfolders
-                    try:
-                        for sub in sorted(os.listdir(item_path)):
-                            sub_path = os.path.join(item_path, sub)
-                            if os.path.isdir(sub_path) and not sub.startswith('.'):
-                                sub_images = [f for f in os.listdir(sub_path)
-                                            if is_supported_image(f) and os.path.isfile(os.path.join(sub_path, f))]
-                                if sub_images:
-                                    first_image = os.path.join(rel_path, sub, sub_images[0])
-                                    break
-                    except:
-                        pass
-                
-                # Count subfolders
-                subfolder_count = sum(1 for sub in os.listdir(item_path)
-                                     if os.path.isdir(os.path.join(item_path, sub)) and not sub.startswith('.'))
-                
-                # Include folder if it has images or subfolders
-                if image_count > 0 or subfolder_count > 0:
-                    folders.append({
-                        'name': item,
-                        'path': rel_path,
-                        'count': image_count,
-                        'has_subfolders': subfolder_count > 0,
-                        'subfolder_count': subfolder_count,
-                        'thumbnail': first_image
-                    })
+        _, subdirs = _scan_directory(base_path)
+        for item in subdirs:
+            # Get relative path from dataset root
+            rel_path = os.path.join(parent_path, item) if parent_path else item
+            try:
+                summary = summarize_folder(dataset_path, rel_path)
+            except OSError as e:
+                print(f"Error reading folder {rel_path}: {e}")
+                continue
+            if summary:
+                folders.append(summary)
     except Exception as e:
         print(f"Error reading dataset: {e}")
     
     return sorted(folders, key=lambda x: x['name'])
 
-def calculate_justified_layout(images, container_width=1200, row_height=200, gap=8):
+def get_indexed_folders(parent_path=''):
     """
-    Calculate optimal image layout using justified layout algorithm.
-    This minimizes gaps between images while respecting aspect ratios.
-    
+    Get child folders of parent_path from the FolderSummary index.
+
+    Returns None when the parent has not been fully indexed yet, so the
+    caller can fall back to scanning the filesystem.
+    """
+    if not has_app_context():
+        return None
+
+    try:
+        # Parent row and its children in one indexed query
+        rows = FolderSummary.query.filter(or_(
+            FolderSummary.parent_path == parent_path,
+            FolderSummary.folder_path == parent_path
+        )).all()
+    except Exception as e:
+        print(f"Error reading folder index: {e}")
+        return None
+
+    parent = next((row for row in rows if row.folder_path == parent_path), None)
+    children = [row for row in rows if row.folder_path != parent_path]
+    if parent is None or len(children) != parent.subfolder_count:
+        return None
+
+    return [row.to_dict() for row in sorted(children, key=lambda row: row.name)
+            if row.media_count > 0 or row.subfolder_count > 0]
+
+def _load_folders(dataset_path, parent_path):
+    folders = get_indexed_folders(parent_path)
+    if folders is None:
+        folders = scan_all_folders(dataset_path, parent_path)
+    return folders
+
+def get_all_folders(dataset_path, parent_path=''):
+    """Get all category folders from dataset (recursive for hierarchical structure)"""
+    return folder_tree_cache.get(dataset_path, parent_path, _load_folders)
+
+def get_cached_layout(key, load_aspect_ratios, container_width=1200, row_height=200, gap=8, mode='greedy'):
+    """
+    Layout of a whole listing, served from layout_cache when possible.
+
     Args:
-        images: List of image dicts with width, height, filename
-        container_width: Width of container in pixels
-        row_height: Fixed height for each row
-        gap: Gap between images in pixels
-    
+        key: Cache key; must identify the listing content (e.g. folder version and sort)
+        load_aspect_ratios: Called on a miss to get the aspect-ratio array in listing order
+
     Returns:
-        List of image dicts with calculated width, height, and position
+        Tuple of (row_starts, widths, heights) int arrays
     """
-    if not images:
-        return []
-    
-    layout = []
-    current_row = []
-    current_row_width = 0
-    
-    for image in images:
-        aspect_ratio = image['width'] / image['height'] if image['height'] > 0 else 1
-        img_width = int(row_height * aspect_ratio)
-        
-        # Check if adding this image would exceed container width
-        total_width = current_row_width + img_width + (len(current_row) * gap)
-        
-        if total_width > container_width and current_row:
-            # Process current row
-            layout.extend(_justify_row(current_row, container_width, row_height, gap))
-            current_row = [image]
-            current_row_width = img_width
-        else:
-            current_row.append(image)
-            current_row_width += img_width
-    
-    # Process last row
-    if current_row:
-        layout.extend(_justify_row(current_row, container_width, row_height, gap, is_last=True))
-    
+    key = key + (mode, container_width, row_height, gap)
+    layout = layout_cache.get(key)
+    if layout is None:
+        layout = justified_layout(load_aspect_ratios(), container_width, row_height, gap, mode)
+        layout_cache.put(key, layout)
     return layout
 
-def _justify_row(row, container_width, target_height, gap, is_last=False):
-    """Justify a single row of images"""
-    if not row:
-        return []
-    
-    # Calculate total aspect ratio
-    total_aspect_ratio = sum(img['width'] / img['height'] for img in row if img['height'] > 0)
-    
-    # Calculate available width (minus gaps)
-    available_width = container_width - (len(row) - 1) * gap
-    
-    # Calculate actual height to fit all images in container width
-    actual_height = available_width / total_aspect_ratio if total_aspect_ratio > 0 else target_height
-    
-    # For last row with single image, limit width to max 400px
-    if is_last and len(row) == 1:
-        aspect_ratio = row[0]['width'] / row[0]['height'] if row[0]['height'] > 0 else 1
-        max_width = min(400, int(target_height * aspect_ratio))
-        return [{
-            **row[0],
-            'calc_width': max_width,
-            'calc_height': int(max_width / aspect_ratio)
-        }]
-    
-    # For last row, use target height or calculated height (whichever is smaller)
-    if is_last:
-        actual_height = min(actual_height, target_height)
-    
-    # Distribute width proportionally
-    result = []
-    for i, img in enumerate(row):
-        aspect_ratio = img['width'] / img['height'] if img['height'] > 0 else 1
-        img_width = int(actual_height * aspect_ratio)
-        
-        # Adjust last image width to fit exactly (but not for single image rows)
-        if i == len(row) - 1 and len(row) > 1:
-            used_width = sum(r['calc_width'] for r in result) + (len(result) * gap)
-            img_width = container_width - used_width
-        
-        result.append({
-            **img,
-            'calc_width': img_width,
-            'calc_height': int(actual_height)
-        })
-    
-    return result
+def get_folder_breakpoint_layouts(summary, sort, load_aspect_ratios, mode='greedy', row_height=200, gap=8):
+    """
+    Layouts of an indexed folder at every LAYOUT_BREAKPOINTS width, computed
+    in one pass on first use and stored in FolderLayout under the folder
+    version, so they survive restarts and are shared between processes.
+
+    Returns:
+        Tuple of (widths, heights) arrays shaped (breakpoints, files)
+    """
+    breakpoints = ','.join(str(width) for width in LAYOUT_BREAKPOINTS)
+    key = ('breakpoints', summary.folder_path, summary.version, sort, mode, breakpoints, row_height, gap)
+    layout = layout_cache.get(key)
+    if layout is not None:
+        return layout
+
+    stored = FolderLayout.query.filter_by(folder_path=summary.folder_path, sort=sort, mode=mode).first()
+    if stored and (stored.version, stored.breakpoints, stored.row_height, stored.gap) == (
+            summary.version, breakpoints, row_height, gap):
+        layout = unpack_layouts(stored.data, len(LAYOUT_BREAKPOINTS), stored.item_count)
+    else:
+        layout = breakpoint_layouts(load_aspect_ratios(), LAYOUT_BREAKPOINTS, row_height, gap, mode)
+        values = {
+            'version': summary.version,
+            'breakpoints': breakpoints,
+            'row_height': row_height,
+            'gap': gap,
+            'item_count': layout[0].shape[1],
+            'data': pack_layouts(*layout),
+            'updated_at': datetime.utcnow()
+        }
+        try:
+            if stored is None:
+                db.session.add(FolderLayout(folder_path=summary.folder_path, sort=sort, mode=mode, **values))
+            else:
+                for name, value in values.items():
+                    setattr(stored, name, value)
+            db.session.commit()
+        except Exception as e:
+            # Another request stored it first; the computed layout is still good
+            db.session.rollback()
+            print(f"Error storing folder layout: {e}")
+
+    layout_cache.put(key, layout)
+    return layout
 
-def get_folder_images(dataset_path, folder_name, page=1, per_page=30, use_layout=True):
-    """Get images from a specific folder with pagination"""
+def attach_breakpoint_sizes(images, widths, heights, start):
+    """Add [width, height] per breakpoint to images, which sit at position start of the listing"""
+    end = start + len(images)
+    if end > widths.shape[1]:
+        # Listing changed since the layouts were computed
+        return
+    for image, image_widths, image_heights in zip(images, widths[:, start:end].T.tolist(),
+                                                  heights[:, start:end].T.tolist()):
+        image['breakpoints'] = [list(size) for size in zip(image_widths, image_heights)]
+
+def _fetch_layout_page(query, per_page, key, container_width=1200, row_height=200, gap=8, mode='greedy'):
+    """
+    Fetch the next page of an ordered FileMetadata query as whole justified
+    rows holding at least per_page files. Only the page (plus look-ahead) is
+    read and laid out; the page layout is cached under key, so a repeat fetch
+    reads exactly the page's rows and skips the layout.
+
+    Returns:
+        Tuple of (rows, has_more, row_starts, widths, heights)
+    """
+    key = key + (per_page, mode, container_width, row_height, gap)
+    cached = layout_cache.get(key)
+    if cached is not None:
+        row_starts, widths, heights = cached
+        rows = query.limit(len(widths) + 1).all()
+        if len(rows) >= len(widths):
+            return rows[:len(widths)], len(rows) > len(widths), row_starts, widths, heights
+
+    # Look ahead a full page so the last row can be closed; a chunk that
+    # still ends inside its first row is grown until the row fits
+    chunk = max(1, per_page) * 2
+    while True:
+        rows = query.limit(chunk + 1).all()
+        final = len(rows) <= chunk
+        rows = rows[:chunk]
+        ratios = aspect_ratio_array([{'width': row.width, 'height': row.height} for row in rows])
+        count, row_starts, widths, heights = paged_layout(ratios, per_page, final, container_width, row_height, gap,
+                                                          mode)
+        if count or final:
+            break
+        chunk *= 2
+
+    layout_cache.put(key, (row_starts, widths, heights))
+    return rows[:count], count < len(rows) or not final, row_starts, widths, heights
+
+def get_folder_images(dataset_path, folder_name, page=1, per_page=30, use_layout=True, sort='name', offset=None,
+                      layout='greedy', container_width=1200, breakpoints=False, whole_rows=True):
+    """
+    Get images from a specific folder with pagination (offset, when given, overrides page).
+    With whole_rows, a page starting on a row start is extended to whole rows.
+    """
     folder_path = os.path.join(dataset_path, folder_name)
     
     if not os.path.exists(folder_path):
@@ -200,35 +402,222 @@ def get_folder_images(dataset_path, folder_name, page=1, per_page=30, use_layout
             if is_supported_image(filename):
                 full_path = os.path.join(folder_path, filename)
                 if os.path.isfile(full_path):
-                    width, height = get_image_dimensions(full_path)
+                    video_info = get_video_info(full_path) if is_video(filename) else None
+                    if video_info:
+                        width, height = video_info['width'], video_info['height']
+                    else:
+                        width, height = get_image_dimensions(full_path)
                     if width and height:
-                        file_size = os.path.getsize(full_path)
-                        images.append({
+                        stat = os.stat(full_path)
+                        image = {
                             'filename': filename,
                             'width': width,
                             'height': height,
                             'aspect_ratio': width / height,
-                            'file_size': file_size,
-                            'is_video': is_video(filename)
-                        })
+                            'file_size': stat.st_size,
+                            'is_video': is_video(filename),
+                            'mtime': stat.st_mtime
+                        }
+                        if video_info:
+                            image['duration'] = video_info['duration']
+                            image['fps'] = video_info['fps']
+                            image['rotation'] = video_info['rotation']
+                        images.append(image)
     except Exception as e:
         print(f"Error reading folder {folder_path}: {e}")
     
-    # Sort by filename
-    images.sort(key=lambda x: x['filename'])
+    # Sort by filename (or modification time)
+    if sort == 'modified':
+        images.sort(key=lambda x: (x['mtime'], x['filename']))
+    else:
+        images.sort(key=lambda x: x['filename'])
+    for image in images:
+        del image['mtime']
     
     total = len(images)
     
-    # Apply justified layout if requested
-    if use_layout and images:
-        images = calculate_justified_layout(images)
-    
     # Pagination
-    start = (page - 1) * per_page
+    start = offset if offset is not None else (page - 1) * per_page
     end = start + per_page
     
+    # Apply justified layout if requested; the whole listing is laid out (and cached
+    # by content) so rows line up across pages
+    if use_layout and images:
+        ratios = aspect_ratio_array(images)
+        key = ('listing', hashlib.blake2b(ratios.tobytes(), digest_size=16).digest())
+        row_starts, widths, heights = get_cached_layout(key, lambda: ratios, container_width, mode=layout)
+
+        # Pages starting on a row start (the first page and cursor pages) end on whole rows
+        row = row_starts.searchsorted(start)
+        if whole_rows and row < len(row_starts) and row_starts[row] == start:
+            next_row = row_starts.searchsorted(start + per_page)
+            end = int(row_starts[next_row]) if next_row < len(row_starts) else total
+        page_images = [dict(image, calc_width=width, calc_height=height, row=row) for image, width, height, row
+                       in zip(images[start:end], widths[start:end].tolist(), heights[start:end].tolist(),
+                              row_numbers(row_starts, start, min(end, total)).tolist())]
+
+        if breakpoints:
+            key = key + (layout, LAYOUT_BREAKPOINTS)
+            layouts = layout_cache.get(key)
+            if layouts is None:
+                layouts = breakpoint_layouts(ratios, LAYOUT_BREAKPOINTS, mode=layout)
+                layout_cache.put(key, layouts)
+            attach_breakpoint_sizes(page_images, *layouts, start)
+        return page_images, total
+    
     return images[start:end], total
 
+# Listing sort orders; both map onto existing (folder_path, column) indexes,
+# which in SQLite implicitly end with the rowid (id) used as tie-breaker
+LISTING_SORT_COLUMNS = {
+    'name': FileMetadata.filename,
+    'modified': FileMetadata.modified_at,
+}
+
+def encode_cursor(state):
+    """Encode listing position state as an opaque URL-safe cursor"""
+    raw = json.dumps(state, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor, raising ValueError when it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        state = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    if not isinstance(state, dict) or not isinstance(state.get('o', 0), int):
+        raise ValueError("Invalid cursor")
+    return state
+
+# Per-file keys that the compact form carries in the rows instead of the file columns
+COMPACT_LAYOUT_KEYS = {'calc_width', 'calc_height', 'row', 'aspect_ratio'}
+
+def compact_listing(images):
+    """
+    Row-oriented form of a laid out page, for large listings.
+
+    Returns:
+        Dict with 'files', a columnar table (one list per key, aligned by index),
+        and 'rows', a list of [height, [widths]] covering consecutive files
+    """
+    columns = []
+    for image in images:
+        columns.extend(key for key in image if key not in COMPACT_LAYOUT_KEYS and key not in columns)
+    files = {key: [image.get(key) for image in images] for key in columns}
+
+    rows = []
+    current_row = None
+    for image in images:
+        if image.get('row') != current_row or not rows:
+            current_row = image.get('row')
+            rows.append([image['calc_height'], []])
+        rows[-1][1].append(image['calc_width'])
+
+    return {'files': files, 'rows': rows}
+
+def get_indexed_folder_files(folder_name, per_page=30, cursor=None, sort='name', page=None, layout=None,
+                             container_width=1200, breakpoints=False):
+    """
+    Read one page of a folder listing from FileMetadata using keyset pagination
+    on (folder_path, sort column, id), so deep pages cost the same as the first.
+
+    Args:
+        cursor: Decoded cursor state from a previous page, or None to start
+        page: Legacy page number, only used (with OFFSET) when no cursor is given;
+              None for the first page of a cursor walk
+        layout: Row breaking mode; when given, the page gets calc_width/calc_height.
+                The first page and cursor pages are extended or cut to whole
+                justified rows (at least per_page files), cached under the
+                folder version; numbered pages hold exactly per_page files so
+                page numbers tile the listing
+        breakpoints: Also add per-breakpoint sizes from the stored folder layouts
+
+    Returns:
+        Tuple of (images, total, next cursor state or None), or None when the
+        folder has not been indexed by the scanner yet
+    """
+    if not has_app_context():
+        return None
+    summary = FolderSummary.query.filter_by(folder_path=folder_name).first()
+    if summary is None:
+        return None
+
+    sort_column = LISTING_SORT_COLUMNS[sort]
+    query = FileMetadata.query.filter(
+        FileMetadata.folder_path == folder_name,
+        FileMetadata.width.isnot(None),
+        FileMetadata.height > 0
+    )
+    # The total is counted once and carried along in the cursor
+    total = cursor['t'] if cursor and 't' in cursor else query.count()
+    listing = query.order_by(sort_column, FileMetadata.id)
+
+    offset = 0
+    if cursor and 'i' in cursor:
+        value = cursor['v']
+        if sort == 'modified':
+            value = datetime.fromisoformat(value)
+        query = query.filter(tuple_(sort_column, FileMetadata.id) > tuple_(value, cursor['i']))
+        offset = cursor['o']
+    query = query.order_by(sort_column, FileMetadata.id)
+    if cursor and 'i' not in cursor:
+        # Cursor handed out by the filesystem fallback before the folder was indexed
+        offset = cursor['o']
+        query = query.offset(offset)
+    elif not cursor and page and page > 1:
+        offset = (page - 1) * per_page
+        query = query.offset(offset)
+    numbered = page is not None and not cursor
+
+    if layout and not numbered:
+        position = (cursor['v'], cursor['i']) if cursor and 'i' in cursor else offset
+        key = ('page', folder_name, summary.version, sort, position)
+        rows, has_more, row_starts, widths, heights = _fetch_layout_page(query, per_page, key, container_width,
+                                                                         mode=layout)
+    else:
+        rows = query.limit(per_page + 1).all()
+        has_more = len(rows) > per_page
+        rows = rows[:per_page]
+        if layout:
+            # Only this page is laid out, so its last row may be partial
+            ratios = aspect_ratio_array([{'width': row.width, 'height': row.height} for row in rows])
+            row_starts, widths, heights = justified_layout(ratios, width_bucket(container_width), mode=layout)
+
+    images = [{
+        'filename': row.filename,
+        'width': row.width,
+        'height': row.height,
+        'aspect_ratio': row.width / row.height,
+        'file_size': row.file_size,
+        'is_video': row.file_type == 'video',
+        'duration': row.duration,
+        'fps': row.fps
+    } for row in rows]
+
+    if layout:
+        for image, width, height, row in zip(images, widths.tolist(), heights.tolist(),
+                                             row_numbers(row_starts, 0, len(images)).tolist()):
+            image['calc_width'] = width
+            image['calc_height'] = height
+            image['row'] = row
+
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        value = last.modified_at.isoformat() if sort == 'modified' else last.filename
+        next_cursor = {'s': sort, 'v': value, 'i': last.id, 'o': offset + len(rows), 't': total}
+
+    if layout and breakpoints and images:
+        def load_aspect_ratios():
+            sizes = listing.with_entities(FileMetadata.width, FileMetadata.height).all()
+            return aspect_ratio_array([{'width': width, 'height': height} for width, height in sizes])
+
+        widths, heights = get_folder_breakpoint_layouts(summary, sort, load_aspect_ratios, layout)
+        attach_breakpoint_sizes(images, widths, heights, offset)
+
+    return images, total, next_cursor
+
 def delete_image(dataset_path, folder_name, filename):
     """Delete an image file"""
     try:
@@ -243,6 +632,7 @@ def delete_image(dataset_path, folder_name, filename):
         
         if os.path.exists(image_path) and is_supported_image(filename):
             os.remove(image_path)
+            thumbnail_store.remove_source(os.path.relpath(image_path, dataset_path))
             
             # Remove from database if exists
             ImageMetadata.query.filter_by(
@@ -293,14 +683,329 @@ def get_breadcrumb_path(folder_path):
 
 # Background scanning and optimization functions
 
+def get_relative_folder(dataset_path, dir_path):
+    """Folder path relative to the dataset root ('' for the root itself)"""
+    rel_path = os.path.relpath(dir_path, dataset_path)
+    return '' if rel_path == '.' else rel_path
+
+def get_file_type(filename):
+    """Classify a supported file as 'image', 'video' or 'gif'"""
+    file_ext = Path(filename).suffix.lower()
+    if file_ext in VIDEO_EXTENSIONS:
+        return 'video'
+    elif file_ext == '.gif':
+        return 'gif'
+    return 'image'
+
+def index_file(dataset_path, rel_path, filename, stat=None, thumbnail=True):
+    """
+    Create or update the FileMetadata row for a single file (caller commits).
+    With thumbnail=False the thumbnail is left to the caller, e.g. a work queue.
+    """
+    filepath = os.path.join(dataset_path, rel_path, filename)
+
+    # Get file metadata
+    stat = stat or os.stat(filepath)
+    modified_time = datetime.fromtimestamp(stat.st_mtime)
+    file_type = get_file_type(filename)
+
+    # Extract dimensions and metadata
+    width, height, duration, fps = extract_file_metadata(filepath, file_type)
+
+    # Generate thumbnail
+    thumbnail_path = generate_thumbnail(filepath, dataset_path) if thumbnail else None
+
+    # Update or create database entry
+    metadata = FileMetadata.query.filter_by(
+        folder_path=rel_path,
+        filename=filename
+    ).first()
+
+    if metadata:
+        # Update existing
+        metadata.file_size = stat.st_size
+        metadata.file_type = file_type
+        metadata.width = width
+        metadata.height = height
+        metadata.duration = duration
+        metadata.fps = fps
+        metadata.thumbnail_path = thumbnail_path or metadata.thumbnail_path
+        metadata.modified_at = modified_time
+    else:
+        # Create new
+        metadata = FileMetadata(
+            folder_path=rel_path,
+            filename=filename,
+            file_type=file_type,
+            file_size=stat.st_size,
+            width=width,
+            height=height,
+            duration=duration,
+            fps=fps,
+            thumbnail_path=thumbnail_path,
+            modified_at=modified_time
+        )
+        db.session.add(metadata)
+
+    return metadata
+
+def _upsert_folder_summary(rel_path, files_changed=False, **values):
+    """
+    Create or update a FolderSummary row, bumping its version when anything
+    changed. files_changed forces a bump for edits the totals don't reveal
+    (renames, re-encoded files), since cached layouts are keyed on the version.
+    """
+    summary = FolderSummary.query.filter_by(folder_path=rel_path).first()
+    if summary is None:
+        summary = FolderSummary(
+            folder_path=rel_path,
+            parent_path=os.path.dirname(rel_path) if rel_path else None,
+            name=os.path.basename(rel_path),
+            version=1,
+            **values
+        )
+        db.session.add(summary)
+    elif files_changed or any(getattr(summary, key) != value for key, value in values.items()):
+        for key, value in values.items():
+            setattr(summary, key, value)
+        summary.version += 1
+        summary.updated_at = datetime.utcnow()
+    return summary
+
+def update_folder_summaries(folder_stats, root_folder=''):
+    """
+    Write FolderSummary rows for a scanned subtree (caller commits).
+
+    Args:
+        folder_stats: Dict of folder path -> [media_count, media_bytes, cover_name, subfolder_names]
+                      for every folder in the subtree
+        root_folder: Folder the subtree was scanned from; stale rows below it are removed
+    """
+    totals = {}
+
+    # Deepest folders first so recursive totals can be rolled up
+    depth = lambda rel_path: rel_path.count(os.sep) if rel_path else -1
+    for rel_path in sorted(folder_stats, key=depth, reverse=True):
+        media_count, media_bytes, cover_name, subdirs = folder_stats[rel_path]
+        recursive_count = media_count
+        recursive_bytes = media_bytes
+        cover = os.path.join(rel_path, cover_name) if cover_name else None
+
+        for sub in sorted(subdirs):
+            child = totals.get(os.path.join(rel_path, sub))
+            if child:
+                recursive_count += child[0]
+                recursive_bytes += child[1]
+                cover = cover or child[2]
+
+        totals[rel_path] = (recursive_count, recursive_bytes, cover)
+        _upsert_folder_summary(
+            rel_path,
+            files_changed=True,
+            media_count=media_count,
+            subfolder_count=len(subdirs),
+            recursive_media_count=recursive_count,
+            total_bytes=recursive_bytes,
+            cover_file=cover
+        )
+
+    # Drop rows for folders that no longer exist under the scanned root
+    stale = FolderSummary.query
+    if root_folder:
+        stale = stale.filter(or_(
+            FolderSummary.folder_path == root_folder,
+            FolderSummary.folder_path.startswith(root_folder + os.sep, autoescape=True)
+        ))
+    for summary in stale.all():
+        if summary.folder_path not in folder_stats:
+            db.session.delete(summary)
+
+def refresh_folder_summary(dataset_path, rel_path, include_ancestors=True, files_changed=False):
+    """
+    Recompute one folder's summary from its direct entries and its child rows
+    (caller commits). With include_ancestors, every parent up to the dataset
+    root is refreshed as well so recursive totals stay correct. files_changed
+    bumps the version of rel_path itself even if its totals are unchanged.
+    """
+    while True:
+        dir_path = os.path.join(dataset_path, rel_path) if rel_path else dataset_path
+        try:
+            media, subdirs = _scan_directory(dir_path)
+        except OSError:
+            # Folder is gone - drop its row, the parent refresh fixes the totals
+            FolderSummary.query.filter_by(folder_path=rel_path).delete()
+        else:
+            media_bytes = 0
+            for name in media:
+                try:
+                    media_bytes += os.stat(os.path.join(dir_path, name)).st_size
+                except OSError:
+                    continue
+
+            child_paths = [os.path.join(rel_path, sub) for sub in sorted(subdirs)]
+            children = {
+                row.folder_path: row for row in
+                FolderSummary.query.filter(FolderSummary.folder_path.in_(child_paths)).all()
+            } if child_paths else {}
+
+            cover = os.path.join(rel_path, min(media)) if media else None
+            recursive_count = len(media)
+            recursive_bytes = media_bytes
+            for child_path in child_paths:
+                child = children.get(child_path)
+                if child:
+                    recursive_count += child.recursive_media_count
+                    recursive_bytes += child.total_bytes
+                    cover = cover or child.cover_file
+
+            _upsert_folder_summary(
+                rel_path,
+                files_changed=files_changed,
+                media_count=len(media),
+                subfolder_count=len(subdirs),
+                recursive_media_count=recursive_count,
+                total_bytes=recursive_bytes,
+                cover_file=cover
+            )
+            db.session.flush()
+
+        if not include_ancestors or not rel_path:
+            break
+        rel_path = os.path.dirname(rel_path)
+        files_changed = False
+
+def is_file_indexed(metadata, stat):
+    """Check whether a FileMetadata row still matches the file on disk"""
+    return (metadata is not None
+            and metadata.file_size == stat.st_size
+            and metadata.modified_at == datetime.fromtimestamp(stat.st_mtime))
+
+def index_tree(dataset_path, folder_name, on_file_indexed=None):
+    """
+    Index every supported file below folder_name and rebuild its folder summaries.
+
+    Commits in batches. When on_file_indexed is given, thumbnails are not
+    generated inline; the callback receives each indexed file path instead.
+
+    Returns:
+        Tuple of (files processed, folders indexed)
+    """
+    folder_path = os.path.join(dataset_path, folder_name)
+    files_processed = 0
+    folder_stats = {}
+
+    # Walk through all files in the folder
+    for root, dirs, filenames in os.walk(folder_path):
+        # Skip hidden directories and thumbnail directory
+        dirs[:] = [d for d in dirs if not d.startswith('.') and d != '.thumbnails']
+
+        rel_path = get_relative_folder(dataset_path, root)
+        stats = folder_stats[rel_path] = [0, 0, None, list(dirs)]
+
+        for filename in filenames:
+            if is_supported_image(filename):
+                filepath = os.path.join(root, filename)
+
+                try:
+                    stat = os.stat(filepath)
+                    index_file(dataset_path, rel_path, filename, stat,
+                               thumbnail=on_file_indexed is None)
+                    if on_file_indexed:
+                        on_file_indexed(filepath)
+
+                    stats[0] += 1
+                    stats[1] += stat.st_size
+                    if stats[2] is None or filename < stats[2]:
+                        stats[2] = filename
+
+                    files_processed += 1
+
+                    # Commit in batches to avoid memory issues
+                    if files_processed % 100 == 0:
+                        db.session.commit()
+                        print(f"Processed {files_processed} files in {folder_name}")
+
+                except Exception as e:
+                    print(f"Error processing {filepath}: {e}")
+                    continue
+
+    # Folder summaries for the scanned subtree, then its ancestors
+    root_folder = get_relative_folder(dataset_path, folder_path)
+    update_folder_summaries(folder_stats, root_folder)
+    db.session.flush()
+    if root_folder:
+        refresh_folder_summary(dataset_path, os.path.dirname(root_folder))
+
+    db.session.commit()
+    folder_tree_cache.invalidate(dataset_path, root_folder, subtree=True)
+
+    return files_processed, len(folder_stats)
+
+def sync_folder_index(dataset_path, rel_path, on_file_indexed=None):
+    """
+    Reconcile the FileMetadata rows of one folder (not recursive) with the disk:
+    new or changed files are indexed, rows for vanished files are removed.
+    Refreshes the folder summary; the caller commits.
+
+    Returns:
+        Number of rows added, updated or removed
+    """
+    dir_path = os.path.join(dataset_path, rel_path) if rel_path else dataset_path
+    on_disk = {}
+    try:
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                try:
+                    if is_supported_image(entry.name) and entry.is_file():
+                        on_disk[entry.name] = entry.stat()
+                except OSError:
+                    continue
+    except OSError:
+        pass
+
+    rows = {row.filename: row for row in FileMetadata.query.filter_by(folder_path=rel_path).all()}
+    changes = 0
+
+    for filename in rows.keys() - on_disk.keys():
+        db.session.delete(rows[filename])
+        changes += 1
+
+    for filename, stat in on_disk.items():
+        if is_file_indexed(rows.get(filename), stat):
+            continue
+        try:
+            index_file(dataset_path, rel_path, filename, stat, thumbnail=on_file_indexed is None)
+        except Exception as e:
+            print(f"Error processing {os.path.join(dir_path, filename)}: {e}")
+            continue
+        if on_file_indexed:
+            on_file_indexed(os.path.join(dir_path, filename))
+        changes += 1
+
+    refresh_folder_summary(dataset_path, rel_path, files_changed=changes > 0)
+    return changes
+
+def remove_folder_index(rel_path):
+    """Delete FileMetadata and FolderSummary rows for a folder and everything below it (caller commits)"""
+    for model in (FileMetadata, FolderSummary):
+        db.session.query(model).filter(or_(
+            model.folder_path == rel_path,
+            model.folder_path.startswith(rel_path + os.sep, autoescape=True)
+        )).delete(synchronize_session=False)
+
 def scan_folder_background(dataset_path, folder_name, app=None):
-    """Scan folder in background and update database with metadata and thumbnails"""
+    """
+    Scan folder in background and update database with metadata and folder
+    summaries; thumbnails are queued as backfill for the thumbnail service
+    """
     def scan():
         # Import current_app here to avoid circular imports
         from flask import current_app
+        from .thumbnails import start_thumbnail_service
         
         # Get the app instance - either passed in or use current_app
         app_instance = app or current_app._get_current_object()
+        thumbnails = start_thumbnail_service(app_instance, dataset_path)
         
         with app_instance.app_context():
             folder_path = os.path.join(dataset_path, folder_name)
@@ -309,86 +1014,12 @@ def scan_folder_background(dataset_path, folder_name, app=None):
                 return
 
             print(f"Starting background scan of {folder_name}")
-            files_processed = 0
 
             try:
-                # Walk through all files in the folder
-                for root, dirs, filenames in os.walk(folder_path):
-                    # Skip hidden directories and thumbnail directory
-                    dirs[:] = [d for d in dirs if not d.startswith('.') and d != '.thumbnails']
-
-                    for filename in filenames:
-                        if is_supported_image(filename):
-                            rel_path = os.path.relpath(root, dataset_path)
-                            filepath = os.path.join(root, filename)
-
-                            try:
-                                # Get file metadata
-                                stat = os.stat(filepath)
-                                file_size = stat.st_size
-                                modified_time = datetime.fromtimestamp(stat.st_mtime)
-
-                                # Determine file type
-                                file_ext = Path(filename).suffix.lower()
-                                if file_ext in VIDEO_EXTENSIONS:
-                                    file_type = 'video'
-                                elif file_ext == '.gif':
-                                    file_type = 'gif'
-                                else:
-                                    file_type = 'image'
-
-                                # Extract dimensions and metadata
-                                width, height, duration, fps = extract_file_metadata(filepath, file_type)
-
-                                # Generate thumbnail
-                                thumbnail_path = generate_thumbnail(filepath, dataset_path)
-
-                                # Update or create database entry
-                                metadata = FileMetadata.query.filter_by(
-                                    folder_path=rel_path,
-                                    filename=filename
-                                ).first()
-
-                                if metadata:
-                                    # Update existing
-                                    metadata.file_size = file_size
-                                    metadata.file_type = file_type
-                                    metadata.width = width
-                                    metadata.height = height
-                                    metadata.duration = duration
-                                    metadata.fps = fps
-                                    metadata.thumbnail_path = thumbnail_path
-                                    metadata.modified_at = modified_time
-                                else:
-                                    # Create new
-                                    metadata = FileMetadata(
-                                        folder_path=rel_path,
-                                        filename=filename,
-                                        file_type=file_type,
-                                        file_size=file_size,
-                                        width=width,
-                                        height=height,
-                                        duration=duration,
-                                        fps=fps,
-                                        thumbnail_path=thumbnail_path,
-                                        modified_at=modified_time
-                                    )
-                                    db.session.add(metadata)
-
-                                files_processed += 1
-
-                                # Commit in batches to avoid memory issues
-                                if files_processed % 100 == 0:
-                                    db.session.commit()
-                                    print(f"Processed {files_processed} files in {folder_name}")
-
-                            except Exception as e:
-                                print(f"Error processing {filepath}: {e}")
-                                continue
-
-                # Final commit
-                db.session.commit()
-                print(f"Completed background scan of {folder_name}: {files_processed} files processed")
+                files_processed, folders_indexed = index_tree(dataset_path, folder_name,
+                                                              on_file_indexed=thumbnails.submit)
+                print(f"Completed background scan of {folder_name}: {files_processed} files processed, "
+                      f"{folders_indexed} folders indexed")
 
             except Exception as e:
                 print(f"Error during background scan of {folder_name}: {e}")
@@ -404,17 +1035,14 @@ def extract_file_metadata(filepath, file_type):
 
     try:
         if file_type == 'video':
-            # Use OpenCV for video metadata
-            cap = cv2.VideoCapture(filepath)
-            if cap.isOpened():
-                width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-                height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-                fps = cap.get(cv2.CAP_PROP_FPS)
-                frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-                duration = frame_count / fps if fps and fps > 0 else None
-                cap.release()
+            info = get_video_info(filepath)
+            if info:
+                width, height = info['width'], info['height']
+                duration, fps = info['duration'], info['fps']
+        elif file_type == 'image':
+            width, height = get_image_dimensions(filepath)
         else:
-            # Use PIL for images and GIFs
+            # Use PIL for GIFs
             with Image.open(filepath) as img:
                 width, height = img.size
                 # For animated GIFs, try to get duration
@@ -426,68 +1054,337 @@ def extract_file_metadata(filepath, file_type):
 
     return width, height, duration, fps
 
-def generate_thumbnail(filepath, dataset_path):
-    """Generate thumbnail and return relative path"""
+# Long-edge sizes of the thumbnail ladder, all written from one decode
+THUMBNAIL_SIZES = (160, 320, 640, 1280)
+DEFAULT_THUMBNAIL_SIZE = 320
+
+# Part of every thumbnail key; bump when rendering changes so stored thumbnails are regenerated
+THUMBNAIL_VERSION = 3
+
+# Thumbnail encodings: (Pillow format, file extension, MIME type, save options)
+THUMBNAIL_ENCODINGS = {
+    'avif': ('AVIF', 'avif', 'image/avif', {'quality': 60}),
+    'webp': ('WEBP', 'webp', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg', {'quality': 85}),
+}
+
+def _enabled_thumbnail_formats():
+    """Formats from THUMBNAIL_FORMATS that this Pillow build can encode; JPEG is always included"""
+    requested = [name.strip().lower() for name in os.getenv('THUMBNAIL_FORMATS', 'jpeg').split(',')]
+    formats = [name for name in THUMBNAIL_ENCODINGS
+               if name in requested and name != 'jpeg' and features.check(name)]
+    return tuple(formats) + ('jpeg',)
+
+# Most preferred first; JPEG is the fallback every client accepts
+THUMBNAIL_FORMATS = _enabled_thumbnail_formats()
+
+def negotiate_thumbnail_format(accept_mimetypes):
+    """
+    Pick the first enabled thumbnail format the client lists explicitly in
+    its Accept header (wildcards don't count, so old clients get JPEG).
+
+    Args:
+        accept_mimetypes: Iterable of (mimetype, quality) pairs, e.g. request.accept_mimetypes
+    """
+    accepted = {mimetype for mimetype, quality in accept_mimetypes if quality > 0}
+    for name in THUMBNAIL_FORMATS:
+        if THUMBNAIL_ENCODINGS[name][2] in accepted:
+            return name
+    return 'jpeg'
+
+def thumbnail_size(requested):
+    """Smallest ladder size covering the requested size (the largest one for bigger requests)"""
+    for size in THUMBNAIL_SIZES:
+        if size >= requested:
+            return size
+    return THUMBNAIL_SIZES[-1]
+
+def thumbnail_paths(filepath, dataset_path, fmt='jpeg'):
+    """
+    Path in the thumbnail store of every ladder size of a file's thumbnail in
+    one format, keyed by size. Paths include the source mtime, so they change
+    with the file. Raises OSError if the file is missing.
+    """
     rel_path = os.path.relpath(filepath, dataset_path)
-    file_dir = os.path.dirname(rel_path)
-    filename = os.path.basename(rel_path)
-
-    # Create thumbnails directory
-    thumb_dir = os.path.join(dataset_path, file_dir, '.thumbnails')
-    os.makedirs(thumb_dir, exist_ok=True)
-
-    # Generate thumbnail filename
-    name, ext = os.path.splitext(filename)
-    thumb_filename = f"{name}_thumb.jpg"
-    thumb_path = os.path.join(thumb_dir, thumb_filename)
-
-    # Check if thumbnail already exists and is up to date
-    if os.path.exists(thumb_path):
-        thumb_mtime = os.path.getmtime(thumb_path)
-        file_mtime = os.path.getmtime(filepath)
-        if thumb_mtime >= file_mtime:
-            # Thumbnail is up to date
-            return os.path.relpath(thumb_path, dataset_path)
+    mtime_ns = os.stat(filepath).st_mtime_ns
+    suffix = THUMBNAIL_ENCODINGS[fmt][1]
+    return {size: thumbnail_store.path(thumbnail_store.key(rel_path, size, mtime_ns, f"{fmt}.v{THUMBNAIL_VERSION}"), suffix)
+            for size in THUMBNAIL_SIZES}
+
+def thumbnail_srcset(rel_path, width, height):
+    """
+    srcset value with every ladder size of a file's thumbnail and its pixel width.
+    With unknown dimensions every size is listed with its long edge as the width.
+    """
+    long_edge = max(width or 0, height or 0)
+    url = f"/api/thumb/{quote(rel_path)}"
+    entries = []
+    for size in THUMBNAIL_SIZES:
+        scale = min(1.0, size / long_edge) if long_edge else 1.0
+        entries.append(f"{url}?size={size} {max(1, round(width * scale)) if width else size}w")
+        if long_edge and scale == 1.0:
+            # Thumbnails are never upscaled, so larger sizes are the same image
+            break
+    return ', '.join(entries)
+
+# Sources that would decode to more pixels are not thumbnailed. JPEGs count at their draft
+# (reduced) decode size; PNG/BMP/GIF/WebP are decoded whole, so this bounds their memory
+THUMBNAIL_MAX_PIXELS = int(os.getenv('THUMBNAIL_MAX_PIXELS', 250_000_000))
+
+# Transpose that displays an image upright for each EXIF orientation (as ImageOps.exif_transpose)
+EXIF_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+# Pillow opens camera JPEGs with a Multi-Picture (MPF) preview as MPO
+_JPEG_FORMATS = ('JPEG', 'MPO')
+
+# Largest aspect ratio difference between an embedded preview and its image (letterboxed previews are skipped)
+_PREVIEW_ASPECT_TOLERANCE = 0.02
+
+def open_for_thumbnail(filepath, size):
+    """
+    Decode an image at the smallest scale that still covers size on the long
+    edge, then resample it to fit within size x size and turn it upright per
+    its EXIF orientation.
+
+    Camera JPEGs embed smaller copies of the photo (the EXIF thumbnail and
+    MPF preview images); the smallest one covering size is decoded instead
+    of the full image. Otherwise JPEGs are decoded at 1/2, 1/4 or 1/8 scale
+    in the DCT domain (draft), so the full-resolution pixels never exist in
+    memory. Other formats have no reduced decode: they are decoded whole (peak
+    memory is the full bitmap) and only the resample is sped up, by a cheap
+    box reduce that keeps a 2x margin for quality.
+
+    Returns:
+        RGB or L image, or None when the decode would exceed THUMBNAIL_MAX_PIXELS
+    """
+    with _open_for_thumbnail_decode(filepath) as source:
+        width, height = source.size
+        orientation = source.getexif().get(ExifTags.Base.Orientation, 1)
+
+        preview = embedded_preview(source, size) if source.format in _JPEG_FORMATS else None
+        img = _decode_scaled(preview or source, size)
+        if img is None:
+            print(f"Skipping thumbnail for {filepath}: {width}x{height} decodes to more than THUMBNAIL_MAX_PIXELS")
+            return None
+
+    method = EXIF_TRANSPOSE.get(orientation)
+    return img.transpose(method) if method else img
+
+def _open_for_thumbnail_decode(filepath):
+    """
+    Image.open, except that JPEGs over Pillow's decompression bomb limit are
+    still opened: draft() decodes them at reduced size, and _decode_scaled
+    checks THUMBNAIL_MAX_PIXELS against that size instead
+    """
+    try:
+        return Image.open(filepath)
+    except Image.DecompressionBombError:
+        with open(filepath, 'rb') as f:
+            if f.read(3) != b'\xff\xd8\xff':
+                raise
+        # The plugin constructor skips the check that Image.open applies to the full size
+        return JpegImagePlugin.jpeg_factory(filepath)
+
+def embedded_preview(source, size):
+    """
+    Smallest image embedded in an open JPEG, the EXIF thumbnail or an MPF
+    preview, that covers size on the long edge and has the aspect ratio of
+    the full image. Previews share the full image's EXIF orientation.
+
+    Returns:
+        Image (an MPF preview is selected by seeking source), or None
+    """
+    frames = getattr(source, 'n_frames', 1)
+    if frames > 1:
+        source.seek(0)
+    width, height = source.size
+    candidates = []  # (width, height, image or MPF frame number)
+
+    exif = source.info.get('exif', b'')
+    thumbnail = source.getexif().get_ifd(ExifTags.IFD.IFD1)
+    offset, length = thumbnail.get(0x0201), thumbnail.get(0x0202)
+    if exif.startswith(b'Exif\x00\x00') and offset and length:
+        # Offsets are relative to the TIFF header after the 'Exif' marker
+        try:
+            image = Image.open(io.BytesIO(exif[6 + offset:6 + offset + length]))
+            candidates.append((*image.size, image))
+        except OSError:
+            pass
+
+    for frame in range(1, frames):
+        source.seek(frame)
+        candidates.append((*source.size, frame))
+    if frames > 1:
+        source.seek(0)
 
+    usable = [(w * h, w, h, preview) for w, h, preview in candidates
+              if w and h and max(w, h) >= size and w * h < width * height
+              and abs(w / h - width / height) <= width / height * _PREVIEW_ASPECT_TOLERANCE]
+    if not usable:
+        return None
+    preview = min(usable, key=lambda candidate: candidate[0])[3]
+    if isinstance(preview, int):
+        source.seek(preview)
+        return source
+    return preview
+
+def _decode_scaled(source, size):
+    """
+    Decode source (draft for JPEGs, box reduce otherwise) and resample it to
+    fit within size x size; None when the decode exceeds THUMBNAIL_MAX_PIXELS
+    """
+    width, height = source.size
+    is_jpeg = source.format in _JPEG_FORMATS
+    scale = min(1.0, size / max(width, height, 1))
+    box = (max(1, round(width * scale)), max(1, round(height * scale)))
+
+    if is_jpeg:
+        source.draft('RGB' if source.mode == 'RGB' else None, box)
+    # draft() has shrunk a JPEG's size to its reduced decode size
+    if source.width * source.height > THUMBNAIL_MAX_PIXELS:
+        return None
+    img = source.convert('RGB') if source.mode not in ('RGB', 'L') else source
+    img.load()
+
+    if not is_jpeg:
+        factor = min(img.width // box[0], img.height // box[1]) // 2
+        if factor >= 2:
+            img = img.reduce(factor)
+    if img.size != box:
+        img = img.resize(box, Image.Resampling.LANCZOS)
+    return img
+
+def thumbnail_ready(filepath, dataset_path):
+    """True when every size and format of the current version of a file's thumbnail is in the store"""
+    try:
+        return all(os.path.exists(path)
+                   for fmt in THUMBNAIL_FORMATS
+                   for path in thumbnail_paths(filepath, dataset_path, fmt).values())
+    except OSError:
+        return False
+
+def generate_thumbnail(filepath, dataset_path, size=DEFAULT_THUMBNAIL_SIZE, fmt='jpeg'):
+    """
+    Generate the thumbnail ladder (THUMBNAIL_SIZES on the long edge) of an
+    image or video from a single decode, each size downscaled from the next
+    larger one and saved in every format of THUMBNAIL_FORMATS. Returns the
+    path of the requested size and format relative to the thumbnail store.
+
+    Concurrent calls for the same file, from any thread or process, are
+    coalesced: one generates the ladder while the others wait for it.
+    """
+    try:
+        ladders = {name: thumbnail_paths(filepath, dataset_path, name) for name in THUMBNAIL_FORMATS}
+        mtime_ns = os.stat(filepath).st_mtime_ns
+    except OSError:
+        return None
+    thumb_path = thumbnail_paths(filepath, dataset_path, fmt)[thumbnail_size(size)]
+    ladder_paths = [path for paths in ladders.values() for path in paths.values()]
+    if all(os.path.exists(path) for path in ladder_paths):
+        return thumbnail_store.relative(thumb_path)
+
+    source = os.path.relpath(filepath, dataset_path)
+    with thumbnail_store.single_flight(thumbnail_store.key(source, 'ladder', mtime_ns, f"all.v{THUMBNAIL_VERSION}")):
+        # Another thread or process may have finished it while we waited
+        if not all(os.path.exists(path) for path in ladder_paths):
+            _write_thumbnail_ladder(filepath, ladders, source, mtime_ns)
+
+    return thumbnail_store.relative(thumb_path) if os.path.exists(thumb_path) else None
+
+def _write_thumbnail_ladder(filepath, ladders, source, mtime_ns):
+    """Decode filepath once and write every size and format of its thumbnail (atomically) into the store"""
     try:
         file_ext = Path(filepath).suffix.lower()
 
         if file_ext in VIDEO_EXTENSIONS:
-            # Extract first frame for video thumbnail
-            cap = cv2.VideoCapture(filepath)
-            if cap.isOpened():
-                ret, frame = cap.read()
-                if ret:
-                    # Convert BGR to RGB
-                    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    img = Image.fromarray(frame_rgb)
-                    img.thumbnail((300, 300))
-                    img.save(thumb_path, 'JPEG', quality=85)
-                cap.release()
+            img = representative_video_frame(filepath, THUMBNAIL_SIZES[-1])
+            if img is None:
+                return
         else:
             # Process image/GIF
-            with Image.open(filepath) as img:
-                # Convert to RGB if necessary
-                if img.mode in ('RGBA', 'LA', 'P'):
-                    img = img.convert('RGB')
-
-                img.thumbnail((300, 300))
-                img.save(thumb_path, 'JPEG', quality=85)
+            img = open_for_thumbnail(filepath, THUMBNAIL_SIZES[-1])
+            if img is None:
+                return
 
-        return os.path.relpath(thumb_path, dataset_path)
+        # Largest first, each size scaled down from the previous one
+        for ladder_size in sorted(THUMBNAIL_SIZES, reverse=True):
+            img.thumbnail((ladder_size, ladder_size))
+            for name, paths in ladders.items():
+                pil_format, _, _, options = THUMBNAIL_ENCODINGS[name]
+                with thumbnail_store.atomic_write(paths[ladder_size]) as temp_path:
+                    img.save(temp_path, pil_format, **options)
+                thumbnail_store.add(paths[ladder_size], source, mtime_ns)
 
     except Exception as e:
         print(f"Error generating thumbnail for {filepath}: {e}")
-        return None
 
-def get_folder_files_cached(dataset_path, folder_name, page=1, per_page=30):
-    """Get files with pagination - uses file system to avoid database locks"""
+def get_folder_files_cached(dataset_path, folder_name, page=None, per_page=30, cursor=None, sort='name', layout='greedy',
+                            container_width=1200, breakpoints=False):
+    """
+    Get one page of files for a folder, laid out as justified rows.
+
+    Reads the page from the FileMetadata index when the folder has been
+    scanned and falls back to the filesystem otherwise. The first page and
+    cursor pages hold whole rows (at least per_page files, fewer at the end),
+    and the cursor resumes at the next row start, so pages append seamlessly.
+    Numbered pages hold exactly per_page files, so walking page numbers
+    returns every file once.
+
+    Args:
+        page: Legacy page number; None for the first page of a cursor walk
+        cursor: Opaque cursor from a previous call (takes precedence over page)
+        sort: 'name' or 'modified'
+        layout: Row breaking mode, 'greedy' or 'optimal'
+        container_width: Layout width in pixels, snapped to a width bucket
+        breakpoints: Add a 'breakpoints' list of [width, height] per LAYOUT_BREAKPOINTS
+                     width to every file, so the client can pick one without relaying out
+
+    Returns:
+        Tuple of (images, total, next cursor or None)
+
+    Raises:
+        ValueError: If the cursor, sort order or layout mode is invalid
+    """
+    if sort not in LISTING_SORT_COLUMNS:
+        raise ValueError(f"Invalid sort: {sort}")
+    if layout not in LAYOUT_MODES:
+        raise ValueError(f"Invalid layout: {layout}")
+    container_width = width_bucket(container_width)
+    state = decode_cursor(cursor) if cursor else None
+    if state and state.get('s', sort) != sort:
+        raise ValueError("Cursor does not match sort order")
+
     try:
-        # Use file-based approach to avoid database locks
-        return get_folder_images(dataset_path, folder_name, page, per_page, use_layout=True)
+        result = get_indexed_folder_files(folder_name, per_page, state, sort, page, layout, container_width,
+                                          breakpoints)
+        if result is not None:
+            images, total, next_state = result
+            for image in images:
+                if image['is_video']:
+                    # Stored sizes are already display-oriented; rotation comes from the cached probe
+                    info = probe_video(os.path.join(dataset_path, folder_name, image['filename']))
+                    image['rotation'] = info['rotation'] if info else 0
+            return images, total, encode_cursor(next_state) if next_state else None
+
+        # Folder not scanned yet - read it from the filesystem
+        offset = state['o'] if state else ((page or 1) - 1) * per_page
+        images, total = get_folder_images(dataset_path, folder_name, per_page=per_page, use_layout=True,
+                                          sort=sort, offset=offset, layout=layout, container_width=container_width,
+                                          breakpoints=breakpoints, whole_rows=page is None or state is not None)
+        offset += len(images)
+        next_cursor = encode_cursor({'s': sort, 'o': offset}) if offset < total else None
+        return images, total, next_cursor
     except Exception as e:
         print(f"Error in get_folder_files_cached: {e}")
         import traceback
         traceback.print_exc()
         # Return empty result on error
-        return [], 0
+        return [], 0, None
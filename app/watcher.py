@@ -0,0 +1,367 @@
+"""
+Filesystem watcher that keeps the index in sync with DATASET_PATH.
+
+On Linux it uses inotify (through ctypes, no extra dependency) to track
+create, delete, move and close-write events. Events are debounced and
+applied in batches to FileMetadata/FolderSummary, the folder tree cache is
+invalidated and thumbnails are queued as backfill for the thumbnail service.
+
+When inotify is unavailable or the watch limit (fs.inotify.max_user_watches)
+is exhausted, the watcher falls back to polling directory mtimes.
+
+Enable with WATCH_DATASET=1.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import fcntl
+import os
+import select
+import struct
+import threading
+import time
+
+from . import db
+from .folder_cache import folder_tree_cache
+from .thumbnail_store import thumbnail_store
+from .thumbnails import start_thumbnail_service
+from .utils import (
+    index_file, index_tree, is_file_indexed, is_supported_image,
+    refresh_folder_summary, remove_folder_index, sync_folder_index, get_relative_folder
+)
+from .models import FileMetadata
+
+# inotify event flags (see <sys/inotify.h>)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_ONLYDIR
+EVENT_HEADER = struct.Struct('iIII')
+
+class WatchLimitReached(Exception):
+    """Raised when the kernel refuses more inotify watches"""
+
+class Inotify:
+    """Minimal ctypes wrapper around the Linux inotify API"""
+
+    def __init__(self):
+        libc_name = ctypes.util.find_library('c') or 'libc.so.6'
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                raise WatchLimitReached(path)
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def rm_watch(self, wd):
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self, timeout):
+        """Wait up to timeout seconds and return a list of (wd, mask, cookie, name)"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            events.append((wd, mask, cookie, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+class DatasetWatcher:
+    """Watches the dataset tree and applies changes to the index in debounced batches"""
+
+    def __init__(self, app, dataset_path, debounce=1.0, max_delay=10.0, poll_interval=30.0):
+        self.app = app
+        self.dataset_path = os.path.abspath(dataset_path)
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.thumbnails = start_thumbnail_service(app, self.dataset_path)
+        self.mode = None
+        self._inotify = None
+        self._watches = {}  # wd -> folder path relative to dataset root
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='dataset-watcher', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        try:
+            self._inotify = Inotify()
+            self._watch_tree('')
+            self.mode = 'inotify'
+        except (OSError, AttributeError, WatchLimitReached) as e:
+            # AttributeError: libc without inotify (non-Linux)
+            print(f"inotify unavailable ({e}), falling back to mtime polling every {self.poll_interval}s")
+            self._close_inotify()
+            self.mode = 'polling'
+
+        print(f"Watching {self.dataset_path} ({self.mode})")
+        if self.mode == 'inotify':
+            self._inotify_loop()
+        if self.mode == 'polling':
+            self._poll_loop()
+
+    # ---------- inotify mode ----------
+
+    def _close_inotify(self):
+        if self._inotify:
+            self._inotify.close()
+        self._inotify = None
+        self._watches.clear()
+
+    def _watch_tree(self, rel_path):
+        """Add watches for rel_path and every visible folder below it"""
+        top = os.path.join(self.dataset_path, rel_path) if rel_path else self.dataset_path
+        for root, dirs, _ in os.walk(top):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            try:
+                wd = self._inotify.add_watch(root)
+            except OSError:
+                # Removed, replaced or unreadable since listed; only the dataset root itself is fatal
+                if not rel_path and root == top:
+                    raise
+                continue
+            self._watches[wd] = get_relative_folder(self.dataset_path, root)
+
+    def _unwatch_tree(self, rel_path):
+        for wd, path in list(self._watches.items()):
+            if path == rel_path or path.startswith(rel_path + os.sep):
+                self._inotify.rm_watch(wd)
+                del self._watches[wd]
+
+    def _inotify_loop(self):
+        batch = _Batch()
+        first_event = last_event = None
+
+        while not self._stop.is_set():
+            events = self._inotify.read_events(self.debounce)
+            now = time.monotonic()
+
+            try:
+                for wd, mask, _, name in events:
+                    self._collect(batch, wd, mask, name)
+            except WatchLimitReached:
+                self._fall_back_to_polling(batch)
+                return
+
+            if events:
+                first_event = first_event or now
+                last_event = now
+
+            # Apply once events have settled, or when a busy tree has waited too long
+            if batch and (now - last_event >= self.debounce or now - first_event >= self.max_delay):
+                self._apply(batch)
+                batch = _Batch()
+                first_event = last_event = None
+
+    def _fall_back_to_polling(self, batch):
+        """
+        Switch to polling when the watch limit is hit. The rest of the events
+        are dropped and polling starts from a fresh baseline, so every watched
+        folder is reconciled first.
+        """
+        print("inotify watch limit reached, falling back to mtime polling")
+        for folder in self._watches.values():
+            if os.path.isdir(os.path.join(self.dataset_path, folder)):
+                batch.dirty_folders.add(folder)
+            else:
+                batch.removed_dirs.add(folder)
+        self._close_inotify()
+        self.mode = 'polling'
+        self._apply(batch)
+
+    def _collect(self, batch, wd, mask, name):
+        if mask & IN_Q_OVERFLOW:
+            # Events were dropped - reconcile every watched folder
+            batch.dirty_folders.update(self._watches.values())
+            return
+
+        if mask & IN_IGNORED:
+            self._watches.pop(wd, None)
+            return
+
+        folder = self._watches.get(wd)
+        if folder is None or not name or name.startswith('.'):
+            return
+        rel_path = os.path.join(folder, name) if folder else name
+
+        if mask & IN_ISDIR:
+            if mask & (IN_DELETE | IN_MOVED_FROM):
+                self._unwatch_tree(rel_path)
+                batch.removed_dirs.add(rel_path)
+                batch.new_dirs.discard(rel_path)
+            elif mask & (IN_CREATE | IN_MOVED_TO):
+                # Recorded first, so the folder is indexed even if watching it hits the limit
+                batch.new_dirs.add(rel_path)
+                self._watch_tree(rel_path)
+        elif is_supported_image(name) and mask & (IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE):
+            # IN_CREATE is ignored for files: the data is complete on IN_CLOSE_WRITE
+            batch.files.add((folder, name))
+
+    # ---------- polling mode ----------
+
+    def _snapshot(self):
+        """Map every visible folder to its mtime"""
+        mtimes = {}
+        for root, dirs, _ in os.walk(self.dataset_path):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            try:
+                mtimes[get_relative_folder(self.dataset_path, root)] = os.stat(root).st_mtime_ns
+            except OSError:
+                continue
+        return mtimes
+
+    def _poll_loop(self):
+        previous = self._snapshot()
+        while not self._stop.wait(self.poll_interval):
+            current = self._snapshot()
+            batch = _Batch()
+            batch.removed_dirs = {path for path in previous if path not in current}
+            batch.dirty_folders = {path for path, mtime in current.items() if previous.get(path) != mtime}
+            if batch:
+                self._apply(batch)
+            previous = current
+
+    # ---------- applying changes ----------
+
+    def _apply(self, batch):
+        touched = set()
+        changed = set()
+        thumbnails = []
+
+        with self.app.app_context():
+            try:
+                for rel_path in sorted(batch.removed_dirs):
+                    remove_folder_index(rel_path)
+                    touched.add(os.path.dirname(rel_path))
+
+                for rel_path in sorted(batch.new_dirs):
+                    if os.path.isdir(os.path.join(self.dataset_path, rel_path)):
+                        index_tree(self.dataset_path, rel_path, on_file_indexed=thumbnails.append)
+
+                for folder, filename in sorted(batch.files):
+                    if self._apply_file(folder, filename):
+                        thumbnails.append(os.path.join(self.dataset_path, folder, filename))
+                    touched.add(folder)
+                    changed.add(folder)
+
+                for folder in sorted(batch.dirty_folders):
+                    sync_folder_index(self.dataset_path, folder, on_file_indexed=thumbnails.append)
+                    touched.add(folder)
+
+                db.session.flush()
+                for folder in sorted(touched - batch.dirty_folders, key=len, reverse=True):
+                    refresh_folder_summary(self.dataset_path, folder, files_changed=folder in changed)
+
+                db.session.commit()
+            except Exception as e:
+                print(f"Error applying filesystem changes: {e}")
+                db.session.rollback()
+
+        for folder in touched | batch.new_dirs:
+            folder_tree_cache.invalidate(self.dataset_path, folder, subtree=True)
+
+        # Queued after the commit so the worker finds the new rows
+        for filepath in thumbnails:
+            self.thumbnails.submit(filepath)
+
+    def _apply_file(self, folder, filename):
+        """Index, update or remove one file; returns True when it needs a thumbnail"""
+        filepath = os.path.join(self.dataset_path, folder, filename)
+        metadata = FileMetadata.query.filter_by(folder_path=folder, filename=filename).first()
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            # Deleted or moved away
+            if metadata:
+                db.session.delete(metadata)
+            thumbnail_store.remove_source(os.path.join(folder, filename))
+            return False
+
+        if is_file_indexed(metadata, stat):
+            return False
+        try:
+            index_file(self.dataset_path, folder, filename, stat, thumbnail=False)
+        except Exception as e:
+            print(f"Error processing {filepath}: {e}")
+            return False
+        return True
+
+class _Batch:
+    """Changes collected between two debounced applies"""
+
+    def __init__(self):
+        self.files = set()          # (folder, filename) created, written, moved or deleted
+        self.new_dirs = set()       # folders created or moved in
+        self.removed_dirs = set()   # folders deleted or moved out
+        self.dirty_folders = set()  # folders to reconcile in full
+
+    def __bool__(self):
+        return bool(self.files or self.new_dirs or self.removed_dirs or self.dirty_folders)
+
+_watcher = None
+_lock_file = None
+
+def start_watcher(app, dataset_path):
+    """
+    Start the dataset watcher for this host, unless another process (e.g. a
+    sibling gunicorn worker) already runs it. Returns the watcher or None.
+    """
+    global _watcher, _lock_file
+    if _watcher is not None:
+        return _watcher
+
+    lock_path = os.path.join(app.root_path, '..', '.watcher.lock')
+    lock_file = open(lock_path, 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+
+    _lock_file = lock_file
+    _watcher = DatasetWatcher(
+        app,
+        dataset_path,
+        debounce=float(os.getenv('WATCH_DEBOUNCE', 1.0)),
+        poll_interval=float(os.getenv('WATCH_POLL_INTERVAL', 30.0))
+    ).start()
+    return _watcher
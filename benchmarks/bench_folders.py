@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Folder summary benchmark: legacy listdir-based get_all_folders vs the
+single-pass scandir summarizer.
+
+Builds a synthetic tree of ~5k folders and reports filesystem calls and
+latency for a home page style listing (top level) and a deep listing.
+
+Usage: python benchmarks/bench_folders.py [--top 50] [--sub 100] [--files 5] [--repeat 5]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# Add the project root to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.utils import scan_all_folders, is_supported_image
+
+COUNTED_CALLS = ('stat', 'lstat', 'listdir', 'scandir')
+
+def legacy_get_all_folders(dataset_path, parent_path=''):
+    """Original implementation, kept here as the benchmark baseline"""
+    folders = []
+    base_path = os.path.join(dataset_path, parent_path) if parent_path else dataset_path
+    if not os.path.exists(base_path):
+        return folders
+    for item in os.listdir(base_path):
+        item_path = os.path.join(base_path, item)
+        if os.path.isdir(item_path) and not item.startswith('.'):
+            rel_path = os.path.join(parent_path, item) if parent_path else item
+            images = [f for f in os.listdir(item_path)
+                      if is_supported_image(f) and os.path.isfile(os.path.join(item_path, f))]
+            first_image = None
+            if images:
+                first_image = os.path.join(rel_path, images[0])
+            else:
+                for sub in sorted(os.listdir(item_path)):
+                    sub_path = os.path.join(item_path, sub)
+                    if os.path.isdir(sub_path) and not sub.startswith('.'):
+                        sub_images = [f for f in os.listdir(sub_path)
+                                      if is_supported_image(f) and os.path.isfile(os.path.join(sub_path, f))]
+                        if sub_images:
+                            first_image = os.path.join(rel_path, sub, sub_images[0])
+                            break
+            subfolder_count = sum(1 for sub in os.listdir(item_path)
+                                  if os.path.isdir(os.path.join(item_path, sub)) and not sub.startswith('.'))
+            if images or subfolder_count > 0:
+                folders.append({
+                    'name': item,
+                    'path': rel_path,
+                    'count': len(images),
+                    'has_subfolders': subfolder_count > 0,
+                    'subfolder_count': subfolder_count,
+                    'thumbnail': first_image
+                })
+    return sorted(folders, key=lambda x: x['name'])
+
+def build_tree(root, top, sub, files):
+    """Create top x sub folders; top-level folders only hold subfolders"""
+    for t in range(top):
+        top_dir = os.path.join(root, f"album_{t:03d}")
+        for s in range(sub):
+            sub_dir = os.path.join(top_dir, f"event_{s:03d}")
+            os.makedirs(sub_dir)
+            for f in range(files):
+                open(os.path.join(sub_dir, f"IMG_{f:04d}.jpg"), 'wb').close()
+            open(os.path.join(sub_dir, 'notes.txt'), 'wb').close()
+    # A few top-level folders with direct images as well
+    for t in range(0, top, 10):
+        open(os.path.join(root, f"album_{t:03d}", 'cover.jpg'), 'wb').close()
+
+def count_calls(func, *args):
+    """Run func once and count the filesystem calls it makes"""
+    counts = dict.fromkeys(COUNTED_CALLS, 0)
+    originals = {name: getattr(os, name) for name in COUNTED_CALLS}
+
+    def wrap(name):
+        original = originals[name]
+        def counted(*a, **kw):
+            counts[name] += 1
+            return original(*a, **kw)
+        return counted
+
+    for name in COUNTED_CALLS:
+        setattr(os, name, wrap(name))
+    try:
+        result = func(*args)
+    finally:
+        for name, original in originals.items():
+            setattr(os, name, original)
+    return result, counts
+
+def time_calls(func, args, repeat):
+    """Best-of-N wall clock time in milliseconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--top', type=int, default=50, help='top-level folders')
+    parser.add_argument('--sub', type=int, default=100, help='subfolders per top-level folder')
+    parser.add_argument('--files', type=int, default=5, help='images per leaf folder')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='gallery_bench_')
+    try:
+        print(f"📁 Building {args.top * args.sub} folders in {root}...")
+        build_tree(root, args.top, args.sub, args.files)
+
+        cases = [('home (parent="")', ''), ('album (parent="album_000")', 'album_000')]
+        for label, parent in cases:
+            legacy, legacy_counts = count_calls(legacy_get_all_folders, root, parent)
+            current, current_counts = count_calls(scan_all_folders, root, parent)
+
+            # Covers are picked in listdir order by the legacy code, so compare the rest
+            strip = lambda folders: [{k: v for k, v in f.items() if k != 'thumbnail'} for f in folders]
+            assert strip(legacy) == strip(current), f"Result mismatch for {label}"
+
+            legacy_ms = time_calls(legacy_get_all_folders, (root, parent), args.repeat)
+            current_ms = time_calls(scan_all_folders, (root, parent), args.repeat)
+
+            print(f"\n{label}: {len(current)} folders")
+            print(f"  {'':10} {'calls':>8} {'stat':>8} {'listdir':>8} {'scandir':>8} {'ms':>9}")
+            for name, counts, ms in (('legacy', legacy_counts, legacy_ms),
+                                     ('scandir', current_counts, current_ms)):
+                total = sum(counts.values())
+                print(f"  {name:10} {total:8d} {counts['stat'] + counts['lstat']:8d} "
+                      f"{counts['listdir']:8d} {counts['scandir']:8d} {ms:9.2f}")
+            print(f"  speedup: {legacy_ms / current_ms:.1f}x, "
+                  f"calls: {sum(legacy_counts.values()) / max(1, sum(current_counts.values())):.1f}x fewer")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Justified layout benchmark suite.
+
+Generates synthetic folders from several aspect-ratio distributions (camera
+shots, phone portraits, panoramas and mixes with zero-height entries), runs
+every layout engine at several folder sizes and reports throughput, peak
+memory and a layout quality score (row height deviation from the target).
+Checks first that the breakpoint engine agrees exactly with single-width layouts.
+
+Results can be written as JSON and compared against an earlier run.
+
+Usage: python benchmarks/bench_layout.py [--sizes 1000,10000,100000] [--distributions mixed,camera]
+                                         [--engines arrays,optimal] [--repeat 5] [--json out.json]
+                                         [--compare baseline.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+# Add the project root to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.layout import LAYOUT_BREAKPOINTS, aspect_ratio_array, breakpoint_layouts, justified_layout, paged_layout
+
+CONTAINER_WIDTH = 1200
+ROW_HEIGHT = 200
+GAP = 8
+PAGE_SIZE = 50
+
+# (weight, width, height) of the source sizes each distribution draws from
+DISTRIBUTIONS = {
+    'camera': [(6, 4000, 3000), (3, 6000, 4000), (1, 3000, 4000)],
+    'phone': [(6, 1080, 1920), (2, 3024, 4032), (2, 1920, 1080)],
+    'panorama': [(5, 12000, 2000), (3, 8000, 2000), (2, 4000, 3000)],
+    'mixed': [(40, 4000, 3000), (20, 3000, 4000), (15, 1920, 1080), (15, 1080, 1920),
+              (5, 6000, 1500), (5, 1000, 1000)],
+}
+
+# Share of degenerate (zero-height) entries in every distribution
+DEGENERATE_RATE = 0.001
+
+def make_images(count, distribution='mixed', seed=42):
+    """Image dicts drawn from a named distribution, with a little size jitter"""
+    rng = random.Random(seed)
+    weights, sizes = zip(*((weight, (width, height)) for weight, width, height in DISTRIBUTIONS[distribution]))
+    images = []
+    for i, (width, height) in enumerate(rng.choices(sizes, weights, k=count)):
+        if rng.random() < DEGENERATE_RATE:
+            width, height = 100, 0
+        else:
+            width += rng.randint(-50, 50)
+        images.append({'filename': f"IMG_{i:06d}.jpg", 'width': width, 'height': height})
+    return images
+
+def layout_arrays(images, ratios):
+    justified_layout(ratios, CONTAINER_WIDTH, ROW_HEIGHT, GAP)
+
+def layout_optimal(images, ratios):
+    justified_layout(ratios, CONTAINER_WIDTH, ROW_HEIGHT, GAP, mode='optimal')
+
+def layout_breakpoints(images, ratios):
+    breakpoint_layouts(ratios, LAYOUT_BREAKPOINTS, ROW_HEIGHT, GAP)
+
+def layout_paged(images, ratios):
+    """Whole listing walked page by page, as the cursor API does"""
+    start = 0
+    while start < len(ratios):
+        size = 2 * PAGE_SIZE
+        while True:
+            chunk = ratios[start:start + size]
+            final = start + len(chunk) >= len(ratios)
+            count = paged_layout(chunk, PAGE_SIZE, final, CONTAINER_WIDTH, ROW_HEIGHT, GAP)[0]
+            if count or final:
+                break
+            size *= 2
+        start += count
+
+# name -> (function, row breaking mode used for the quality score)
+ENGINES = {
+    'arrays': (layout_arrays, 'greedy'),
+    'optimal': (layout_optimal, 'optimal'),
+    'breakpoints': (layout_breakpoints, 'greedy'),
+    'paged': (layout_paged, 'greedy'),
+}
+
+def check_engines_agree(ratios):
+    widths, heights = breakpoint_layouts(ratios, LAYOUT_BREAKPOINTS, ROW_HEIGHT, GAP)
+    for i, width in enumerate(LAYOUT_BREAKPOINTS):
+        _, expected_widths, expected_heights = justified_layout(ratios, width, ROW_HEIGHT, GAP)
+        mismatches = int(np.count_nonzero((widths[i] != expected_widths) | (heights[i] != expected_heights)))
+        assert mismatches == 0, f"{mismatches} layout mismatches at {len(ratios)} images, width {width}"
+
+def layout_quality(ratios, mode):
+    """Row count and row height deviation from ROW_HEIGHT, ignoring the (short) last row"""
+    row_starts, _, heights = justified_layout(ratios, CONTAINER_WIDTH, ROW_HEIGHT, GAP, mode)
+    rows = heights[row_starts[:-1]].astype(np.float64)
+    if not len(rows):
+        return {'rows': len(row_starts), 'row_height_rms': 0.0, 'row_height_variance': 0.0}
+    return {
+        'rows': len(row_starts),
+        'row_height_rms': float(np.sqrt(np.mean((rows - ROW_HEIGHT) ** 2))),
+        'row_height_variance': float(np.var(rows))
+    }
+
+def best_time(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def peak_memory(func):
+    """Peak bytes allocated while func runs (Python and NumPy allocations)"""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def run(sizes, distributions, engines, repeat):
+    results = []
+    for distribution in distributions:
+        for size in sizes:
+            images = make_images(size, distribution)
+            ratios = aspect_ratio_array(images)
+            check_engines_agree(ratios)
+            quality = {mode: layout_quality(ratios, mode) for mode in ('greedy', 'optimal')}
+
+            for engine in engines:
+                func, mode = ENGINES[engine]
+                call = lambda: func(images, ratios)
+                seconds = best_time(call, repeat)
+                results.append({
+                    'distribution': distribution,
+                    'size': size,
+                    'engine': engine,
+                    'seconds': seconds,
+                    'ops_per_sec': 1 / seconds,
+                    'images_per_sec': size / seconds,
+                    'peak_bytes': peak_memory(call),
+                    **quality[mode]
+                })
+    return results
+
+def load_baseline(path):
+    with open(path) as f:
+        return {(r['distribution'], r['size'], r['engine']): r for r in json.load(f)['results']}
+
+def print_table(results, baseline=None):
+    header = (f"{'distribution':>12} {'images':>8} {'engine':>12} {'ms':>10} {'ops/s':>10} "
+              f"{'peak KiB':>10} {'rows':>7} {'rms dev':>8}")
+    if baseline:
+        header += f" {'vs base':>8}"
+    print(header)
+    for r in results:
+        line = (f"{r['distribution']:>12} {r['size']:8d} {r['engine']:>12} {r['seconds'] * 1000:10.2f} "
+                f"{r['ops_per_sec']:10.1f} {r['peak_bytes'] / 1024:10.0f} {r['rows']:7d} {r['row_height_rms']:8.1f}")
+        if baseline:
+            base = baseline.get((r['distribution'], r['size'], r['engine']))
+            line += f" {base['seconds'] / r['seconds']:7.2f}x" if base else f" {'-':>8}"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='1000,10000,100000')
+    parser.add_argument('--distributions', default=','.join(DISTRIBUTIONS))
+    parser.add_argument('--engines', default=','.join(ENGINES))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', help='Write results to this file')
+    parser.add_argument('--compare', help='Earlier JSON results to compare timings against')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    distributions = args.distributions.split(',')
+    engines = args.engines.split(',')
+    for name, values, known in (('distribution', distributions, DISTRIBUTIONS), ('engine', engines, ENGINES)):
+        unknown = [value for value in values if value not in known]
+        if unknown:
+            parser.error(f"unknown {name}: {', '.join(unknown)}")
+
+    results = run(sizes, distributions, engines, args.repeat)
+    print_table(results, load_baseline(args.compare) if args.compare else None)
+
+    if args.json:
+        report = {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'config': {
+                'container_width': CONTAINER_WIDTH,
+                'row_height': ROW_HEIGHT,
+                'gap': GAP,
+                'page_size': PAGE_SIZE,
+                'repeat': args.repeat,
+            },
+            'results': results
+        }
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Folder listing benchmark: keyset (cursor) pagination vs OFFSET page numbers.
+
+Fills a temporary database with one large indexed folder and times the
+page query at increasing depths. With cursors the cost should stay flat.
+Checks first that walking page numbers and cursors, with and without a
+justified layout, returns every file exactly once.
+
+Usage: python benchmarks/bench_listing.py [--files 50000] [--per-page 30] [--repeat 20]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# Add the project root to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+def check_pages_cover_listing(folder_name, filenames, per_page):
+    """Walk numbered pages and the cursor chain of a folder and check each file comes back exactly once"""
+    from app.utils import get_folder_files_cached
+
+    for layout in ('greedy', 'optimal'):
+        seen = []
+        page = 1
+        while True:
+            images, total, _ = get_folder_files_cached('', folder_name, page, per_page, layout=layout)
+            if not images:
+                break
+            seen.extend(image['filename'] for image in images)
+            page += 1
+        pages = (total + per_page - 1) // per_page
+        assert seen == filenames, f"numbered pages ({layout}) returned {len(seen)} files, expected {len(filenames)}"
+        assert page - 1 == pages, f"numbered pages ({layout}): walked {page - 1}, total_pages says {pages}"
+
+        seen = []
+        cursor = None
+        while True:
+            images, _, cursor = get_folder_files_cached('', folder_name, None, per_page, cursor, layout=layout)
+            seen.extend(image['filename'] for image in images)
+            if cursor is None:
+                break
+        assert seen == filenames, f"cursor pages ({layout}) returned {len(seen)} files, expected {len(filenames)}"
+    print(f"✅ Numbered and cursor pages return each of {len(filenames)} files once")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--files', type=int, default=50000)
+    parser.add_argument('--per-page', type=int, default=30)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    db_dir = tempfile.mkdtemp(prefix='gallery_bench_')
+    os.environ['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(db_dir, 'bench.db')}"
+
+    from app import create_app, db
+    from app.models import FileMetadata, FolderSummary
+    from app.utils import get_indexed_folder_files
+
+    app = create_app()
+    with app.app_context():
+        print(f"📝 Inserting {args.files} rows...")
+        now = datetime.utcnow()
+        db.session.bulk_insert_mappings(FileMetadata, [{
+            'folder_path': 'big',
+            'filename': f"IMG_{i:06d}.jpg",
+            'file_type': 'image',
+            'file_size': 1000,
+            'width': 4000 if i % 3 else 3000,
+            'height': 3000 if i % 3 else 4000,
+            'modified_at': now
+        } for i in range(args.files)])
+        db.session.add(FolderSummary(folder_path='big', parent_path='', name='big', media_count=args.files))
+
+        # Small folder with mixed aspect ratios, so justified pages end at uneven row breaks
+        check_files = [f"IMG_{i:04d}.jpg" for i in range(997)]
+        db.session.bulk_insert_mappings(FileMetadata, [{
+            'folder_path': 'check',
+            'filename': filename,
+            'file_type': 'image',
+            'file_size': 1000,
+            'width': (800, 4000, 3000, 6000)[i % 4],
+            'height': (1200, 3000, 4000, 2000)[i % 7 % 4],
+            'modified_at': now
+        } for i, filename in enumerate(check_files)])
+        db.session.add(FolderSummary(folder_path='check', parent_path='', name='check', media_count=len(check_files)))
+        db.session.commit()
+
+        check_pages_cover_listing('check', check_files, args.per_page)
+
+        # Walk the cursor chain once, remembering the cursor for each page
+        cursors = [None]
+        while True:
+            _, _, next_cursor = get_indexed_folder_files('big', args.per_page, cursors[-1])
+            if next_cursor is None:
+                break
+            cursors.append(next_cursor)
+
+        def best_of(func):
+            best = float('inf')
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                func()
+                best = min(best, time.perf_counter() - start)
+            return best * 1000
+
+        print(f"\n{'page':>8} {'cursor ms':>10} {'offset ms':>10}")
+        for page in (1, 10, 100, 300, len(cursors)):
+            if page > len(cursors):
+                continue
+            cursor_ms = best_of(lambda: get_indexed_folder_files('big', args.per_page, cursors[page - 1]))
+            offset_ms = best_of(lambda: get_indexed_folder_files('big', args.per_page, None, page=page))
+            print(f"{page:8d} {cursor_ms:10.2f} {offset_ms:10.2f}")
+
+if __name__ == '__main__':
+    main()
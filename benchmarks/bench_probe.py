@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Image dimension probe benchmark: header-only parser vs PIL Image.open.
+
+Writes one sample file per format, checks that both agree on the size
+(the probe additionally applies EXIF orientation) and reports the time per
+call and speedup for each format.
+
+Usage: python benchmarks/bench_probe.py [--size 6000x4000] [--repeat 2000]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+# Add the project root to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.probe import probe_image_size
+
+def pil_size(path):
+    with Image.open(path) as img:
+        return img.size
+
+def write_samples(root, width, height):
+    """Create one file per format; returns list of (label, path, expected size)"""
+    img = Image.new('RGB', (width, height), (120, 80, 40))
+    samples = []
+
+    def add(label, filename, expected=(width, height), **save_args):
+        path = os.path.join(root, filename)
+        (save_args.pop('image', None) or img).save(path, **save_args)
+        samples.append((label, path, expected))
+
+    exif = Image.Exif()
+    exif[0x0112] = 6  # rotated 90 CW
+    add('jpeg', 'baseline.jpg', quality=85)
+    add('jpeg progressive', 'progressive.jpg', quality=85, progressive=True)
+    add('jpeg exif rot90', 'rotated.jpg', expected=(height, width), quality=85, exif=exif.tobytes())
+    add('png', 'image.png', compress_level=1)
+    add('gif', 'image.gif', image=img.convert('P'))
+    add('webp lossy', 'lossy.webp', quality=80)
+    add('webp lossless', 'lossless.webp', lossless=True, method=0)
+    add('webp alpha (VP8X)', 'alpha.webp', image=img.convert('RGBA'), quality=80)
+    add('bmp', 'image.bmp')
+
+    try:
+        import pillow_heif
+        pillow_heif.register_heif_opener()
+        add('heic', 'image.heic', quality=50)
+    except ImportError:
+        print("⏭️  pillow-heif not installed, skipping HEIC")
+
+    return samples
+
+def best_time(func, path, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(path)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', default='6000x4000', help='sample image size WxH')
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+    width, height = (int(v) for v in args.size.split('x'))
+
+    root = tempfile.mkdtemp(prefix='gallery_bench_')
+    try:
+        samples = write_samples(root, width, height)
+        print(f"\n{'format':20} {'probe':>12} {'PIL':>12} {'probe us':>9} {'PIL us':>9} {'speedup':>8}")
+        for label, path, expected in samples:
+            probed = probe_image_size(path)
+            pil = pil_size(path)
+            assert probed == expected, f"{label}: probe returned {probed}, expected {expected}"
+            probe_us = best_time(probe_image_size, path, args.repeat)
+            pil_us = best_time(pil_size, path, args.repeat)
+            print(f"{label:20} {str(probed):>12} {str(pil):>12} {probe_us:9.1f} {pil_us:9.1f} "
+                  f"{pil_us / probe_us:7.1f}x")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Thumbnail decode benchmark: full decode vs draft/reduce fast decode.
+
+Writes one large sample per format and builds the thumbnail ladder from it
+two ways: "full" decodes every pixel before resampling (the old pipeline),
+"fast" uses utils.open_for_thumbnail (embedded camera previews, JPEG draft
+mode, box reduce for other formats). Every case runs in a fresh process so
+its peak RSS can be measured. Only JPEGs decode at reduced scale: other
+formats are decoded whole either way, so their peak RSS does not drop.
+
+Usage: python benchmarks/bench_thumbnails.py [--size 6000x4000] [--repeat 5]
+"""
+
+import argparse
+import io
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+# Add the project root to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app.utils import THUMBNAIL_SIZES, open_for_thumbnail
+
+def decode_full(path, size):
+    """The pre-draft pipeline: decode everything, then resample"""
+    with Image.open(path) as source:
+        img = source.convert('RGB') if source.mode not in ('RGB', 'L') else source
+        img.load()
+    img.thumbnail((size, size), reducing_gap=None)
+    return img
+
+DECODERS = {
+    'full': decode_full,
+    'fast': open_for_thumbnail,
+}
+
+def write_samples(root, width, height):
+    """Create one noisy photo-like file per format; returns list of (label, path)"""
+    rng = np.random.default_rng(42)
+    gradient = np.linspace(0, 180, width, dtype=np.float32)[None, :, None]
+    pixels = (rng.random((height, width, 3), dtype=np.float32) * 60 + gradient).astype(np.uint8)
+    img = Image.fromarray(pixels)
+    # Camera JPEGs carry a 1920px Multi-Picture preview after the main image
+    preview = img.resize((1920, round(1920 * height / width)))
+    samples = []
+    for label, filename, save_args in (('jpeg', 'photo.jpg', {'quality': 90}),
+                                       ('camera', 'camera.jpg', {'format': 'MPO', 'quality': 90, 'save_all': True,
+                                                                 'append_images': [preview]}),
+                                       ('png', 'photo.png', {'compress_level': 1}),
+                                       ('bmp', 'photo.bmp', {}),
+                                       ('webp', 'photo.webp', {'quality': 80, 'method': 0})):
+        path = os.path.join(root, filename)
+        img.save(path, **save_args)
+        samples.append((label, path))
+    return samples
+
+def build_ladder(decoder, path):
+    """Decode once and encode every ladder size, like generate_thumbnail"""
+    img = DECODERS[decoder](path, THUMBNAIL_SIZES[-1])
+    for size in sorted(THUMBNAIL_SIZES, reverse=True):
+        img.thumbnail((size, size))
+        img.save(io.BytesIO(), 'JPEG', quality=85)
+
+def run_case(decoder, path, repeat):
+    """Runs in a fresh process; returns (seconds per ladder, peak RSS growth in KiB)"""
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        build_ladder(decoder, path)
+        best = min(best, time.perf_counter() - start)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # ru_maxrss is in bytes on macOS, KiB on Linux
+        baseline, peak = baseline / 1024, peak / 1024
+    return best, peak - baseline
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', default='6000x4000', help='sample image size WxH')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    width, height = (int(v) for v in args.size.split('x'))
+
+    root = tempfile.mkdtemp(prefix='gallery_bench_')
+    context = multiprocessing.get_context('spawn')
+    try:
+        # Linux carries the parent's peak RSS into spawned children, so keep the parent small
+        with context.Pool(1) as pool:
+            samples = pool.apply(write_samples, (root, width, height))
+        print(f"\n{'format':8} {'decoder':8} {'ms':>9} {'thumbs/s':>9} {'peak MiB':>9} {'speedup':>8}")
+        for label, path in samples:
+            results = {}
+            for decoder in DECODERS:
+                with context.Pool(1) as pool:
+                    results[decoder] = pool.apply(run_case, (decoder, path, args.repeat))
+            for decoder, (seconds, peak_kib) in results.items():
+                speedup = results['full'][0] / seconds
+                print(f"{label:8} {decoder:8} {seconds * 1000:9.1f} {1 / seconds:9.2f} "
+                      f"{peak_kib / 1024:9.1f} {speedup:7.1f}x")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -16,7 +16,7 @@ from app.models import db, ImageMetadata, FileMetadata
 
 def migrate_metadata():
     """Migrate data from ImageMetadata to FileMetadata"""
-    app = create_app()
+    app = create_app(background_services=False)
 
     with app.app_context():
         print("🔄 Starting database migration...")
@@ -91,13 +91,15 @@ fi
 
 # Start with Gunicorn
 echo "🌐 Starting server on http://0.0.0.0:8000"
-echo "   Workers: 4"
+# Gunicorn reads WEB_CONCURRENCY; thumbnail processes split the CPUs between the workers
+export WEB_CONCURRENCY=${WEB_CONCURRENCY:-4}
+echo "   Workers: $WEB_CONCURRENCY"
 echo "   Press Ctrl+C to stop"
 echo ""
 
 gunicorn \
     --bind 0.0.0.0:8000 \
-    --workers 4 \
+    --workers "$WEB_CONCURRENCY" \
     --worker-class gthread \
     --threads 2 \
     --timeout 120 \
@@ -145,7 +147,7 @@ sys.path.insert(0, '.')
 from app import create_app
 from app.utils import scan_folder_background
 
-app = create_app()
+app = create_app(background_services=False)
 
 with app.app_context():
     # Scan all folders
@@ -7,7 +7,8 @@ import sys
 from app import create_app
 
 if __name__ == '__main__':
-    app = create_app()
+    # The reloader's parent only watches files; the serving child runs the background services
+    app = create_app(background_services=os.environ.get('WERKZEUG_RUN_MAIN') == 'true')
     
     # Configuration
     debug = os.getenv('FLASK_ENV') == 'development'
@@ -37,7 +37,7 @@ echo "  2. Run: python run.py"
 echo ""
 echo "To start in production (recommended for large folders):"
 echo "  1. Activate the virtual environment: source venv/bin/activate"
-echo "  2. Run: gunicorn --bind 0.0.0.0:8000 --workers 4 wsgi:app"
+echo "  2. Run: WEB_CONCURRENCY=4 gunicorn --bind 0.0.0.0:8000 wsgi:app"
 echo ""
 echo "For optimal performance with 10,000+ files:"
 echo "  - Install Redis: brew install redis (on macOS)"
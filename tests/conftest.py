@@ -0,0 +1,47 @@
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+import pytest
+
+# Add the project root to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# The shared thumbnail store reads its root at import; keep it out of the working tree
+os.environ.setdefault('THUMBNAIL_CACHE_DIR', tempfile.mkdtemp(prefix='gallery_test_thumbnails_'))
+
+from app import create_app, db
+from app.layout_cache import layout_cache
+from app.models import FileMetadata, FolderSummary
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """App on an empty temporary database, without background services, inside an app context"""
+    monkeypatch.setenv('SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'gallery.db'}")
+    app = create_app(background_services=False)
+    # Layouts are cached per folder version, which restarts at 1 in every database
+    layout_cache.clear()
+    with app.app_context():
+        yield app
+        db.session.remove()
+
+@pytest.fixture
+def indexed_folder(app):
+    """Index rows for one folder with mixed aspect ratios, as the scanner writes them"""
+    def create(folder_name, count):
+        filenames = [f"IMG_{i:04d}.jpg" for i in range(count)]
+        now = datetime.utcnow()
+        db.session.bulk_insert_mappings(FileMetadata, [{
+            'folder_path': folder_name,
+            'filename': filename,
+            'file_type': 'image',
+            'file_size': 1000,
+            'width': (800, 4000, 3000, 6000)[i % 4],
+            'height': (1200, 3000, 4000, 2000)[i % 7 % 4],
+            'modified_at': now
+        } for i, filename in enumerate(filenames)])
+        db.session.add(FolderSummary(folder_path=folder_name, parent_path='', name=folder_name, media_count=count))
+        db.session.commit()
+        return filenames
+    return create
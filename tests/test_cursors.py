@@ -0,0 +1,70 @@
+import pytest
+
+from app.utils import decode_cursor, encode_cursor, get_folder_files_cached, get_indexed_folder_files
+
+@pytest.mark.parametrize('state', [
+    {},
+    {'o': 30, 't': 997},
+    {'i': 12345, 'v': 'IMG_0042.jpg', 't': 997, 'o': 0},
+    {'i': 7, 'v': '2024-05-01T12:30:00', 't': 3},
+    {'i': 1, 'v': 'ünïcødé/文件 name?&=.jpg', 't': 1},
+])
+def test_cursor_round_trip(state):
+    cursor = encode_cursor(state)
+    assert '=' not in cursor and '/' not in cursor and '+' not in cursor
+    assert decode_cursor(cursor) == state
+
+@pytest.mark.parametrize('cursor', [
+    'not a cursor!',
+    encode_cursor([1, 2, 3]),
+    encode_cursor('text'),
+    encode_cursor({'o': 'ten'}),
+    encode_cursor({'i': 1})[:-4],
+])
+def test_invalid_cursor_raises(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+def walk_cursors(folder_name, per_page, layout=None, sort='name'):
+    """Follow the cursor chain through encode/decode as the API does"""
+    seen = []
+    cursor = None
+    while True:
+        images, total, state = get_indexed_folder_files(folder_name, per_page, cursor, sort, layout=layout)
+        seen.extend(image['filename'] for image in images)
+        if state is None:
+            return seen, total
+        cursor = decode_cursor(encode_cursor(state))
+
+@pytest.mark.parametrize('layout', [None, 'greedy', 'optimal'])
+def test_keyset_walk_returns_every_file_once(indexed_folder, layout):
+    filenames = indexed_folder('walk', 997)
+    seen, total = walk_cursors('walk', 30, layout)
+    assert total == len(filenames)
+    assert seen == filenames
+
+def test_keyset_walk_sorted_by_modified(indexed_folder):
+    filenames = indexed_folder('modified', 95)
+    seen, _ = walk_cursors('modified', 10, sort='modified')
+    # Equal mtimes fall back to insertion (id) order
+    assert seen == filenames
+
+def test_cursor_pages_hold_whole_rows(indexed_folder):
+    indexed_folder('rows', 300)
+    images, _, _ = get_indexed_folder_files('rows', 30, None, layout='greedy')
+    assert len(images) >= 30
+    # The page ends where a justified row ends: every row fills the container
+    last_row = [image for image in images if image['row'] == images[-1]['row']]
+    assert sum(image['calc_width'] for image in last_row) + 8 * (len(last_row) - 1) == 1200
+
+def test_numbered_pages_tile_listing(indexed_folder):
+    filenames = indexed_folder('numbered', 101)
+    seen = []
+    for page in range(1, 12):
+        images, total, _ = get_folder_files_cached('', 'numbered', page, 10)
+        assert len(images) == min(10, total - (page - 1) * 10)
+        seen.extend(image['filename'] for image in images)
+    assert seen == filenames
+
+def test_unindexed_folder_has_no_keyset_listing(app):
+    assert get_indexed_folder_files('missing', 30) is None
@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+
+from app.layout import (LAYOUT_BREAKPOINTS, breakpoint_layouts, greedy_row_starts, justified_layout,
+                        optimal_row_starts, paged_layout)
+
+ROW_HEIGHT = 200
+GAP = 8
+
+def make_ratios(count, seed=0):
+    """Aspect ratios from portrait to panorama, with a few zero-height (NaN) entries"""
+    rng = np.random.default_rng(seed)
+    ratios = rng.choice([0.56, 0.75, 1.0, 1.33, 1.5, 1.78, 4.0], size=count) * rng.uniform(0.95, 1.05, count)
+    ratios[rng.random(count) < 0.01] = np.nan
+    return ratios
+
+def reference_row_starts(ratios, container_width, row_height=ROW_HEIGHT, gap=GAP):
+    """The greedy rule, one image at a time: close the row before the image that would overflow it"""
+    row_starts = []
+    row_width = 0
+    row_length = 0
+    for i, ratio in enumerate(ratios):
+        width = int(row_height * (1.0 if np.isnan(ratio) else ratio))
+        if row_length and row_width + width + row_length * gap > container_width:
+            row_width = row_length = 0
+        if not row_length:
+            row_starts.append(i)
+        row_width += width
+        row_length += 1
+    return row_starts
+
+@pytest.mark.parametrize('container_width', [360, 1200, 1920])
+def test_greedy_rows_match_reference(container_width):
+    ratios = make_ratios(2000)
+    assert greedy_row_starts(ratios, container_width, ROW_HEIGHT, GAP).tolist() == \
+        reference_row_starts(ratios, container_width)
+
+def test_rows_fill_the_container():
+    ratios = make_ratios(500)
+    row_starts, widths, heights = justified_layout(ratios, 1200, ROW_HEIGHT, GAP)
+    row_ends = np.append(row_starts[1:], len(ratios))
+    for start, end in zip(row_starts[:-1], row_ends[:-1]):
+        if end - start > 1:
+            assert widths[start:end].sum() + (end - start - 1) * GAP == 1200
+        assert len(set(heights[start:end].tolist())) == 1
+
+@pytest.mark.parametrize('per_page', [1, 7, 30, 100])
+@pytest.mark.parametrize('mode', ['greedy', 'optimal'])
+def test_paged_layout_covers_listing(per_page, mode):
+    ratios = make_ratios(1000, seed=per_page)
+    expected_starts, expected_widths, expected_heights = justified_layout(ratios, 1200, ROW_HEIGHT, GAP, mode)
+
+    start = 0
+    row_starts, widths, heights = [], [], []
+    while start < len(ratios):
+        chunk = ratios[start:start + 2 * per_page + 50]
+        final = start + len(chunk) >= len(ratios)
+        count, page_rows, page_widths, page_heights = paged_layout(chunk, per_page, final, 1200, ROW_HEIGHT, GAP, mode)
+        assert count >= min(per_page, len(chunk)) or final
+        assert page_rows[0] == 0
+        row_starts.extend((page_rows + start).tolist())
+        widths.extend(page_widths.tolist())
+        heights.extend(page_heights.tolist())
+        start += count
+
+    assert start == len(ratios)
+    if mode == 'greedy':
+        # Pages start at row starts, so greedy pages reproduce the whole-listing layout
+        assert row_starts == expected_starts.tolist()
+        assert widths == expected_widths.tolist()
+        assert heights == expected_heights.tolist()
+
+def test_paged_layout_needs_a_complete_row():
+    # A single panorama can't be closed until the chunk shows what follows it
+    count, row_starts, _, _ = paged_layout(np.array([1.0]), 30, final=False)
+    assert count == 0 and len(row_starts) == 0
+    count, row_starts, _, _ = paged_layout(np.array([1.0]), 30, final=True)
+    assert count == 1 and row_starts.tolist() == [0]
+
+@pytest.mark.parametrize('mode', ['greedy', 'optimal'])
+def test_breakpoint_layouts_match_single_widths(mode):
+    ratios = make_ratios(1500)
+    widths, heights = breakpoint_layouts(ratios, LAYOUT_BREAKPOINTS, ROW_HEIGHT, GAP, mode)
+    assert widths.shape == heights.shape == (len(LAYOUT_BREAKPOINTS), len(ratios))
+    for i, container_width in enumerate(LAYOUT_BREAKPOINTS):
+        _, expected_widths, expected_heights = justified_layout(ratios, container_width, ROW_HEIGHT, GAP, mode)
+        assert widths[i].tolist() == expected_widths.tolist()
+        assert heights[i].tolist() == expected_heights.tolist()
+
+def test_breakpoint_layouts_empty():
+    widths, heights = breakpoint_layouts(np.zeros(0))
+    assert widths.shape == heights.shape == (len(LAYOUT_BREAKPOINTS), 0)
+
+def test_optimal_rows_are_less_ragged_than_greedy():
+    ratios = make_ratios(3000)
+
+    def squared_deviation(mode):
+        row_starts, _, heights = justified_layout(ratios, 1200, ROW_HEIGHT, GAP, mode)
+        rows = heights[row_starts[:-1]].astype(np.float64)
+        return float(((rows - ROW_HEIGHT) ** 2).sum())
+
+    assert squared_deviation('optimal') <= squared_deviation('greedy')
+
+def test_optimal_rows_cover_every_image():
+    ratios = make_ratios(20000)
+    row_starts = optimal_row_starts(ratios, 1200, ROW_HEIGHT, GAP)
+    assert row_starts[0] == 0
+    assert np.all(np.diff(row_starts) > 0)
+    assert row_starts[-1] < len(ratios)
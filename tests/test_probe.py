@@ -0,0 +1,63 @@
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+from app.probe import probe_image_size, probe_video
+
+def save_image(path, size=(640, 480), **params):
+    mode = 'RGBA' if params.pop('alpha', False) else 'RGB'
+    Image.new(mode, size, (200, 100, 50)).save(path, **params)
+    return path
+
+@pytest.mark.parametrize('name, params', [
+    ('photo.jpg', {}),
+    ('progressive.jpg', {'progressive': True}),
+    ('image.png', {}),
+    ('image.gif', {}),
+    ('lossy.webp', {'quality': 80}),
+    ('lossless.webp', {'lossless': True}),
+    ('alpha.webp', {'alpha': True}),
+    ('image.bmp', {}),
+])
+def test_probe_matches_pil(tmp_path, name, params):
+    path = save_image(tmp_path / name, (641, 479), **params)
+    with Image.open(path) as image:
+        assert probe_image_size(path) == image.size == (641, 479)
+
+@pytest.mark.parametrize('orientation, expected', [(1, (640, 480)), (3, (640, 480)), (6, (480, 640)), (8, (480, 640))])
+def test_probe_applies_exif_orientation(tmp_path, orientation, expected):
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    path = save_image(tmp_path / 'rotated.jpg', exif=exif.tobytes())
+    assert probe_image_size(path) == expected
+
+def test_probe_rejects_unknown_and_broken_files(tmp_path):
+    text = tmp_path / 'notes.jpg'
+    text.write_bytes(b'just some text')
+    assert probe_image_size(text) is None
+
+    # A JPEG cut off before its frame header
+    photo = save_image(tmp_path / 'photo.jpg')
+    truncated = tmp_path / 'truncated.jpg'
+    truncated.write_bytes(photo.read_bytes()[:20])
+    assert probe_image_size(truncated) is None
+
+    assert probe_image_size(tmp_path / 'missing.png') is None
+
+def test_probe_video_reads_mp4_header(tmp_path):
+    path = str(tmp_path / 'clip.mp4')
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), 10, (160, 96))
+    for i in range(25):
+        writer.write(np.full((96, 160, 3), i * 10, np.uint8))
+    writer.release()
+
+    info = probe_video(path)
+    assert (info['width'], info['height']) == (160, 96)
+    assert info['fps'] == pytest.approx(10, rel=0.01)
+    assert info['duration'] == pytest.approx(2.5, rel=0.05)
+    assert info['rotation'] == 0
+
+def test_probe_video_rejects_non_video(tmp_path):
+    path = save_image(tmp_path / 'still.png')
+    assert probe_video(str(path)) is None
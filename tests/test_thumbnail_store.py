@@ -0,0 +1,138 @@
+import os
+import threading
+import time
+
+import pytest
+
+from app.thumbnail_store import GC_UNINDEXED_GRACE, ThumbnailStore
+
+@pytest.fixture
+def store(tmp_path):
+    return ThumbnailStore(str(tmp_path / 'store'), max_bytes=10 ** 9)
+
+@pytest.fixture
+def dataset(tmp_path):
+    root = tmp_path / 'dataset'
+    (root / 'album').mkdir(parents=True)
+    return root
+
+def write(store, name, data=b'x' * 100, source=None, mtime_ns=None):
+    """Write a derivative into the store the way the thumbnail generator does"""
+    path = store.path(store.key(name, 0, 0, 'test'), 'jpg')
+    with store.atomic_write(path) as temp_path:
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+    store.add(path, source, mtime_ns)
+    return path
+
+def test_collect_garbage_removes_stale_derivatives(store, dataset):
+    kept = dataset / 'album' / 'kept.jpg'
+    changed = dataset / 'album' / 'changed.jpg'
+    for path in (kept, changed):
+        path.write_bytes(b'source')
+    kept_mtime = kept.stat().st_mtime_ns
+
+    current = write(store, 'current', source='album/kept.jpg', mtime_ns=kept_mtime)
+    any_version = write(store, 'sheet', source='album', mtime_ns=None)
+    outdated = write(store, 'outdated', source='album/changed.jpg', mtime_ns=changed.stat().st_mtime_ns - 1)
+    deleted = write(store, 'deleted', source='album/deleted.jpg', mtime_ns=1)
+
+    report = store.collect_garbage(str(dataset), chunk_size=2, ops_per_sec=0)
+
+    assert os.path.exists(current) and os.path.exists(any_version)
+    assert not os.path.exists(outdated) and not os.path.exists(deleted)
+    assert report['scanned'] == 4
+    assert report['removed'] == 2
+    assert report['bytes_reclaimed'] == 200
+    assert store.stats()['files'] == 2
+    assert store.total_bytes() == 200
+    assert store.last_gc is report
+
+def test_collect_garbage_removes_old_unindexed_files(store, dataset):
+    indexed = write(store, 'indexed')
+    orphan = store.path(store.key('orphan', 0, 0, 'test'), 'jpg')
+    in_progress = store.path(store.key('in-progress', 0, 0, 'test'), 'jpg')
+    for path in (orphan, in_progress):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'y' * 50)
+    old = time.time() - GC_UNINDEXED_GRACE - 60
+    os.utime(orphan, (old, old))
+
+    report = store.collect_garbage(str(dataset), ops_per_sec=0)
+
+    assert os.path.exists(indexed) and os.path.exists(in_progress)
+    assert not os.path.exists(orphan)
+    assert report['removed'] == 1
+
+def test_collect_garbage_legacy_thumbnails(store, dataset):
+    legacy = dataset / 'album' / '.thumbnails'
+    legacy.mkdir()
+    (legacy / 'photo_400.jpg').write_bytes(b'z' * 30)
+    (dataset / 'album' / 'photo.jpg').write_bytes(b'source')
+
+    store.collect_garbage(str(dataset), ops_per_sec=0)
+    assert legacy.exists()
+
+    report = store.collect_garbage(str(dataset), ops_per_sec=0, legacy=True)
+    assert not legacy.exists()
+    assert (dataset / 'album' / 'photo.jpg').exists()
+    assert report['removed'] == 1 and report['bytes_reclaimed'] == 30
+
+def test_eviction_drops_least_recently_used(tmp_path, monkeypatch):
+    monkeypatch.setattr('app.thumbnail_store.TOUCH_INTERVAL', 0)
+    store = ThumbnailStore(str(tmp_path / 'store'), max_bytes=350)
+    first = write(store, 'first')
+    second = write(store, 'second')
+    third = write(store, 'third')
+    time.sleep(0.01)
+    store.touch(first)
+
+    # Over budget: evicts down to 90% of it, oldest access first and no further
+    fourth = write(store, 'fourth')
+    assert not os.path.exists(second)
+    assert all(os.path.exists(path) for path in (first, third, fourth))
+    assert store.total_bytes() == 300
+
+def test_remove_source(store):
+    paths = [write(store, f"size-{size}", source='album/photo.jpg', mtime_ns=1) for size in (200, 400)]
+    other = write(store, 'other', source='album/other.jpg', mtime_ns=1)
+    assert store.remove_source('album/photo.jpg') == 200
+    assert not any(os.path.exists(path) for path in paths)
+    assert os.path.exists(other)
+
+def test_atomic_write_leaves_nothing_on_failure(store):
+    path = store.path('ab' * 20, 'jpg')
+    with pytest.raises(RuntimeError):
+        with store.atomic_write(path) as temp_path:
+            with open(temp_path, 'wb') as f:
+                f.write(b'partial')
+            raise RuntimeError('encoder failed')
+    assert os.listdir(os.path.dirname(path)) == []
+
+def test_single_flight_runs_one_builder(store):
+    key = store.key('photo.jpg', 400, 1, 'jpeg')
+    builds = []
+    inside = threading.Event()
+    release = threading.Event()
+
+    def build():
+        with store.single_flight(key):
+            if not builds:
+                builds.append(threading.get_ident())
+                inside.set()
+                release.wait(5)
+
+    first = threading.Thread(target=build)
+    first.start()
+    assert inside.wait(5)
+    waiters = [threading.Thread(target=build) for _ in range(3)]
+    for thread in waiters:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in [first, *waiters]:
+        thread.join(5)
+
+    assert len(builds) == 1
+    assert store.coalesced == 3
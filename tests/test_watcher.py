@@ -0,0 +1,93 @@
+import os
+
+import pytest
+from PIL import Image
+
+from app.models import FileMetadata
+from app.watcher import IN_Q_OVERFLOW, DatasetWatcher, Inotify, _Batch
+
+class RecordingThumbnails:
+    """Stands in for the thumbnail service, recording what the watcher queues"""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, filepath, priority=None):
+        self.submitted.append(filepath)
+
+@pytest.fixture
+def dataset(tmp_path):
+    root = tmp_path / 'dataset'
+    (root / 'album').mkdir(parents=True)
+    return root
+
+@pytest.fixture
+def watcher(app, dataset, monkeypatch):
+    thumbnails = RecordingThumbnails()
+    monkeypatch.setattr('app.watcher.start_thumbnail_service', lambda app, dataset_path: thumbnails)
+    watcher = DatasetWatcher(app, str(dataset))
+    yield watcher
+    watcher._close_inotify()
+
+def collect(watcher):
+    """Drain pending inotify events into a batch"""
+    batch = _Batch()
+    while True:
+        events = watcher._inotify.read_events(0.2)
+        if not events:
+            return batch
+        for wd, mask, _, name in events:
+            watcher._collect(batch, wd, mask, name)
+
+def save_photo(path, size=(64, 48)):
+    Image.new('RGB', size, (10, 20, 30)).save(path)
+
+def test_inotify_events_fill_batch(watcher, dataset):
+    watcher._inotify = Inotify()
+    watcher._watch_tree('')
+
+    save_photo(dataset / 'album' / 'new.jpg')
+    (dataset / 'album' / 'notes.txt').write_text('not media')
+    (dataset / 'album' / '.hidden.jpg').write_bytes(b'')
+    (dataset / 'trip').mkdir()
+    batch = collect(watcher)
+    assert batch.files == {('album', 'new.jpg')}
+    assert batch.new_dirs == {'trip'}
+    assert 'trip' in watcher._watches.values()
+
+    # The new folder is watched, so files written into it show up too
+    save_photo(dataset / 'trip' / 'beach.jpg')
+    os.rename(dataset / 'album' / 'new.jpg', dataset / 'album' / 'renamed.jpg')
+    batch = collect(watcher)
+    assert batch.files == {('trip', 'beach.jpg'), ('album', 'new.jpg'), ('album', 'renamed.jpg')}
+
+    os.remove(dataset / 'trip' / 'beach.jpg')
+    os.rmdir(dataset / 'trip')
+    batch = collect(watcher)
+    assert batch.removed_dirs == {'trip'}
+    assert 'trip' not in watcher._watches.values()
+
+def test_queue_overflow_reconciles_every_folder(watcher, dataset):
+    watcher._watches = {1: '', 2: 'album'}
+    batch = _Batch()
+    watcher._collect(batch, -1, IN_Q_OVERFLOW, '')
+    assert batch.dirty_folders == {'', 'album'}
+
+def test_apply_indexes_and_removes_files(watcher, dataset):
+    photo = dataset / 'album' / 'photo.jpg'
+    save_photo(photo, (300, 200))
+    batch = _Batch()
+    batch.files.add(('album', 'photo.jpg'))
+    watcher._apply(batch)
+
+    row = FileMetadata.query.filter_by(folder_path='album', filename='photo.jpg').one()
+    assert (row.width, row.height) == (300, 200)
+    assert watcher.thumbnails.submitted == [str(photo)]
+
+    # Applying the same unchanged file again needs no new thumbnail
+    watcher._apply(batch)
+    assert watcher.thumbnails.submitted == [str(photo)]
+
+    photo.unlink()
+    watcher._apply(batch)
+    assert FileMetadata.query.filter_by(folder_path='album', filename='photo.jpg').first() is None